@@ -3,7 +3,7 @@ import {
   RTVIClientOptions,
   RTVIEvent,
 } from "@pipecat-ai/client-js";
-import { WebSocketTransport } from "@pipecat-ai/websocket-transport";
+import { isOpusSupported, OpusWebSocketTransport } from "./opusSerializer";
 
 type LogLevel = "info" | "warning" | "error";
 
@@ -52,6 +52,12 @@ class WebsocketClientApp {
   private lastLLMLatency: number | null = null;
   private lastTTSLatency: number | null = null;
 
+  // Hand-off when the server instance drains
+  private resumeHandle: string | null = null;
+  private resumeSession: string | null = null;
+  private resumeSecret: string | null = null;
+  private handingOff = false;
+
   // Voice Data
   private readonly GEMINI_VOICES = [
     { value: "Puck", label: "Puck (Male)" },
@@ -501,6 +507,12 @@ class WebsocketClientApp {
   }
 
   private handleServerMessage(message: any) {
+      // The instance is shutting down: reconnect elsewhere, resuming the Live session if possible
+      if (message.type === "drain") {
+          this.handOff(message.resume_handle || null, message.session_id || null, message.resume_secret || null);
+          return;
+      }
+
       // Handle Transcription
       if (message.type === "transcription") {
           const { participant, text, ttft } = message;
@@ -537,6 +549,12 @@ class WebsocketClientApp {
                   // Optionally log tool details to chat or debug
                   this.log(`Tool Call: ${JSON.stringify(payload.tool)}`, "info");
                   break;
+              case "tool_latency":
+                  this.log(
+                      `Tool ${payload.tool} ${payload.status} in ${Math.round(payload.value * 1000)}ms`,
+                      payload.status === "ok" ? "info" : "warning"
+                  );
+                  break;
               case "usage":
                   if (payload.usage && payload.usage.total_token_count) {
                       // Is this cumulative or per turn? Usually per turn.
@@ -647,6 +665,26 @@ class WebsocketClientApp {
     }
   }
 
+  private async handOff(resumeHandle: string | null, sessionId: string | null = null, resumeSecret: string | null = null): Promise<void> {
+    if (this.handingOff) return;
+    this.handingOff = true;
+    this.log(`Server is draining, reconnecting${resumeHandle ? " with resumption handle" : ""}`, "warning");
+    const wasListening = !!this.rtviClient?.tracks().local?.audio?.enabled;
+    this.resumeHandle = resumeHandle;
+    this.resumeSession = sessionId;
+    this.resumeSecret = resumeSecret;
+    try {
+      await this.disconnect();
+      await this.connect();
+      if (wasListening) this.startListening();
+    } finally {
+      this.resumeHandle = null;
+      this.resumeSession = null;
+      this.resumeSecret = null;
+      this.handingOff = false;
+    }
+  }
+
   private toggleConnection(): void {
     if (this.rtviClient) {
       this.disconnect();
@@ -724,11 +762,16 @@ class WebsocketClientApp {
       this.audioContext = new AudioContext();
       this.audioContext.resume();
       this.updateStatus("Connecting");
-      this.resetMetrics(); // Reset metrics on connect
+      if (!this.handingOff) this.resetMetrics(); // Reset metrics on connect, but not across a hand-off
 
-      const transport = new WebSocketTransport();
+      const transport = new OpusWebSocketTransport();
 
       let connectUrl = `/connect?bot_type=${this.activeTab}`;
+      // The session registry has its params and latest resumption handle, whichever instance we land on
+      if (this.resumeSession && this.resumeSecret) {
+        connectUrl += `&resume_session=${encodeURIComponent(this.resumeSession)}`;
+        connectUrl += `&resume_secret=${encodeURIComponent(this.resumeSecret)}`;
+      }
       let systemInstructions = "";
 
       if (this.activeTab === "tts-llm-stt") {
@@ -763,6 +806,11 @@ class WebsocketClientApp {
         const checkedLanguages = Array.from(sttLanguageContainer?.querySelectorAll('input[type="checkbox"]:checked') || [])
             .map((cb: any) => cb.value);
         connectUrl += `&stt_language=${checkedLanguages.join(',')}`;
+        // Mixed-language callers: stream to one recognizer per language and keep the best result
+        const raceLanguagesToggle = document.getElementById("race-languages-toggle") as HTMLInputElement;
+        if (raceLanguagesToggle?.checked && checkedLanguages.length > 1) {
+          connectUrl += `&stt_race=${encodeURIComponent(checkedLanguages.join(';'))}`;
+        }
         systemInstructions = systemInstructionsTextarea.value;
       } else {
         const geminiModelSelect = document.getElementById(
@@ -789,9 +837,17 @@ class WebsocketClientApp {
         connectUrl += `&language=${geminiLanguageSelect.value}`;
         connectUrl += `&tts=${ttsToggle.checked}`;
         connectUrl += `&tts_pace=${livePaceSlider.value}`;
+        if (this.resumeHandle) {
+          connectUrl += `&resume_handle=${encodeURIComponent(this.resumeHandle)}`;
+        }
         systemInstructions = geminiSystemInstructionsTextarea.value;
       }
 
+      // Offer Opus when WebCodecs can handle it; the server answers with the codec it picked
+      if (await isOpusSupported()) {
+        connectUrl += `&audio_codec=opus`;
+      }
+
       if (systemInstructions) {
         connectUrl += `&system_instruction=${encodeURIComponent(
           systemInstructions
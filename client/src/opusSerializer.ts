@@ -0,0 +1,401 @@
+import protobuf from "protobufjs";
+import { RTVIMessage } from "@pipecat-ai/client-js";
+import {
+  ProtobufFrameSerializer,
+  WebSocketTransport,
+} from "@pipecat-ai/websocket-transport";
+
+// Audio frames carrying Opus are tagged with this name in the protobuf AudioRawFrame
+// (must match OPUS_FRAME_NAME in server/audio_codec.py).
+const OPUS_FRAME_NAME = "opus";
+const OPUS_FRAME_US = 20000;
+const OPUS_BITRATE = 24000;
+const RECORDER_SAMPLE_RATE = 16000;
+const PLAYER_SAMPLE_RATE = 24000;
+// Client message reporting that bot audio started playing after silence
+// (must match PLAYBACK_START_MESSAGE in server/audio_codec.py).
+const PLAYBACK_START_MESSAGE = "playback_start";
+// Output pacing: the server probes RTT and flushes the player on barge-in; the client answers
+// probes and reports its playback position (must match server/output_pacing.py)
+const PACE_PING_MESSAGE = "pace_ping";
+const PACE_FLUSH_MESSAGE = "pace_flush";
+const PACE_PONG_MESSAGE = "pace_pong";
+const PLAYBACK_REPORT_MESSAGE = "playback";
+const PLAYBACK_REPORT_MS = 100;
+
+const root = protobuf.Root.fromJSON({
+  nested: {
+    pipecat: {
+      nested: {
+        TextFrame: {
+          fields: {
+            id: { type: "uint64", id: 1 },
+            name: { type: "string", id: 2 },
+            text: { type: "string", id: 3 },
+          },
+        },
+        AudioRawFrame: {
+          fields: {
+            id: { type: "uint64", id: 1 },
+            name: { type: "string", id: 2 },
+            audio: { type: "bytes", id: 3 },
+            sampleRate: { type: "uint32", id: 4 },
+            numChannels: { type: "uint32", id: 5 },
+            pts: { type: "uint64", id: 6, options: { proto3_optional: true } },
+          },
+        },
+        TranscriptionFrame: {
+          fields: {
+            id: { type: "uint64", id: 1 },
+            name: { type: "string", id: 2 },
+            text: { type: "string", id: 3 },
+            userId: { type: "string", id: 4 },
+            timestamp: { type: "string", id: 5 },
+          },
+        },
+        MessageFrame: {
+          fields: {
+            data: { type: "string", id: 1 },
+          },
+        },
+        Frame: {
+          oneofs: {
+            frame: { oneof: ["text", "audio", "transcription", "message"] },
+          },
+          fields: {
+            text: { type: "TextFrame", id: 1 },
+            audio: { type: "AudioRawFrame", id: 2 },
+            transcription: { type: "TranscriptionFrame", id: 3 },
+            message: { type: "MessageFrame", id: 4 },
+          },
+        },
+      },
+    },
+  },
+});
+const FrameType = root.lookupType("pipecat.Frame");
+
+/** True when the browser can encode and decode Opus with WebCodecs. */
+export async function isOpusSupported(): Promise<boolean> {
+  if (typeof AudioEncoder === "undefined" || typeof AudioDecoder === "undefined") {
+    return false;
+  }
+  try {
+    const [enc, dec] = await Promise.all([
+      AudioEncoder.isConfigSupported({
+        codec: "opus",
+        sampleRate: RECORDER_SAMPLE_RATE,
+        numberOfChannels: 1,
+      }),
+      AudioDecoder.isConfigSupported({
+        codec: "opus",
+        sampleRate: PLAYER_SAMPLE_RATE,
+        numberOfChannels: 1,
+      }),
+    ]);
+    return !!enc.supported && !!dec.supported;
+  } catch {
+    return false;
+  }
+}
+
+// Packets are concatenated with a 2-byte big-endian length prefix each
+const packOpusPackets = (packets: Uint8Array[]): Uint8Array => {
+  const size = packets.reduce((n, p) => n + 2 + p.length, 0);
+  const out = new Uint8Array(size);
+  let offset = 0;
+  for (const p of packets) {
+    out[offset] = p.length >> 8;
+    out[offset + 1] = p.length & 0xff;
+    out.set(p, offset + 2);
+    offset += 2 + p.length;
+  }
+  return out;
+};
+
+const unpackOpusPackets = (data: Uint8Array): Uint8Array[] => {
+  const packets: Uint8Array[] = [];
+  let offset = 0;
+  while (offset + 2 <= data.length) {
+    const size = (data[offset] << 8) | data[offset + 1];
+    offset += 2;
+    packets.push(data.subarray(offset, offset + size));
+    offset += size;
+  }
+  return packets;
+};
+
+/**
+ * Protobuf serializer that carries audio as Opus instead of raw 16-bit PCM.
+ *
+ * Until `enableOpus` is called it behaves exactly like the stock ProtobufFrameSerializer.
+ * Mic audio is encoded asynchronously by WebCodecs, so `serializeAudio` returns nothing and
+ * finished packets are handed to `onEncoded`, which sends them with `sendRawMessage`.
+ */
+export class OpusFrameSerializer extends ProtobufFrameSerializer {
+  public onEncoded: ((packet: Uint8Array) => void) | null = null;
+  public onPlaybackStart: (() => void) | null = null;
+  public onPacePing: ((ts: number) => void) | null = null;
+  public onPaceFlush: (() => void) | null = null;
+
+  // When the audio handed to the player so far will have finished playing
+  private playbackEndsAt = 0;
+  // Audio handed to the player since the last flush, and the server's count of flushes
+  private receivedMs = 0;
+  private paceEpoch = 0;
+
+  private opus = false;
+  private encoder: AudioEncoder | null = null;
+  private encoderTimestamp = 0;
+  private decoder: AudioDecoder | null = null;
+  private decoderSampleRate = 0;
+  private decoded: Float32Array[] = [];
+  private decodeChain: Promise<unknown> = Promise.resolve();
+
+  enableOpus(enable: boolean) {
+    this.opus = enable;
+  }
+
+  serialize(data: any): any {
+    if (data instanceof Uint8Array) {
+      const frame = FrameType.create({
+        audio: {
+          name: OPUS_FRAME_NAME,
+          audio: packOpusPackets([data]),
+          sampleRate: RECORDER_SAMPLE_RATE,
+          numChannels: 1,
+        },
+      });
+      return FrameType.encode(frame).finish();
+    }
+    return super.serialize(data);
+  }
+
+  serializeAudio(data: ArrayBuffer, sampleRate: number, numChannels: number): any {
+    if (!this.opus) {
+      return super.serializeAudio(data, sampleRate, numChannels);
+    }
+    const encoder = this.getEncoder(sampleRate, numChannels);
+    const numberOfFrames = data.byteLength / 2 / numChannels;
+    const audioData = new AudioData({
+      format: "s16",
+      sampleRate,
+      numberOfChannels: numChannels,
+      numberOfFrames,
+      timestamp: this.encoderTimestamp,
+      data,
+    });
+    this.encoderTimestamp += (numberOfFrames * 1e6) / sampleRate;
+    encoder.encode(audioData);
+    audioData.close();
+    return null;
+  }
+
+  async deserialize(data: any): Promise<any> {
+    const result = await this.deserializeFrame(data);
+    if (result?.type === "audio") {
+      this.trackPlayback(result.audio.length);
+    } else if (result?.type === "message" && result.message?.type === "server-message") {
+      this.handlePaceMessage(result.message.data);
+    }
+    return result;
+  }
+
+  /** Playback position since the last flush, for the server's output pacer. */
+  playbackReport(): { epoch: number; played_ms: number; buffered_ms: number } {
+    const buffered = Math.max(0, this.playbackEndsAt - performance.now());
+    return {
+      epoch: this.paceEpoch,
+      played_ms: Math.round(this.receivedMs - buffered),
+      buffered_ms: Math.round(buffered),
+    };
+  }
+
+  private handlePaceMessage(data: any) {
+    if (data?.type === PACE_PING_MESSAGE) {
+      this.onPacePing?.(data.ts);
+    } else if (data?.type === PACE_FLUSH_MESSAGE) {
+      // Whatever was queued is dropped, so it counts as played; positions restart from zero
+      this.paceEpoch = data.epoch;
+      this.receivedMs = 0;
+      this.playbackEndsAt = performance.now();
+      this.onPaceFlush?.();
+    }
+  }
+
+  /**
+   * Estimates playback from the amount of audio queued: the first audio after the queue
+   * has drained starts a new utterance, which is reported to the server for latency traces.
+   */
+  private trackPlayback(samples: number) {
+    const now = performance.now();
+    const durationMs = (samples * 1000) / PLAYER_SAMPLE_RATE;
+    this.receivedMs += durationMs;
+    if (now >= this.playbackEndsAt) {
+      this.playbackEndsAt = now + durationMs;
+      this.onPlaybackStart?.();
+    } else {
+      this.playbackEndsAt += durationMs;
+    }
+  }
+
+  private async deserializeFrame(data: any): Promise<any> {
+    if (!this.opus) {
+      return super.deserialize(data);
+    }
+    if (!(data instanceof Blob)) throw new Error("Unknown data type");
+    const parsed = FrameType.decode(new Uint8Array(await data.arrayBuffer())) as any;
+
+    if (parsed.audio) {
+      if (parsed.audio.name === OPUS_FRAME_NAME) {
+        const audio = await this.decodeOpus(parsed.audio.audio, parsed.audio.sampleRate);
+        return { type: "audio", audio };
+      }
+      const bytes: Uint8Array = parsed.audio.audio;
+      return {
+        type: "audio",
+        audio: new Int16Array(bytes.slice().buffer),
+      };
+    }
+    if (parsed.message) {
+      return { type: "message", message: JSON.parse(parsed.message.data) };
+    }
+    throw new Error("Unknown frame kind");
+  }
+
+  private getEncoder(sampleRate: number, numChannels: number): AudioEncoder {
+    if (!this.encoder) {
+      this.encoder = new AudioEncoder({
+        output: (chunk) => {
+          const packet = new Uint8Array(chunk.byteLength);
+          chunk.copyTo(packet);
+          this.onEncoded?.(packet);
+        },
+        error: (e) => console.error("Opus encoder error", e),
+      });
+      this.encoder.configure({
+        codec: "opus",
+        sampleRate,
+        numberOfChannels: numChannels,
+        bitrate: OPUS_BITRATE,
+        opus: { frameDuration: OPUS_FRAME_US },
+      } as AudioEncoderConfig);
+    }
+    return this.encoder;
+  }
+
+  private decodeOpus(data: Uint8Array, sampleRate: number): Promise<Int16Array> {
+    // Decoding is asynchronous; chain calls so audio is returned in arrival order
+    const result = this.decodeChain.then(async () => {
+      const decoder = this.getDecoder(sampleRate);
+      for (const packet of unpackOpusPackets(data)) {
+        decoder.decode(
+          new EncodedAudioChunk({ type: "key", timestamp: 0, data: packet })
+        );
+      }
+      await decoder.flush();
+      const samples = this.decoded.reduce((n, f) => n + f.length, 0);
+      const pcm = new Int16Array(samples);
+      let offset = 0;
+      for (const f of this.decoded) {
+        for (let i = 0; i < f.length; i++) {
+          const s = Math.max(-1, Math.min(1, f[i]));
+          pcm[offset++] = s < 0 ? s * 0x8000 : s * 0x7fff;
+        }
+      }
+      this.decoded = [];
+      return pcm;
+    });
+    this.decodeChain = result.catch(() => undefined);
+    return result;
+  }
+
+  private getDecoder(sampleRate: number): AudioDecoder {
+    if (!this.decoder || this.decoderSampleRate !== sampleRate) {
+      this.decoder?.close();
+      this.decoder = new AudioDecoder({
+        output: (audioData) => {
+          const f32 = new Float32Array(audioData.numberOfFrames);
+          audioData.copyTo(f32, { planeIndex: 0, format: "f32-planar" });
+          audioData.close();
+          this.decoded.push(f32);
+        },
+        error: (e) => console.error("Opus decoder error", e),
+      });
+      this.decoder.configure({ codec: "opus", sampleRate, numberOfChannels: 1 });
+      this.decoderSampleRate = sampleRate;
+    }
+    return this.decoder;
+  }
+}
+
+/**
+ * WebSocketTransport that switches its serializer to Opus when the server agreed to it
+ * in the /connect response.
+ */
+export class OpusWebSocketTransport extends WebSocketTransport {
+  private opusSerializer: OpusFrameSerializer;
+  private reportTimer: ReturnType<typeof setInterval> | null = null;
+  private lastReportBuffered = 0;
+
+  constructor() {
+    const serializer = new OpusFrameSerializer();
+    super({
+      serializer,
+      recorderSampleRate: RECORDER_SAMPLE_RATE,
+      playerSampleRate: PLAYER_SAMPLE_RATE,
+    });
+    this.opusSerializer = serializer;
+    serializer.onEncoded = (packet) => this.sendRawMessage(packet);
+    serializer.onPlaybackStart = () =>
+      this.sendMessage(
+        new RTVIMessage("client-message", { t: PLAYBACK_START_MESSAGE, d: {} })
+      );
+    serializer.onPacePing = (ts) => {
+      this.sendMessage(new RTVIMessage("client-message", { t: PACE_PONG_MESSAGE, d: { ts } }));
+      this.startPlaybackReports();
+    };
+    serializer.onPaceFlush = () => this.flushPlayer();
+  }
+
+  /** Reports the playback position while bot audio is buffered (and once more when it runs out). */
+  private startPlaybackReports() {
+    if (this.reportTimer) return;
+    this.reportTimer = setInterval(() => {
+      const report = this.opusSerializer.playbackReport();
+      if (report.buffered_ms > 0 || this.lastReportBuffered > 0) {
+        this.sendMessage(new RTVIMessage("client-message", { t: PLAYBACK_REPORT_MESSAGE, d: report }));
+      }
+      this.lastReportBuffered = report.buffered_ms;
+    }, PLAYBACK_REPORT_MS);
+  }
+
+  private async flushPlayer() {
+    // userStartedSpeaking() is the media manager's interruption API. It also marks the default
+    // track as interrupted, which drops every later chunk of it, so the mark is cleared again.
+    // The transport keeps both the media manager and that mark private; package.json pins the
+    // SDK versions they were checked against; on any other shape the flush is skipped, since an
+    // interruption whose mark can't be cleared would silence the rest of the session.
+    const mediaManager = (this as any)._mediaManager;
+    const interrupted = mediaManager?._wavStreamPlayer?.interruptedTrackIds;
+    if (typeof mediaManager?.userStartedSpeaking !== "function" || !interrupted || typeof interrupted !== "object") {
+      console.warn("Pacing flush unsupported by this transport version; queued bot audio plays out");
+      return;
+    }
+    await mediaManager.userStartedSpeaking();
+    delete interrupted["default"];
+  }
+
+  async disconnect(): Promise<void> {
+    if (this.reportTimer) {
+      clearInterval(this.reportTimer);
+      this.reportTimer = null;
+    }
+    return super.disconnect();
+  }
+
+  async connect(authBundle: any, abortController: AbortController): Promise<void> {
+    this.opusSerializer.enableOpus(authBundle?.audio_codec === OPUS_FRAME_NAME);
+    return super.connect(authBundle, abortController);
+  }
+}
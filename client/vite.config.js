@@ -3,6 +3,10 @@ import react from '@vitejs/plugin-react-swc';
 
 export default defineConfig({
   plugins: [react()],
+  build: {
+    // Lets the server mark exactly the content-hashed files it serves as immutable
+    manifest: true,
+  },
   server: {
     proxy: {
       // Proxy /api requests to the backend server
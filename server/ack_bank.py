@@ -0,0 +1,212 @@
+"""Bank of short pre-synthesized acknowledgements ("haan...", "acha, ek second") per voice.
+
+Clips live in ACK_AUDIO_DIR/<voice key>/*.wav (16-bit mono PCM). The voice key is the TTS
+voice name when it starts with its language ("hi-IN-Chirp3-HD-Aoede"), otherwise the
+language and the voice ("hi-IN-Puck", "en-US-Custom-Female"), so a clip always matches the
+voice and language of the session that plays it. The bank is read once at startup, and only
+the keys of its directories are served; sessions asking for any other key play nothing.
+
+Usage (synthesizes the default phrases of the voice's language into the bank):
+    python ack_bank.py hi-IN-Chirp3-HD-Aoede [--phrase "..."] [--model gemini-2.5-flash-lite-preview-tts]
+"""
+import argparse
+import os
+import re
+import wave
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import soxr
+from loguru import logger
+
+from resampling import RESAMPLER_QUALITY
+
+# Acknowledgement audio while the reply is slow to start; overridable per session with ack_audio
+ACK_AUDIO = os.getenv("ACK_AUDIO", "false").lower() == "true"
+ACK_AUDIO_DIR = os.getenv("ACK_AUDIO_DIR", "ack_audio")
+# The acknowledgement only plays if no reply audio has arrived this long after the user stopped speaking
+ACK_AUDIO_DELAY_MS = float(os.getenv("ACK_AUDIO_DELAY_MS", "700"))
+# When the reply arrives mid-clip, the clip fades out over this long instead of being cut
+ACK_AUDIO_FADE_MS = float(os.getenv("ACK_AUDIO_FADE_MS", "15"))
+
+ACK_SAMPLE_RATE = 24000
+
+# Default phrases of the bank builder; short and neutral enough to precede any answer
+ACK_PHRASES = {
+    "en": ["Mm-hmm.", "Okay, one second.", "Right, let me see."],
+    "hi": ["हाँ...", "अच्छा, एक सेकंड।", "हम्म, ठीक है।"],
+    "ta": ["ம்ம்...", "சரி, ஒரு நொடி."],
+    "te": ["హా...", "సరే, ఒక్క క్షణం."],
+    "kn": ["ಹಾಂ...", "ಸರಿ, ಒಂದು ಕ್ಷಣ."],
+    "mr": ["हो...", "बरं, एक सेकंद."],
+    "bn": ["হ্যাঁ...", "আচ্ছা, এক সেকেন্ড।"],
+}
+
+_LANGUAGE_PREFIX = re.compile(r"^[a-z]{2,3}-[A-Z]{2}-")
+
+
+def ack_voice_key(voice: str, language: str) -> str:
+    return voice if _LANGUAGE_PREFIX.match(voice) else f"{language}-{voice}"
+
+
+@dataclass
+class AckClip:
+    name: str
+    audio: bytes
+    sample_rate: int
+    # Copies at other rates, made once and shared by every session playing the clip
+    _resampled: Dict[int, "AckClip"] = field(default_factory=dict, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / 2 / self.sample_rate
+
+    def at_rate(self, sample_rate: int) -> "AckClip":
+        if sample_rate == self.sample_rate:
+            return self
+        clip = self._resampled.get(sample_rate)
+        if clip is None:
+            audio = soxr.resample(np.frombuffer(self.audio, dtype=np.int16), self.sample_rate, sample_rate,
+                                  quality=RESAMPLER_QUALITY)
+            clip = self._resampled[sample_rate] = AckClip(self.name, audio.astype(np.int16).tobytes(), sample_rate)
+        return clip
+
+
+def _load_clip(path: str) -> Optional[AckClip]:
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            logger.warning(f"Skipping acknowledgement {path}: not 16-bit mono")
+            return None
+        return AckClip(os.path.basename(path), wav.readframes(wav.getnframes()), wav.getframerate())
+
+
+class AckAudioBank:
+    """Clips per voice key, read from disk once and shared by every session."""
+
+    def __init__(self, root: str = ACK_AUDIO_DIR):
+        self._root = root
+        self._clips: Optional[Dict[str, List[AckClip]]] = None
+        self.plays = 0
+        self.completed = 0
+        self.stepped_aside = 0
+
+    def load(self):
+        """Reads every voice directory of the bank. Blocking; server.py runs it in a thread at startup."""
+        clips: Dict[str, List[AckClip]] = {}
+        if os.path.isdir(self._root):
+            for entry in sorted(os.scandir(self._root), key=lambda entry: entry.name):
+                if not entry.is_dir():
+                    continue
+                voice_clips = []
+                for name in sorted(os.listdir(entry.path)):
+                    if name.endswith(".wav"):
+                        clip = _load_clip(os.path.join(entry.path, name))
+                        if clip:
+                            voice_clips.append(clip)
+                if voice_clips:
+                    clips[entry.name] = voice_clips
+        self._clips = clips
+        logger.info(f"Acknowledgement bank {self._root}: {sum(len(c) for c in clips.values())} clips for {len(clips)} voices")
+
+    def clips_for(self, key: str) -> List[AckClip]:
+        """The clips of a voice key, or none when the bank has no directory for it."""
+        if self._clips is None:
+            # Only without server.py's startup (e.g. scripts importing the agents directly)
+            self.load()
+        clips = self._clips.get(key, [])
+        if not clips:
+            logger.warning(f"No acknowledgement audio for {key} in {self._root}; acknowledgements are off for it")
+        return clips
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": ACK_AUDIO,
+            "delay_ms": ACK_AUDIO_DELAY_MS,
+            "voices": {key: [clip.name for clip in clips] for key, clips in (self._clips or {}).items()},
+            "plays": self.plays,
+            "completed": self.completed,
+            "stepped_aside": self.stepped_aside,
+        }
+
+
+_bank: Optional[AckAudioBank] = None
+
+
+def get_ack_bank() -> AckAudioBank:
+    global _bank
+    if _bank is None:
+        _bank = AckAudioBank()
+    return _bank
+
+
+def _synthesize(key: str, phrase: str, model: str) -> bytes:
+    """16-bit PCM at ACK_SAMPLE_RATE of one phrase in the voice `key` stands for."""
+    language = "-".join(key.split("-")[:2])
+    voice = key[len(language) + 1:]
+    if "Chirp3-HD" in voice or voice.startswith("Custom-"):
+        from google.cloud import texttospeech_v1
+
+        if voice.startswith("Custom-"):
+            voice_env = "CLONE_TTS_VOICE_KEY_MALE" if voice == "Custom-Male" else "CLONE_TTS_VOICE_KEY_FEMALE"
+            with open(os.environ[voice_env], "r") as f:
+                selection = texttospeech_v1.VoiceSelectionParams(
+                    language_code=language, voice_clone=texttospeech_v1.VoiceCloneParams(voice_cloning_key=f.read()))
+        else:
+            selection = texttospeech_v1.VoiceSelectionParams(language_code=language, name=voice)
+        response = texttospeech_v1.TextToSpeechClient().synthesize_speech(
+            input=texttospeech_v1.SynthesisInput(text=phrase),
+            voice=selection,
+            audio_config=texttospeech_v1.AudioConfig(
+                audio_encoding=texttospeech_v1.AudioEncoding.PCM, sample_rate_hertz=ACK_SAMPLE_RATE),
+        )
+        return response.audio_content
+
+    from google import genai
+    from google.genai import types
+
+    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT")
+    location = os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
+    client = genai.Client(vertexai=True, project=project_id, location="global" if "gemini-3" in model else location)
+    response = client.models.generate_content(
+        model=model,
+        contents=f"Say briefly and casually: {phrase}",
+        config=types.GenerateContentConfig(
+            response_modalities=["AUDIO"],
+            speech_config=types.SpeechConfig(
+                voice_config=types.VoiceConfig(prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=voice)),
+                language_code=language.lower(),
+            ),
+        ),
+    )
+    return b"".join(part.inline_data.data for part in response.candidates[0].content.parts if part.inline_data)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description="Synthesize acknowledgement clips into the audio bank")
+    parser.add_argument("voice", help='Voice key, e.g. "hi-IN-Chirp3-HD-Aoede", "en-US-Puck" or "en-US-Custom-Female"')
+    parser.add_argument("--phrase", action="append", help="Phrase to synthesize (repeatable); defaults per language")
+    parser.add_argument("--model", default="gemini-2.5-flash-lite-preview-tts", help="Gemini TTS model for non-Chirp voices")
+    args = parser.parse_args()
+
+    language = args.voice.split("-")[0]
+    phrases = args.phrase or ACK_PHRASES.get(language)
+    if not phrases:
+        parser.error(f"No default phrases for {language}; pass --phrase")
+    directory = os.path.join(ACK_AUDIO_DIR, args.voice)
+    os.makedirs(directory, exist_ok=True)
+    for i, phrase in enumerate(phrases):
+        path = os.path.join(directory, f"ack_{i:02d}.wav")
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(ACK_SAMPLE_RATE)
+            wav.writeframes(_synthesize(args.voice, phrase, args.model))
+        print(f"{path}: {phrase}")
+
+
+if __name__ == "__main__":
+    main()
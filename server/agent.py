@@ -1,6 +1,8 @@
+import asyncio
 import os
 import time
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
 import re
 from loguru import logger
 
@@ -9,50 +11,120 @@ from pipecat.pipeline.parallel_pipeline import ParallelPipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from pipecat.processors.aggregators.llm_response import LLMUserContextAggregator, LLMAssistantContextAggregator
-from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
 from pipecat.services.google.llm import GoogleLLMService
 from pipecat.services.google.llm_vertex import GoogleVertexLLMService
 from pipecat.processors.transcript_processor import TranscriptProcessor
+from pipecat.frames.frames import LLMContextFrame, TranscriptionMessage, TranscriptionUpdateFrame
 from pipecat.services.google.stt import GoogleSTTService
 from pipecat.services.google.tts import GoogleTTSService, GeminiTTSService
 from pipecat.transports.websocket.fastapi import FastAPIWebsocketParams, FastAPIWebsocketTransport
-from pipecat.serializers.protobuf import ProtobufFrameSerializer
-from pipecat.frames.frames import (Frame, TranscriptionFrame, TextFrame, StartInterruptionFrame, CancelFrame,
-                                   TTSAudioRawFrame, TTSStoppedFrame, ErrorFrame, OutputTransportMessageFrame)
-from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.frames.frames import (Frame, InterruptionFrame, TranscriptionFrame, InterimTranscriptionFrame, TextFrame, StartInterruptionFrame, CancelFrame,
+                                   TTSAudioRawFrame, TTSStoppedFrame, ErrorFrame, OutputTransportMessageFrame,
+                                   UserStoppedSpeakingFrame, EndFrame)
+from pipecat.processors.frame_processor import FrameDirection
 from pipecat.utils.text.markdown_text_filter import MarkdownTextFilter
 from pipecat.transcriptions.language import Language
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from fastapi import WebSocket
 from google import genai
+from google.cloud import texttospeech_v1
 from google.genai import types
 
 from system_prompt import SYSTEM_PROMPT, tts_prompt, GEMINI_LLM_TTS_PROMPT
-
-class CustomProtobufSerializer(ProtobufFrameSerializer):
+from tracing import SessionTracer, start_session_trace, finish_session_trace
+from audio_codec import CodecProtobufSerializer, attach_opus_tail_flush
+from vad_batcher import create_vad_analyzer
+from session_recorder import SessionRecorder
+from session_store import PreparedSession
+from session_registry import RegisteredSession
+from profiler import add_pipeline_observers
+from processors.fused_stage import FrameTap, FusedStage
+from processors.ack_audio import AckAudioPlayer
+from ack_bank import ACK_AUDIO, ack_voice_key, get_ack_bank
+from processors.output_pacer import OutputPacer
+from output_pacing import OUTPUT_PACING
+from resampling import SESSION_RESAMPLING, SessionResamplers, attach_output_resampler
+from stt_race import RACE_LABEL, STT_RACE_LANGUAGE_SETS, STTRaceArbiter, language_set_label, parse_language_sets
+from drain import drain_message, get_drain_controller
+from session_memory import SessionMemory, session_limit_message
+from tts_hedge import (TTS_HEDGE_ALT_ENDPOINT, TTS_HEDGE_FALLBACK_VOICE, TTS_HEDGE_GEMINI_FALLBACK, TTS_HEDGING,
+                       get_tts_hedger, hedge_alt_location)
+from endpoint_manager import get_endpoint_manager
+from model_router import LLM_ROUTING, LLM_ROUTING_SCOPE, RouteTier, get_model_router, llm_location_for
+
+class CustomProtobufSerializer(CodecProtobufSerializer):
     async def serialize(self, frame: Frame) -> str | bytes | None:
-        if isinstance(frame, (StartInterruptionFrame, CancelFrame)):
+        if isinstance(frame, (InterruptionFrame, StartInterruptionFrame, CancelFrame)):
+            self.reset_audio()
             return None  # Don't serialize these frames
         return await super().serialize(frame)
 
 
-class CustomVertexGeminiTTSService(GeminiTTSService):
+class HedgedTTSMixin:
+    """Hedges run_tts with a second request to a fallback service when the first chunk is late.
+
+    The fallback is built on first use by `_hedge_factory` and never joins the pipeline:
+    only its run_tts is used, and its own TTFB metrics are off (`_hedge_leg`).
+    """
+
+    _hedge_engine: Optional[str] = None
+    _hedge_factory: Optional[Callable[[], "HedgedTTSMixin"]] = None
+    _hedge_service = None
+    # Set on fallback services, whose latency is reported by the service they stand in for
+    _hedge_leg: bool = False
+
+    async def run_tts(self, text: str):
+        if not (TTS_HEDGING and self._hedge_factory):
+            async for frame in self._synthesize(text):
+                yield frame
+            return
+        async for frame in get_tts_hedger().stream(
+            self._hedge_engine, self._synthesize(text), lambda: self._hedge_run_tts(text),
+            on_hedge_won=self.stop_ttfb_metrics, tracer=self._tracer,
+        ):
+            yield frame
+
+    def _synthesize(self, text: str):
+        """One synthesis request; services with their own request logic override this, not run_tts."""
+        return super().run_tts(text)
+
+    def _hedge_run_tts(self, text: str):
+        if self._hedge_service is None:
+            self._hedge_service = self._hedge_factory()
+            self._hedge_service._hedge_leg = True
+        # Not started by a StartFrame, so it takes the output rate of the service it stands in for
+        self._hedge_service._sample_rate = self.sample_rate
+        return self._hedge_service.run_tts(text)
+
+
+class CustomVertexGeminiTTSService(HedgedTTSMixin, GeminiTTSService):
+    _tracer: Optional[SessionTracer] = None
+
     def __init__(self, *, project_id: str, location: str, voice_id: str = "Puck", model: str = "gemini-2.5-flash-lite-preview-tts", voice_prompt: Optional[str] = None, language_code: Optional[str] = None, **kwargs):
         # Pass a dummy API key since we're using Vertex.
         super().__init__(api_key="dummy", voice_id=voice_id, model=model, **kwargs)
         self._client = genai.Client(vertexai=True, project=project_id, location=location)
+        self._location = location
         self._voice_prompt = voice_prompt
         self._language_code = language_code
 
     async def start_ttfb_metrics(self):
+        if self._hedge_leg:
+            return
         self._my_ttfb_start = time.time()
         await super().start_ttfb_metrics()
         
     async def stop_ttfb_metrics(self):
+        if self._hedge_leg:
+            return
         await super().stop_ttfb_metrics()
         if hasattr(self, '_my_ttfb_start') and self._my_ttfb_start:
             latency = time.time() - self._my_ttfb_start
-            logger.info(f"TTS Latency: {latency}s")
+            logger.debug(f"TTS Latency: {latency}s")
+            if self._tracer:
+                self._tracer.record("tts_ttfb", {"value": latency})
+                self._tracer.mark("tts_first_chunk")
+                self._tracer.end_turn("tts_first_audio")
             await self.push_frame(OutputTransportMessageFrame(message={
                 "label": "rtvi-ai",
                 "type": "server-message",
@@ -63,7 +135,7 @@ class CustomVertexGeminiTTSService(GeminiTTSService):
             }))
             self._my_ttfb_start = None
 
-    async def run_tts(self, text: str):
+    async def _synthesize(self, text: str):
         logger.debug(f"{self}: Generating TTS [{text}]")
         try:
             await self.start_ttfb_metrics()
@@ -99,6 +171,7 @@ Aria is a professional and empathetic voice assistant designed to sound like a r
 {text}
 """
 
+            delivered = False
             async for chunk in await self._client.aio.models.generate_content_stream(
                 model=self._model, contents=structured_prompt, config=generate_content_config,
             ):
@@ -108,6 +181,10 @@ Aria is a professional and empathetic voice assistant designed to sound like a r
                 if part.inline_data and part.inline_data.data:
                     audio_data = part.inline_data.data
                     await self.stop_ttfb_metrics()
+                    if not delivered:
+                        # Only audio this request got from its own region counts for it, not a hedge win
+                        delivered = True
+                        get_endpoint_manager().record_success("tts", self._location)
                     CHUNK_SIZE = self.chunk_size
                     for i in range(0, len(audio_data), CHUNK_SIZE):
                         chunk_bytes = audio_data[i : i + CHUNK_SIZE]
@@ -117,19 +194,33 @@ Aria is a professional and empathetic voice assistant designed to sound like a r
             yield TTSStoppedFrame()
         except Exception as e:
             logger.exception(f"{self} error generating TTS: {e}")
+            get_endpoint_manager().record_failure("tts", self._location, e)
+            if self._tracer:
+                self._tracer.record("tts_error", {"error": str(e)})
+                self._tracer.dump(reason="tts_error")
             yield ErrorFrame(error=f"Gemini TTS generation error: {str(e)}")
 
 
-class CustomGoogleTTSService(GoogleTTSService):
+class CustomGoogleTTSService(HedgedTTSMixin, GoogleTTSService):
+    _tracer: Optional[SessionTracer] = None
+
     async def start_ttfb_metrics(self):
+        if self._hedge_leg:
+            return
         self._my_ttfb_start = time.time()
         await super().start_ttfb_metrics()
         
     async def stop_ttfb_metrics(self):
+        if self._hedge_leg:
+            return
         await super().stop_ttfb_metrics()
         if hasattr(self, '_my_ttfb_start') and self._my_ttfb_start:
             latency = time.time() - self._my_ttfb_start
-            logger.info(f"TTS Latency: {latency}s")
+            logger.debug(f"TTS Latency: {latency}s")
+            if self._tracer:
+                self._tracer.record("tts_ttfb", {"value": latency})
+                self._tracer.mark("tts_first_chunk")
+                self._tracer.end_turn("tts_first_audio")
             await self.push_frame(OutputTransportMessageFrame(message={
                 "label": "rtvi-ai",
                 "type": "server-message",
@@ -141,15 +232,60 @@ class CustomGoogleTTSService(GoogleTTSService):
             self._my_ttfb_start = None
 
 class CustomGoogleVertexLLMService(GoogleVertexLLMService):
+    _tracer: Optional[SessionTracer] = None
+
+    def __init__(self, *, requested_model: Optional[str] = None, base_location: Optional[str] = None,
+                 session_id: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        # What the session asked for; the router may serve turns from a faster tier instead
+        self._requested_model = requested_model or self._model_name
+        self._base_location = base_location or self._location
+        self._route_session_id = session_id
+        self._clients = {self._location: self._client}
+
+    def apply_route(self, tier: RouteTier):
+        """Switches model, thinking level and (for Gemini 3) endpoint for the following calls."""
+        location = llm_location_for(tier.model, self._base_location)
+        if tier.model == self._model_name and location == self._location and \
+                self._settings["extra"] == tier.extra_params():
+            return
+        logger.info(f"LLM route for session {self._route_session_id}: {self._model_name} -> {tier} ({location})")
+        if self._tracer:
+            self._tracer.record("llm_route", {"model": tier.model, "thinking_level": tier.thinking_level, "location": location})
+        self.set_model_name(tier.model)
+        self._settings["extra"] = tier.extra_params()
+        if location != self._location:
+            self._location = location
+            if location not in self._clients:
+                self.create_client()
+                self._clients[location] = self._client
+            self._client = self._clients[location]
+
+    async def _process_context(self, context):
+        if LLM_ROUTING and LLM_ROUTING_SCOPE == "turn":
+            self.apply_route(get_model_router().select(self._requested_model, self._base_location, self._route_session_id))
+        await super()._process_context(context)
+
+    async def push_error(self, error: ErrorFrame):
+        get_endpoint_manager().record_failure("llm", self._location, error.error)
+        await super().push_error(error)
+
     async def start_ttfb_metrics(self):
         self._my_ttfb_start = time.time()
+        if self._tracer:
+            self._tracer.mark("llm_request")
         await super().start_ttfb_metrics()
         
     async def stop_ttfb_metrics(self):
         await super().stop_ttfb_metrics()
         if hasattr(self, '_my_ttfb_start') and self._my_ttfb_start:
             latency = time.time() - self._my_ttfb_start
-            logger.info(f"LLM Latency: {latency}s")
+            logger.debug(f"LLM Latency: {latency}s")
+            get_model_router().record(self._model_name, self._location, latency)
+            get_endpoint_manager().record_success("llm", self._location)
+            if self._tracer:
+                self._tracer.record("llm_ttfb", {"value": latency})
+                self._tracer.mark("llm_first_output")
             await self.push_frame(OutputTransportMessageFrame(message={
                 "label": "rtvi-ai",
                 "type": "server-message",
@@ -161,118 +297,234 @@ class CustomGoogleVertexLLMService(GoogleVertexLLMService):
             self._my_ttfb_start = None
 
 
-class TranscriptionBroadcaster(FrameProcessor):
-    def __init__(self, participant: str):
-        super().__init__()
+class TranscriptionBroadcaster(FrameTap):
+    """Sends transcriptions to the client UI and marks turn stages; runs inside a FusedStage."""
+
+    frame_types = (TextFrame, UserStoppedSpeakingFrame)
+
+    def __init__(self, participant: str, tracer: Optional[SessionTracer] = None):
         self.participant = participant
+        self._tracer = tracer
+
+    async def process(self, stage: FusedStage, frame: Frame, direction: FrameDirection):
+        # The Bot broadcaster sits in every pipeline variant, so it owns turn marking
+        if isinstance(frame, UserStoppedSpeakingFrame) and self._tracer and self.participant == "Bot":
+            self._tracer.begin_turn("user_stopped_speaking")
+        elif isinstance(frame, TranscriptionFrame) and self._tracer and self.participant == "User":
+            self._tracer.mark("stt_final")
+
+        if direction == FrameDirection.DOWNSTREAM and isinstance(frame, TextFrame) and frame.text:
+            ui_text = re.sub(r'\[.*?\]', '', frame.text).strip()
+            if ui_text:
+                logger.debug(f"TranscriptionBroadcaster [{self.participant}]: {ui_text}")
+                if self._tracer:
+                    self._tracer.record("transcription", {"participant": self.participant, "text": ui_text})
+                await stage.push_frame(OutputTransportMessageFrame(message={
+                    "label": "rtvi-ai",
+                    "type": "server-message",
+                    "data": {
+                        'type': 'transcription',
+                        'participant': self.participant,
+                        'text': ui_text
+                    }
+                }))
+
+
+class ContextLogger(FrameTap):
+    """Logs every context frame on its way to the LLM, whichever LLM service the session uses."""
+
+    frame_types = (OpenAILLMContextFrame, LLMContextFrame)
 
-    async def process_frame(self, frame: Frame, direction: FrameDirection):
-        if direction == FrameDirection.DOWNSTREAM:
-            text = ""
-            if isinstance(frame, TranscriptionFrame):
-                text = frame.text
-            elif isinstance(frame, TextFrame):
-                text = frame.text
-
-            if text:
-                ui_text = re.sub(r'\[.*?\]', '', text).strip()
-                if ui_text:
-                    logger.info(f"TranscriptionBroadcaster [{self.participant}]: {ui_text}")
-                    await self.push_frame(OutputTransportMessageFrame(message={
-                        "label": "rtvi-ai",
-                        "type": "server-message",
-                        "data": {
-                            'type': 'transcription',
-                            'participant': self.participant,
-                            'text': ui_text
-                        }
-                    }))
-
-        await super().process_frame(frame, direction)
-        await self.push_frame(frame, direction)
-
-
-class ContextLogger(FrameProcessor):
     def __init__(self, logger_name: str):
-        super().__init__()
         self.logger_name = logger_name
 
-    async def process_frame(self, frame: Frame, direction: FrameDirection):
-        from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
-        if isinstance(frame, OpenAILLMContextFrame):
-            logger.info(f"ContextLogger [{self.logger_name}]: Received OpenAILLMContextFrame")
-        await super().process_frame(frame, direction)
-        await self.push_frame(frame, direction)
+    async def process(self, stage: FusedStage, frame: Frame, direction: FrameDirection):
+        logger.debug(f"ContextLogger [{self.logger_name}]: {type(frame).__name__} with "
+                     f"{len(frame.context.get_messages())} messages")
 
 
-async def run_agent(
-    websocket: WebSocket,
-    tts_voice: str,
-    tts_pace: float,
-    llm_model: str,
-    stt_model: str,
-    stt_language: str,
-    tts_model: str = "google-tts",
-    tts_voice_prompt: Optional[str] = None,
-    system_instruction: Optional[str] = None,
-    skip_stt: bool = False,
-):
-    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT") or "deep-clock-339817"
-    location = os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
+class UserTranscriptTap(FrameTap):
+    """TranscriptProcessor.user() as a tap: a TranscriptionUpdateFrame per final user transcription."""
 
-    transport = FastAPIWebsocketTransport(
-        websocket,
-        params=FastAPIWebsocketParams(
-            audio_in_enabled=True,
-            audio_out_enabled=True,
-            vad_analyzer=SileroVADAnalyzer(),
-            serializer=CustomProtobufSerializer(),
-        ),
+    frame_types = (TranscriptionFrame,)
+
+    async def process(self, stage: FusedStage, frame: Frame, direction: FrameDirection):
+        message = TranscriptionMessage(role="user", user_id=frame.user_id, content=frame.text, timestamp=frame.timestamp)
+        await stage.push_frame(TranscriptionUpdateFrame(messages=[message]))
+
+
+@dataclass
+class AgentSessionConfig:
+    """Connect parameters of the TTS-LLM-STT flow, with the system instruction assembled."""
+
+    tts_voice: str
+    tts_pace: float
+    llm_model: str
+    stt_model: str
+    stt_language: str
+    tts_model: str
+    tts_voice_prompt: Optional[str]
+    system_instruction: str
+    skip_stt: bool
+    audio_codec: str
+    session_id: Optional[str]
+    # Two or more language sets streamed to separate recognizers and raced per utterance
+    stt_race_sets: List[List[str]] = field(default_factory=list)
+    # Audio bank voice of the acknowledgements played while the reply is slow to start; None: off
+    ack_voice: Optional[str] = None
+    # Bot audio released at playback speed through an OutputPacer
+    output_pacing: bool = False
+
+
+def compile_agent_config(tts_voice: str = "en-US-Chirp3-HD-Aoede", tts_pace: float = 0.80, llm_model: str = "gemini-2.5-flash", stt_model: str = "latest_long", stt_language: str = "en-US", tts_model: str = "google-tts", tts_voice_prompt: Optional[str] = None, system_instruction: Optional[str] = None, skip_stt: bool = False, audio_codec: str = "pcm", session_id: Optional[str] = None, stt_race: Optional[str] = None, ack_audio: Optional[bool] = None, output_pacing: Optional[bool] = None, strict: bool = False, **_unused) -> AgentSessionConfig:
+    """Assembles the system instruction; with strict=True also validates what would otherwise fail mid-connect."""
+    final_system_instruction = system_instruction or SYSTEM_PROMPT
+    if tts_model.startswith("gemini"):
+        final_system_instruction += "\n\n" + GEMINI_LLM_TTS_PROMPT
+
+    if skip_stt:
+        final_system_instruction += "\n\nIMPORTANT: The user's input is raw audio. Listen to it and respond naturally. Strictly answer ONLY the current user query. Do not bring up previous topics or simulate future turns."
+
+    stt_race_sets = parse_language_sets(stt_race if stt_race is not None else STT_RACE_LANGUAGE_SETS)
+    if len(stt_race_sets) < 2:
+        stt_race_sets = []
+
+    ack_voice = None
+    if ack_audio if ack_audio is not None else ACK_AUDIO:
+        # Cloned voices speak en-US; Gemini voices the STT language; Chirp voices carry their language
+        ack_language = "en-US" if tts_voice in ["Custom-Male", "Custom-Female"] else (stt_language or "en-US").split(",")[0].strip()
+        ack_voice = ack_voice_key(tts_voice, ack_language)
+
+    if strict:
+        race_languages = [lang for languages in stt_race_sets for lang in languages]
+        for lang in (stt_language.split(',') if stt_language else []) + race_languages:
+            Language(lang.strip())  # raises ValueError for unknown languages
+        if tts_voice in ["Custom-Male", "Custom-Female"]:
+            voice_env = "CLONE_TTS_VOICE_KEY_MALE" if tts_voice == "Custom-Male" else "CLONE_TTS_VOICE_KEY_FEMALE"
+            if not os.getenv(voice_env):
+                raise ValueError(f"{voice_env} environment variable not set")
+        elif not tts_model.startswith("gemini"):
+            Language("-".join(tts_voice.split("-")[:2]))
+
+    return AgentSessionConfig(
+        tts_voice=tts_voice,
+        tts_pace=tts_pace,
+        llm_model=llm_model,
+        stt_model=stt_model,
+        stt_language=stt_language,
+        tts_model=tts_model,
+        tts_voice_prompt=tts_voice_prompt,
+        system_instruction=final_system_instruction,
+        skip_stt=skip_stt,
+        audio_codec=audio_codec,
+        session_id=session_id,
+        stt_race_sets=stt_race_sets,
+        ack_voice=ack_voice,
+        output_pacing=output_pacing if output_pacing is not None else OUTPUT_PACING,
     )
 
-    stt = None
-    if not skip_stt:
-        stt_location = location if "chirp_2" in stt_model else "us"
-        stt = GoogleSTTService(
+
+class RaceBranchSTTService(GoogleSTTService):
+    """One recognizer of a race; tags its transcriptions with its language set."""
+
+    def __init__(self, *, race_label: str, **kwargs):
+        # Audio stops at the recognizers; only transcriptions leave the race
+        super().__init__(audio_passthrough=False, **kwargs)
+        self.race_label = race_label
+
+    async def push_frame(self, frame: Frame, direction: FrameDirection = FrameDirection.DOWNSTREAM):
+        if isinstance(frame, (TranscriptionFrame, InterimTranscriptionFrame)):
+            frame.metadata[RACE_LABEL] = self.race_label
+        await super().push_frame(frame, direction)
+
+
+def stt_location_for(stt_model: str, location: str, session_id: Optional[str] = None) -> str:
+    """chirp_2 is served from regional endpoints only; the other models from the routed multi-region."""
+    if "chirp_2" in stt_model:
+        return location
+    return get_endpoint_manager().select("stt", "us", session_id)
+
+
+def build_racing_stt(project_id: str, stt_location: str, stt_model: str, language_sets: List[List[str]]) -> Pipeline:
+    """Streams the audio to one recognizer per language set and keeps one transcription per utterance."""
+    branches = [
+        RaceBranchSTTService(
+            race_label=language_set_label(languages),
             vertexai_project=project_id,
             location=stt_location,
             params=GoogleSTTService.InputParams(
-                languages=[Language(lang) for lang in stt_language.split(',')] if stt_language else [Language("en-US")],
+                languages=[Language(lang) for lang in languages],
                 model=stt_model,
                 enable_interim_results=True,
-            )
+            ),
         )
+        for languages in language_sets
+    ]
+    arbiter = STTRaceArbiter([b.race_label for b in branches])
+    logger.info(f"Racing STT across {[b.race_label for b in branches]}")
+    stt = Pipeline([ParallelPipeline(*[[b] for b in branches]), arbiter])
+    stt.race_arbiter = arbiter
+    return stt
 
-    final_system_instruction = system_instruction or SYSTEM_PROMPT
-    if tts_model.startswith("gemini"):
-        final_system_instruction += "\n\n" + GEMINI_LLM_TTS_PROMPT
 
-    if skip_stt:
-        final_system_instruction += "\n\nIMPORTANT: The user's input is raw audio. Listen to it and respond naturally. Strictly answer ONLY the current user query. Do not bring up previous topics or simulate future turns."
-
-    llm_location = "global" if "gemini-3" in llm_model else location
+def build_agent_llm(config: AgentSessionConfig) -> "CustomGoogleVertexLLMService":
+    """Creates the session's LLM service. Resolving and refreshing its credentials blocks, so it can run in a thread."""
+    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT") or "deep-clock-339817"
+    location = os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
+    llm_model, session_id, final_system_instruction = config.llm_model, config.session_id, config.system_instruction
+
+    # New sessions start in the fastest healthy region, on the tier the router currently serves for this model
+    llm_base_location = get_endpoint_manager().select("llm", location, session_id)
+    route = get_model_router().select(llm_model, llm_base_location, session_id)
+    if route.model != llm_model or route.thinking_level:
+        logger.info(f"Session {session_id} asked for {llm_model}, starting on {route}")
+    llm_location = llm_location_for(route.model, llm_base_location)
     llm_params = None
-    if llm_model in ["gemini-3.1-flash-lite-preview", "gemini-3-flash-preview"]:
+    if route.extra_params():
         llm_params = GoogleVertexLLMService.InputParams(
             max_tokens=4096,
-            extra={
-                "thinking_config": {
-                    "thinking_level": "minimal"
-                }
-            }
+            extra=route.extra_params()
         )
 
-    llm = CustomGoogleVertexLLMService(
+    return CustomGoogleVertexLLMService(
         project_id=project_id,
         location=llm_location,
-        model=llm_model,
+        model=route.model,
         system_instruction=final_system_instruction,
-        params=llm_params
+        params=llm_params,
+        requested_model=llm_model,
+        base_location=llm_base_location,
+        session_id=session_id,
     )
 
+
+def build_agent_services(config: AgentSessionConfig, llm: Optional["CustomGoogleVertexLLMService"] = None):
+    """Creates the STT (None with skip_stt), LLM (unless given) and TTS services of a session."""
+    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT") or "deep-clock-339817"
+    location = os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
+    skip_stt, stt_model, stt_language = config.skip_stt, config.stt_model, config.stt_language
+    session_id = config.session_id
+    tts_model, tts_voice, tts_voice_prompt, tts_pace = config.tts_model, config.tts_voice, config.tts_voice_prompt, config.tts_pace
+
+    stt = None
+    if not skip_stt and config.stt_race_sets:
+        stt = build_racing_stt(project_id, stt_location_for(stt_model, location, session_id), stt_model, config.stt_race_sets)
+    elif not skip_stt:
+        stt = GoogleSTTService(
+            vertexai_project=project_id,
+            location=stt_location_for(stt_model, location, session_id),
+            params=GoogleSTTService.InputParams(
+                languages=[Language(lang) for lang in stt_language.split(',')] if stt_language else [Language("en-US")],
+                model=stt_model,
+                enable_interim_results=True,
+            )
+        )
+
+    llm = llm or build_agent_llm(config)
+
     if tts_model.startswith("gemini"):
         # Use Gemini TTS (Vertex AI) requires 24kHz
-        tts_location = "global" if "gemini-3" in tts_model else location
+        tts_location = "global" if "gemini-3" in tts_model else get_endpoint_manager().select("tts", location, session_id)
         tts = CustomVertexGeminiTTSService(
             project_id=project_id,
             location=tts_location,
@@ -325,6 +577,127 @@ async def run_agent(
             text_filters=[MarkdownTextFilter()],
         )
 
+    if TTS_HEDGING and tts_model.startswith("gemini"):
+        tts._hedge_engine = f"{tts_model}@{tts_location}"
+        if TTS_HEDGE_GEMINI_FALLBACK == "region" and "gemini-3" not in tts_model:
+            alt_location = hedge_alt_location(tts_location)
+            tts._hedge_factory = lambda: CustomVertexGeminiTTSService(
+                project_id=project_id, location=alt_location, voice_id=tts_voice, model=tts_model,
+                sample_rate=24000, voice_prompt=tts_voice_prompt,
+                language_code=stt_language.lower() if stt_language else None,
+            )
+        else:
+            # Gemini 3 TTS is only served from the global endpoint, so it always hedges to Chirp 3 HD
+            tts._hedge_factory = lambda: CustomGoogleTTSService(
+                voice_id=TTS_HEDGE_FALLBACK_VOICE,
+                params=GoogleTTSService.InputParams(
+                    language=Language("-".join(TTS_HEDGE_FALLBACK_VOICE.split("-")[:2])),
+                    speaking_rate=tts_pace
+                ),
+            )
+    elif TTS_HEDGING:
+        tts._hedge_engine = "google-tts/cloned" if tts_voice in ["Custom-Male", "Custom-Female"] else "google-tts/chirp3-hd"
+        tts._hedge_factory = lambda: build_regional_google_tts(tts, TTS_HEDGE_ALT_ENDPOINT)
+
+    return stt, llm, tts
+
+
+def build_regional_google_tts(primary: CustomGoogleTTSService, endpoint: str) -> CustomGoogleTTSService:
+    """Copy of a Cloud TTS service (same voice and settings) that sends its requests to a regional endpoint."""
+    tts = CustomGoogleTTSService(
+        voice_id=primary._voice_id,
+        voice_cloning_key=primary._voice_cloning_key,
+        params=GoogleTTSService.InputParams(
+            language=Language(primary._settings["language"]),
+            speaking_rate=primary._settings["speaking_rate"]
+        ),
+    )
+    tts._client = texttospeech_v1.TextToSpeechAsyncClient(client_options={"api_endpoint": endpoint})
+    return tts
+
+
+async def prewarm_agent_session(config: AgentSessionConfig):
+    """Builds the services (clients, credentials, voice keys) ahead of the websocket.
+
+    The LLM's credential setup runs in a thread. The gRPC STT and TTS clients bind to the
+    running event loop, so they are created on it.
+    """
+    llm = await asyncio.to_thread(build_agent_llm, config)
+    return build_agent_services(config, llm=llm)
+
+
+async def run_agent(
+    websocket: WebSocket,
+    tts_voice: str,
+    tts_pace: float,
+    llm_model: str,
+    stt_model: str,
+    stt_language: str,
+    stt_race: Optional[str] = None,
+    ack_audio: Optional[bool] = None,
+    output_pacing: Optional[bool] = None,
+    tts_model: str = "google-tts",
+    tts_voice_prompt: Optional[str] = None,
+    system_instruction: Optional[str] = None,
+    skip_stt: bool = False,
+    session_id: Optional[str] = None,
+    audio_codec: str = "pcm",
+    recorder: Optional[SessionRecorder] = None,
+    prepared: Optional[PreparedSession] = None,
+    registered: Optional[RegisteredSession] = None,
+):
+    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT") or "deep-clock-339817"
+
+    services = None
+    if prepared:
+        # Compiled (and usually warmed) by /connect
+        config = prepared.config
+        services = await prepared.take_resources()
+    else:
+        config = compile_agent_config(
+            tts_voice=tts_voice, tts_pace=tts_pace, llm_model=llm_model, stt_model=stt_model,
+            stt_language=stt_language, stt_race=stt_race, tts_model=tts_model, tts_voice_prompt=tts_voice_prompt,
+            system_instruction=system_instruction, skip_stt=skip_stt, audio_codec=audio_codec,
+            session_id=session_id, ack_audio=ack_audio, output_pacing=output_pacing,
+        )
+    stt, llm, tts = services or build_agent_services(config)
+    skip_stt, stt_language, audio_codec = config.skip_stt, config.stt_language, config.audio_codec
+    final_system_instruction = config.system_instruction
+
+    serializer = CustomProtobufSerializer(audio_codec=audio_codec)
+    serializer.recorder = recorder
+    transport = FastAPIWebsocketTransport(
+        websocket,
+        params=FastAPIWebsocketParams(
+            audio_in_enabled=True,
+            audio_out_enabled=True,
+            vad_analyzer=create_vad_analyzer(),
+            serializer=serializer,
+        ),
+    )
+    attach_opus_tail_flush(transport.output(), serializer)
+
+    tracer = start_session_trace(session_id or str(id(websocket)), "tts-llm-stt")
+
+    # Fills the silence before a slow reply; absent when off or when the bank has no clips for the voice
+    ack_stage = []
+    ack_clips = get_ack_bank().clips_for(config.ack_voice) if config.ack_voice else []
+    if ack_clips:
+        ack_player = AckAudioPlayer(ack_clips)
+        ack_player._tracer = tracer
+        ack_stage = [ack_player]
+    # Every conversion of the session's bot audio (and, in skip_stt mode, of the STT audio) goes through these
+    resamplers = SessionResamplers(session_id) if SESSION_RESAMPLING else None
+    if resamplers:
+        attach_output_resampler(transport.output(), resamplers.stream("output"))
+    # Keeps only a small lead of bot audio on the client, so barge-in stops it quickly
+    pacer_stage = []
+    if config.output_pacing:
+        pacer = OutputPacer()
+        pacer._tracer = tracer
+        serializer.pacer = pacer
+        pacer_stage = [pacer]
+
     if skip_stt:
         from pipecat.services.google.llm import GoogleLLMContext
         from processors.audio_accumulator import AudioAccumulator
@@ -336,6 +709,9 @@ async def run_agent(
             context,
             project_id=project_id,
             stt_languages=stt_languages,
+            stt_language_sets=config.stt_race_sets,
+            stt_location=stt_location_for("latest_long", "us", session_id),
+            resampler=resamplers.stream("stt") if resamplers else None,
         )
         context_aggregator = llm.create_context_aggregator(context)
 
@@ -343,9 +719,12 @@ async def run_agent(
             transport.input(),
             accumulator,
             llm,
-            TranscriptionBroadcaster(participant="Bot"),
+            # The accumulator has buffered the utterance; input audio stops here
+            FusedStage([TranscriptionBroadcaster(participant="Bot", tracer=tracer)], drop_input_audio=True),
             tts,
+            *ack_stage,
             context_aggregator.assistant(),
+            *pacer_stage,
             transport.output()
         ]
     else:
@@ -356,18 +735,27 @@ async def run_agent(
         pipeline_elements = [
             transport.input(),
             stt,
-            TranscriptionBroadcaster(participant="User"),
-            transcript.user(),
+            # Nothing after STT uses input audio, so the microphone stream ends in this stage
+            FusedStage([TranscriptionBroadcaster(participant="User", tracer=tracer), UserTranscriptTap()], drop_input_audio=True),
             context_aggregator.user(),
-            ContextLogger(logger_name="UserToLLM"),
+            # Input audio already stopped above, so this stage only sees control and context frames
+            FusedStage([ContextLogger(logger_name="UserToLLM")]),
             llm,
-            TranscriptionBroadcaster(participant="Bot"),
+            FusedStage([TranscriptionBroadcaster(participant="Bot", tracer=tracer)]),
             tts,
+            *ack_stage,
             transcript.assistant(),
             context_aggregator.assistant(),
+            *pacer_stage,
             transport.output()
         ]
 
+    llm._tracer = tracer
+    tts._tracer = tracer
+    serializer.tracer = tracer
+    if getattr(stt, "race_arbiter", None):
+        stt.race_arbiter._tracer = tracer
+
     pipeline = Pipeline(pipeline_elements)
 
     task = PipelineTask(
@@ -379,6 +767,7 @@ async def run_agent(
             audio_in_sample_rate=16000,
         ),
     )
+    add_pipeline_observers(task, pipeline)
 
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, client):
@@ -387,5 +776,32 @@ async def run_agent(
         else:
             await task.queue_frames([context_aggregator.user()._get_context_frame()])
 
+    async def on_drain(remaining: float):
+        # Nothing upstream to resume; the client reconnects to another instance right away
+        tracer.record("drain_handoff", {"resumable": False})
+        message = drain_message(None, remaining, session_id=session_id,
+                                resume_secret=registered.resume_secret if registered else None)
+        await task.queue_frames([OutputTransportMessageFrame(message=message)])
+
+    async def on_memory_limit(reason: str):
+        # Queued behind what is already on its way, so the current answer still finishes
+        await task.queue_frames([OutputTransportMessageFrame(message=session_limit_message(reason)), EndFrame()])
+
+    drain_id = session_id or str(id(websocket))
+    memory = SessionMemory(drain_id, on_limit=on_memory_limit)
+    memory._tracer = tracer
+    memory.track_context(context)
+    memory.track_pipeline(pipeline)
+    get_drain_controller().register(drain_id, on_drain)
     runner = PipelineRunner(handle_sigint=False)
-    await runner.run(task)
+    memory.start()
+    try:
+        await runner.run(task)
+    except Exception as e:
+        tracer.record("error", {"error": str(e)})
+        tracer.dump(reason="error")
+        raise
+    finally:
+        memory.stop()
+        get_drain_controller().unregister(drain_id)
+        finish_session_trace(tracer)
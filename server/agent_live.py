@@ -1,4 +1,5 @@
 import os
+import asyncio
 import websockets
 import json
 from typing import Optional, List, Dict, Any
@@ -6,32 +7,48 @@ from loguru import logger
 from fastapi import WebSocket
 from datetime import datetime
 import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
 from pipecat.services.google.gemini_live.llm_vertex import GeminiLiveVertexLLMService
-from pipecat.services.google.gemini_live.llm import GeminiLiveLLMService, InputParams, GeminiModalities
+from pipecat.services.google.gemini_live.llm import GeminiLiveLLMService, GeminiVADParams, InputParams, GeminiModalities
 from pipecat.transports.websocket.fastapi import FastAPIWebsocketParams, FastAPIWebsocketTransport
 from pipecat.services.google.tts import GoogleTTSService
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.audio.filters.aic_filter import AICFilter
-from pipecat_whisker import WhiskerObserver
-from pipecat.serializers.protobuf import ProtobufFrameSerializer
-from pipecat.frames.frames import EndTaskFrame, Frame, InterruptionFrame, StartInterruptionFrame, CancelFrame, LLMMessagesAppendFrame, TextFrame, OutputTransportMessageFrame
+from pipecat.frames.frames import EndFrame, EndTaskFrame, Frame, InterruptionFrame, InterruptionTaskFrame, StartInterruptionFrame, CancelFrame, LLMMessagesAppendFrame, TextFrame, OutputTransportMessageFrame, UserStartedSpeakingFrame, UserStoppedSpeakingFrame
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from pipecat.transcriptions.language import Language
 from pipecat.adapters.schemas.function_schema import FunctionSchema
 from pipecat.adapters.schemas.tools_schema import AdapterType, ToolsSchema
-from pipecat.services.llm_service import FunctionCallParams
 from pipecat.processors.user_idle_processor import UserIdleProcessor
 from system_prompt import SYSTEM_PROMPT
+from tracing import SessionTracer, start_session_trace, finish_session_trace
+from tool_engine import ToolEngine, ToolSpec, register_local_tool
+from clause_aggregator import ClauseTextAggregator
+from audio_codec import CodecProtobufSerializer, attach_opus_tail_flush
+from vad_batcher import create_vad_analyzer
+from session_recorder import REC_LIVE_MESSAGE, SessionRecorder
+from session_store import PreparedSession
+from session_registry import RegisteredSession
+from profiler import add_pipeline_observers
+from drain import DRAIN_HANDOFF_MARGIN_SECONDS, drain_message, get_drain_controller
+from session_memory import SessionMemory, session_limit_message
+from endpoint_manager import get_endpoint_manager
+from processors.ack_audio import AckAudioPlayer
+from ack_bank import ACK_AUDIO, ack_voice_key, get_ack_bank
+from processors.output_pacer import OutputPacer
+from output_pacing import OUTPUT_PACING
+from resampling import SESSION_RESAMPLING, SessionResamplers, attach_output_resampler
 
 from google.genai.types import (
     AudioTranscriptionConfig,
     AutomaticActivityDetection,
     ContextWindowCompressionConfig,
+    EndSensitivity,
     GenerationConfig,
     LiveConnectConfig,
     MediaResolution,
@@ -40,6 +57,7 @@ from google.genai.types import (
     SessionResumptionConfig,
     SlidingWindow,
     SpeechConfig,
+    StartSensitivity,
     VoiceConfig,
     HttpOptions,
     Content,
@@ -48,39 +66,128 @@ from google.genai.types import (
 
 SYSTEM_INSTRUCTION = SYSTEM_PROMPT
 
-class CustomProtobufSerializer(ProtobufFrameSerializer):
+# Ask the Live API for resumption handles (needed to hand sessions off when draining)
+LIVE_SESSION_RESUMPTION = os.getenv("LIVE_SESSION_RESUMPTION", "true").lower() == "true"
+
+class CustomProtobufSerializer(CodecProtobufSerializer):
     async def serialize(self, frame: Frame) -> bytes | None:
         if isinstance(frame, (InterruptionFrame, StartInterruptionFrame, CancelFrame)):
+            self.reset_audio()
             return None
-        data = await super().serialize(frame)
-        return data.encode("utf-8") if isinstance(data, str) else data
+        return await super().serialize(frame)
+
+class LiveGoogleTTSService(GoogleTTSService):
+    """External TTS for TEXT modality; marks the first synthesized chunk of each turn."""
+
+    _tracer: Optional[SessionTracer] = None
+
+    async def stop_ttfb_metrics(self):
+        await super().stop_ttfb_metrics()
+        if self._tracer:
+            self._tracer.mark("tts_first_chunk")
 
-async def get_current_time(params: FunctionCallParams):
-    is_explicit = params.arguments.get('is_explicit_request')
+
+@register_local_tool("get_current_time")
+async def get_current_time(args: Dict[str, Any]):
+    is_explicit = args.get('is_explicit_request')
     if not is_explicit:
-        await params.result_callback({"error": "Explicit time request required."})
-        return
+        return {"error": "Explicit time request required."}
 
-    await params.result_callback(
-        {"time": datetime.now().strftime("%A, %B %d, %Y %I:%M %p")}
-    )
+    return {"time": datetime.now().strftime("%A, %B %d, %Y %I:%M %p")}
 
 
 class GeminiSessionLoggerMixin:
     """Mixin to add session ID logging, token usage tracking, and repeat-on-filler."""
 
+    _tracer: Optional[SessionTracer] = None
+    _recorder: Optional[SessionRecorder] = None
+    _registered: Optional[RegisteredSession] = None
+    # "local": Silero drives turns; "server": Gemini's activity detection drives them;
+    # "hybrid": Silero drives turns and server barge-ins catch what it misses
+    _vad_mode: str = "local"
+    _server_activity_active: bool = False
+    # (wall, monotonic) time of the latest input transcription chunk; where the user's speech ended
+    # when the end is only inferred from the model's output
+    _last_input_transcription: Optional[tuple] = None
+    # (connection context manager, session) opened by prewarm_connection, adopted on first connect
+    _prewarmed_connection: Optional[tuple] = None
+
+    @property
+    def resumption_handle(self) -> Optional[str]:
+        """The latest Live session resumption handle; the one place that touches pipecat's private attribute."""
+        return getattr(self, "_session_resumption_handle", None)
+
+    @resumption_handle.setter
+    def resumption_handle(self, handle: Optional[str]):
+        self._session_resumption_handle = handle
+
+    # ── Server-side activity detection ────────────────────────────────
+
+    async def _handle_server_activity_start(self, reason: str):
+        """User activity inferred from the Live API (barge-in or incoming user transcription)."""
+        if self._vad_mode == "local" or self._server_activity_active:
+            return
+        self._server_activity_active = True
+        locally_detected = self._user_is_speaking
+        if self._tracer:
+            self._tracer.record("activity_start", {"reason": reason})
+
+        if self._vad_mode == "server":
+            self._user_is_speaking = True
+            await self.broadcast_frame(UserStartedSpeakingFrame)
+        # In hybrid mode Silero has usually interrupted already; only cover barge-ins it missed
+        if reason == "interrupted" and (self._vad_mode == "server" or not locally_detected):
+            await self.push_frame(InterruptionTaskFrame(), FrameDirection.UPSTREAM)
+
+    async def _handle_server_activity_end(self, reason: str):
+        """End of user activity: explicit activity_end, or the model starting its response."""
+        if self._vad_mode == "local" or not self._server_activity_active:
+            return
+        self._server_activity_active = False
+        if self._tracer:
+            self._tracer.record("activity_end", {"reason": reason})
+            if self._vad_mode == "hybrid":
+                # Silero already opened the turn; the server's end stands in for the final transcript
+                self._tracer.mark("stt_final")
+
+        if self._vad_mode == "server":
+            self._user_is_speaking = False
+            self._user_audio_buffer = bytearray()
+            # This google-genai version never sends activity_end; the end is inferred from the model's
+            # first output, so the turn and TTFB are dated back to the user's last transcribed words
+            ended = self._last_input_transcription if reason in ("model_turn", "tool_call") else None
+            self._last_input_transcription = None
+            if self._tracer:
+                self._tracer.begin_turn(f"server_{reason}", at=ended[1] if ended else None)
+                self._tracer.mark("stt_final", at=ended[1] if ended else None)
+            if reason == "activity_end" or ended:
+                await self.start_ttfb_metrics(started_at=ended)
+            await self.broadcast_frame(UserStoppedSpeakingFrame)
+
     # ── Repeat-on-filler: intercept at API level ──────────────────────
 
-    async def start_ttfb_metrics(self):
-        self._my_ttfb_start = time.time()
-        await super().start_ttfb_metrics()
+    async def start_ttfb_metrics(self, started_at: Optional[tuple] = None):
+        """Starts TTFB now, or at an earlier (wall, monotonic) time the end of speech is only known later.
+
+        Pipecat's own TTFB metric can't be dated back, so it only runs for starts that happen now.
+        """
+        self._my_ttfb_start = started_at[0] if started_at else time.time()
+        if self._tracer:
+            # Audio streams continuously; the request is effectively sent at end of speech
+            self._tracer.mark("llm_request", at=started_at[1] if started_at else None)
+        if not started_at:
+            await super().start_ttfb_metrics()
         
     async def stop_ttfb_metrics(self):
         await super().stop_ttfb_metrics()
         if hasattr(self, '_my_ttfb_start') and self._my_ttfb_start:
             self._current_turn_ttft = time.time() - self._my_ttfb_start
-            logger.info(f"Custom TTFT calculation: {self._current_turn_ttft}s")
+            logger.debug(f"Custom TTFT calculation: {self._current_turn_ttft}s")
             self._my_ttfb_start = None
+            if self._tracer:
+                self._tracer.record("llm_ttfb", {"value": self._current_turn_ttft})
+                self._tracer.mark("llm_first_output")
+                self._tracer.end_turn("llm_first_output")
 
 
     async def process_frame(self, frame, direction):
@@ -97,6 +204,8 @@ class GeminiSessionLoggerMixin:
                 self._repeat_on_filler_pending = False
             self._repeat_on_filler_pending = True
             logger.info("[RepeatOnFiller] Interruption detected. Watching for filler.")
+            if self._tracer:
+                self._tracer.record("interruption")
             
             # Metric Streaming: Interruption
             await self.push_frame(OutputTransportMessageFrame(message={
@@ -107,6 +216,8 @@ class GeminiSessionLoggerMixin:
                     'payload': {'type': 'interruption', 'count': 1}
                 }
             }))
+        elif isinstance(frame, UserStoppedSpeakingFrame) and self._tracer:
+            self._tracer.begin_turn("user_stopped_speaking")
 
         await super().process_frame(frame, direction)
 
@@ -128,6 +239,9 @@ class GeminiSessionLoggerMixin:
         if not text:
             return await super()._handle_msg_input_transcription(message)
 
+        await self._handle_server_activity_start("input_transcription")
+        self._last_input_transcription = (time.time(), time.monotonic())
+
         # Accumulate post-interruption text in our own buffer
         if getattr(self, '_repeat_on_filler_pending', False):
             if not hasattr(self, '_post_interruption_buffer'):
@@ -237,6 +351,8 @@ class GeminiSessionLoggerMixin:
     # ── Session ID & token usage logging ──────────────────────────────
 
     async def _process_message(self, message):
+        if self._recorder:
+            self._recorder.record(REC_LIVE_MESSAGE, message.model_dump_json(exclude_none=True).encode("utf-8"))
 
         # Capture Session ID
         if not getattr(self, '_session_id_logged', False):
@@ -250,6 +366,8 @@ class GeminiSessionLoggerMixin:
                 self._session_id = session_id
                 logger.info(f"Session ID Established: {session_id}")
                 self._session_id_logged = True
+                if self._tracer:
+                    self._tracer.record("live_session", {"handle": session_id})
 
         # Log Token Usage
         if hasattr(message, 'usage_metadata') and message.usage_metadata:
@@ -259,7 +377,7 @@ class GeminiSessionLoggerMixin:
                 if not details: return ""
                 return " (" + ", ".join([f"{d.modality}: {d.token_count}" for d in details]) + ")"
 
-            logger.info(
+            logger.debug(
                 f"Turn Token Usage:\n"
                 f"  - Prompt: {getattr(usage, 'prompt_token_count', 0)}{format_details(getattr(usage, 'prompt_tokens_details', []))}\n"
                 f"  - Cached Content: {getattr(usage, 'cached_content_token_count', 0)}{format_details(getattr(usage, 'cache_tokens_details', []))}\n"
@@ -275,6 +393,10 @@ class GeminiSessionLoggerMixin:
                 "response_token_count": getattr(usage, 'response_token_count', 0),
                 "total_token_count": getattr(usage, 'total_token_count', 0),
             }
+            if self._tracer:
+                self._tracer.record("usage", usage_dict)
+            if self._registered:
+                self._registered.add_usage(usage_dict)
             await self.push_frame(OutputTransportMessageFrame(message={
                 "label": "rtvi-ai",
                 "type": "server-message",
@@ -288,15 +410,28 @@ class GeminiSessionLoggerMixin:
         self._check_and_reset_failure_counter()
         
         if message.server_content:
+            if message.server_content.interrupted:
+                logger.debug("Interrupted received from server (User barged in)")
+                await self._handle_server_activity_start("interrupted")
+
             if hasattr(message.server_content, "activity_end") and message.server_content.activity_end:
-                logger.info("Activity End received from server (User stopped speaking)")
+                logger.debug("Activity End received from server (User stopped speaking)")
+                if self._vad_mode == "local" and self._tracer:
+                    self._tracer.record("activity_end")
+                await self._handle_server_activity_end("activity_end")
                 
             if message.server_content.model_turn:
-                logger.info("Model Turn detected")
+                logger.debug("Model Turn detected")
+                await self._handle_server_activity_end("model_turn")
+                if self._tracer and not self._bot_is_responding:
+                    self._tracer.record("model_turn_start")
                 await self._handle_msg_model_turn(message)
             
             if message.server_content.turn_complete:
-                logger.info("Turn Complete received from server")
+                logger.debug("Turn Complete received from server")
+                await self._handle_server_activity_end("turn_complete")
+                if self._tracer:
+                    self._tracer.record("turn_complete")
                 await self._handle_msg_turn_complete(message)
                 # Metric Streaming: Turn Count
                 await self.push_frame(OutputTransportMessageFrame(message={
@@ -323,11 +458,14 @@ class GeminiSessionLoggerMixin:
                 await self._handle_msg_grounding_metadata(message)
                 
         elif message.tool_call:
+            await self._handle_server_activity_end("tool_call")
             # Metric Streaming: Tool Call
             tool_calls = []
             if hasattr(message.tool_call, 'function_calls'):
                 for fc in message.tool_call.function_calls:
                      tool_calls.append({"name": fc.name, "args": fc.args})
+            if self._tracer:
+                self._tracer.record("tool_call", {"tools": [tc["name"] for tc in tool_calls]})
             await self.push_frame(OutputTransportMessageFrame(message={
                 "label": "rtvi-ai",
                 "type": "server-message",
@@ -340,6 +478,17 @@ class GeminiSessionLoggerMixin:
             await self._handle_msg_tool_call(message)
         elif message.session_resumption_update:
             self._handle_msg_resumption_update(message)
+            if self._registered:
+                # Any instance can resume from here if this one goes away
+                self._registered.set_resume_handle(self.resumption_handle)
+
+    async def _handle_connection_error(self, error: Exception) -> bool:
+        # Vertex only; the AI Studio service has no location
+        get_endpoint_manager().record_failure("live", getattr(self, "_location", None), error)
+        if self._tracer:
+            self._tracer.record("connection_error", {"error": str(error)})
+            self._tracer.dump(reason="connection_error")
+        return await super()._handle_connection_error(error)
 
     async def _connect(self, session_resumption_handle: Optional[str] = None):
         """Establish client connection to Gemini Live API."""
@@ -353,124 +502,175 @@ class GeminiSessionLoggerMixin:
         else:
             logger.info("Connecting to Gemini service")
         try:
-            # Assemble basic configuration
-            modalities = self._settings["modalities"]
-            has_audio = modalities == GeminiModalities.AUDIO
-
-            generation_config_params = {
-                "frequency_penalty": self._settings["frequency_penalty"],
-                "max_output_tokens": self._settings["max_tokens"],
-                "presence_penalty": self._settings["presence_penalty"],
-                "temperature": self._settings["temperature"],
-                "top_k": self._settings["top_k"],
-                "top_p": self._settings["top_p"],
-                "response_modalities": [Modality(modalities.value)],
-                "media_resolution": MediaResolution(self._settings["media_resolution"].value),
-            }
+            config = self._build_live_config()
+            self._connection_task = self.create_task(self._connection_task_handler(config))
+        except Exception as e:
+            logger.error(f"Error connecting to Gemini service: {e}")
+            raise e
 
-            if has_audio:
-                generation_config_params["speech_config"] = SpeechConfig(
-                    voice_config=VoiceConfig(
-                        prebuilt_voice_config={"voice_name": self._voice_id}
-                    ),
-                    language_code=self._settings["language"],
-                )
+    def _build_live_config(self) -> LiveConnectConfig:
+        """LiveConnectConfig for the current settings, tools and system instruction."""
+        # Assemble basic configuration
+        modalities = self._settings["modalities"]
+        has_audio = modalities == GeminiModalities.AUDIO
+
+        generation_config_params = {
+            "frequency_penalty": self._settings["frequency_penalty"],
+            "max_output_tokens": self._settings["max_tokens"],
+            "presence_penalty": self._settings["presence_penalty"],
+            "temperature": self._settings["temperature"],
+            "top_k": self._settings["top_k"],
+            "top_p": self._settings["top_p"],
+            "response_modalities": [Modality(modalities.value)],
+            "media_resolution": MediaResolution(self._settings["media_resolution"].value),
+        }
 
-            config = LiveConnectConfig(
-                generation_config=GenerationConfig(**generation_config_params),
-                input_audio_transcription=AudioTranscriptionConfig(),
-                # session_resumption=SessionResumptionConfig(handle=session_resumption_handle),
+        if has_audio:
+            generation_config_params["speech_config"] = SpeechConfig(
+                voice_config=VoiceConfig(
+                    prebuilt_voice_config={"voice_name": self._voice_id}
+                ),
+                language_code=self._settings["language"],
             )
 
-            if has_audio:
-                config.output_audio_transcription = AudioTranscriptionConfig()
+        config = LiveConnectConfig(
+            generation_config=GenerationConfig(**generation_config_params),
+            input_audio_transcription=AudioTranscriptionConfig(),
+        )
 
-            # Add context window compression to configuration, if enabled
-            if self._settings.get("context_window_compression", {}).get("enabled", False):
-                compression_config = ContextWindowCompressionConfig()
+        if LIVE_SESSION_RESUMPTION:
+            # Reconnects, and sessions handed off by a draining instance, resume from the last handle
+            config.session_resumption = SessionResumptionConfig(handle=self.resumption_handle)
 
-                # Add sliding window (always true if compression is enabled)
-                compression_config.sliding_window = SlidingWindow()
+        if has_audio:
+            config.output_audio_transcription = AudioTranscriptionConfig()
 
-                # Add trigger_tokens if specified
-                trigger_tokens = self._settings.get("context_window_compression", {}).get(
-                    "trigger_tokens"
-                )
-                if trigger_tokens is not None:
-                    compression_config.trigger_tokens = trigger_tokens
-
-                config.context_window_compression = compression_config
-
-            # Add thinking configuration to configuration, if provided
-            if self._settings.get("thinking"):
-                config.thinking_config = self._settings["thinking"]
-
-            # Add affective dialog setting, if provided
-            if self._settings.get("enable_affective_dialog", False):
-                config.enable_affective_dialog = self._settings["enable_affective_dialog"]
-
-            # Add proactivity configuration to configuration, if provided
-            if self._settings.get("proactivity"):
-                config.proactivity = self._settings["proactivity"]
-
-            # Add VAD configuration to configuration, if provided
-            if self._settings.get("vad"):
-                vad_config = AutomaticActivityDetection()
-                vad_params = self._settings["vad"]
-                has_vad_settings = False
-
-                # Only add parameters that are explicitly set
-                if vad_params.disabled is not None:
-                    vad_config.disabled = vad_params.disabled
-                    has_vad_settings = True
-
-                if vad_params.start_sensitivity:
-                    vad_config.start_of_speech_sensitivity = vad_params.start_sensitivity
-                    has_vad_settings = True
-
-                if vad_params.end_sensitivity:
-                    vad_config.end_of_speech_sensitivity = vad_params.end_sensitivity
-                    has_vad_settings = True
-
-                if vad_params.prefix_padding_ms is not None:
-                    vad_config.prefix_padding_ms = vad_params.prefix_padding_ms
-                    has_vad_settings = True
-
-                if vad_params.silence_duration_ms is not None:
-                    vad_config.silence_duration_ms = vad_params.silence_duration_ms
-                    has_vad_settings = True
-
-                # Only add automatic_activity_detection if we have VAD settings
-                if has_vad_settings:
-                    config.realtime_input_config = RealtimeInputConfig(
-                        automatic_activity_detection=vad_config
-                    )
+        # Add context window compression to configuration, if enabled
+        if self._settings.get("context_window_compression", {}).get("enabled", False):
+            compression_config = ContextWindowCompressionConfig()
 
-            # Add system instruction to configuration, if provided
-            system_instruction = getattr(self, "_system_instruction", None) or ""
-            if self._context and hasattr(self._context, "extract_system_instructions"):
-                system_instruction += "\n" + self._context.extract_system_instructions()
-            if system_instruction:
-                logger.debug(f"Setting system instruction: {system_instruction}")
-                config.system_instruction = system_instruction
-
-            # Add tools to configuration, if provided
-            tools = getattr(self, "_tools", None)
-            if tools:
-                logger.debug(f"Setting tools: {tools}")
-                # Manually convert tools to Google format since ToolsSchema doesn't have to_google_tools
-                # and we don't have easy access to the adapter instance here
-                from pipecat.adapters.services.gemini_adapter import GeminiLLMAdapter
-                adapter = GeminiLLMAdapter()
-                config.tools = adapter.to_provider_tools_format(tools)
+            # Add sliding window (always true if compression is enabled)
+            compression_config.sliding_window = SlidingWindow()
 
-            self._connection_task = self.create_task(self._connection_task_handler(config))
-        except Exception as e:
-            logger.error(f"Error connecting to Gemini service: {e}")
-            raise e
+            # Add trigger_tokens if specified
+            trigger_tokens = self._settings.get("context_window_compression", {}).get(
+                "trigger_tokens"
+            )
+            if trigger_tokens is not None:
+                compression_config.trigger_tokens = trigger_tokens
+
+            config.context_window_compression = compression_config
+
+        # Add thinking configuration to configuration, if provided
+        if self._settings.get("thinking"):
+            config.thinking_config = self._settings["thinking"]
+
+        # Add affective dialog setting, if provided
+        if self._settings.get("enable_affective_dialog", False):
+            config.enable_affective_dialog = self._settings["enable_affective_dialog"]
+
+        # Add proactivity configuration to configuration, if provided
+        if self._settings.get("proactivity"):
+            config.proactivity = self._settings["proactivity"]
+
+        # Add VAD configuration to configuration, if provided
+        if self._settings.get("vad"):
+            vad_config = AutomaticActivityDetection()
+            vad_params = self._settings["vad"]
+            has_vad_settings = False
+
+            # Only add parameters that are explicitly set
+            if vad_params.disabled is not None:
+                vad_config.disabled = vad_params.disabled
+                has_vad_settings = True
+
+            if vad_params.start_sensitivity:
+                vad_config.start_of_speech_sensitivity = vad_params.start_sensitivity
+                has_vad_settings = True
+
+            if vad_params.end_sensitivity:
+                vad_config.end_of_speech_sensitivity = vad_params.end_sensitivity
+                has_vad_settings = True
+
+            if vad_params.prefix_padding_ms is not None:
+                vad_config.prefix_padding_ms = vad_params.prefix_padding_ms
+                has_vad_settings = True
+
+            if vad_params.silence_duration_ms is not None:
+                vad_config.silence_duration_ms = vad_params.silence_duration_ms
+                has_vad_settings = True
+
+            # Only add automatic_activity_detection if we have VAD settings
+            if has_vad_settings:
+                config.realtime_input_config = RealtimeInputConfig(
+                    automatic_activity_detection=vad_config
+                )
+
+        # Add system instruction to configuration, if provided
+        system_instruction = getattr(self, "_system_instruction", None) or ""
+        if self._context and hasattr(self._context, "extract_system_instructions"):
+            system_instruction += "\n" + self._context.extract_system_instructions()
+        if system_instruction:
+            logger.debug(f"Setting system instruction: {system_instruction}")
+            config.system_instruction = system_instruction
+
+        # Add tools to configuration, if provided
+        tools = getattr(self, "_tools", None)
+        if tools:
+            logger.debug(f"Setting tools: {tools}")
+            # Manually convert tools to Google format since ToolsSchema doesn't have to_google_tools
+            # and we don't have easy access to the adapter instance here
+            from pipecat.adapters.services.gemini_adapter import GeminiLLMAdapter
+            adapter = GeminiLLMAdapter()
+            config.tools = adapter.to_provider_tools_format(tools)
+
+        return config
+
+    # ── Hand-off on drain ─────────────────────────────────────────────
+
+    async def wait_for_handoff_point(self, timeout: float) -> Optional[str]:
+        """Waits (up to timeout) for the current response to finish; returns the latest resumption handle."""
+        waited_until = time.monotonic() + timeout
+        while self._bot_is_responding and time.monotonic() < waited_until:
+            await asyncio.sleep(0.1)
+        return self.resumption_handle
+
+    # ── Pre-warmed Live session ───────────────────────────────────────
+
+    async def prewarm_connection(self):
+        """Opens the Live session before the pipeline starts; the first connect adopts it.
+
+        The pipeline connects on StartFrame with no context yet, so the config built
+        here is the same one `_connect` would build.
+        """
+        connection = self._client.aio.live.connect(model=self._model_name, config=self._build_live_config())
+        session = await connection.__aenter__()
+        self._prewarmed_connection = (connection, session)
+        logger.info("Pre-warmed Gemini Live session")
+
+    async def release_prewarmed_connection(self):
+        prewarmed, self._prewarmed_connection = self._prewarmed_connection, None
+        if prewarmed:
+            try:
+                await prewarmed[0].__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error closing unused pre-warmed Live session: {e}")
+
+    @asynccontextmanager
+    async def _open_live_session(self, config: LiveConnectConfig):
+        prewarmed, self._prewarmed_connection = self._prewarmed_connection, None
+        if prewarmed is None:
+            async with self._client.aio.live.connect(model=self._model_name, config=config) as session:
+                yield session
+            return
+        connection, session = prewarmed
+        try:
+            yield session
+        finally:
+            await connection.__aexit__(None, None, None)
 
     async def _connection_task_handler(self, config: LiveConnectConfig):
-        async with self._client.aio.live.connect(model=self._model_name, config=config) as session:
+        async with self._open_live_session(config) as session:
             logger.info("Connected to Gemini service")
             self._connection_start_time = time.time()
             await self._handle_session_ready(session)
@@ -525,38 +725,74 @@ class CustomGeminiLiveLLMService(GeminiSessionLoggerMixin, GeminiLiveLLMService)
 
 
 
-async def dynamic_tool_handler(params: FunctionCallParams):
-    logger.info(f"Dynamic tool called: {params.function_name} with args: {params.arguments}")
-    await params.result_callback({"status": "success", "message": f"Tool {params.function_name} called successfully"})
-
-async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str], language: str, system_instruction: Optional[str] = None, tts: bool = True, tts_pace: float = 0.80, tools: Optional[str] = None):
-    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT") or "deep-clock-339817"
-    location = os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
-
+@dataclass
+class LiveSessionConfig:
+    """Everything run_agent_live derives from the connect parameters, compiled once."""
+
+    model: str
+    voice: Optional[str]
+    language: str
+    pipecat_language: Language
+    prompt_text: str
+    tool_specs: List[ToolSpec]
+    tools_schema: ToolsSchema
+    use_external_tts: bool
+    tts_aggregation: str
+    audio_codec: str
+    vad_mode: str
+    gemini_vad: GeminiVADParams
+    resume_handle: Optional[str] = None
+    # Audio bank voice of the acknowledgements played while the reply is slow to start (TEXT modality only)
+    ack_voice: Optional[str] = None
+    # Bot audio released at playback speed through an OutputPacer
+    output_pacing: bool = False
+
+
+LANGUAGE_MAP = {
+    "ar-XA": Language.AR, "bn-IN": Language.BN_IN, "cmn-CN": Language.CMN_CN, "de-DE": Language.DE_DE,
+    "en-US": Language.EN_US, "en-GB": Language.EN_GB, "en-IN": Language.EN_IN, "en-AU": Language.EN_AU,
+    "es-ES": Language.ES_ES, "es-US": Language.ES_US, "fr-FR": Language.FR_FR, "fr-CA": Language.FR_CA,
+    "gu-IN": Language.GU_IN, "hi-IN": Language.HI_IN, "id-ID": Language.ID_ID, "it-IT": Language.IT_IT,
+    "ja-JP": Language.JA_JP, "kn-IN": Language.KN_IN, "ko-KR": Language.KO_KR, "ml-IN": Language.ML_IN,
+    "mr-IN": Language.MR_IN, "nl-NL": Language.NL_NL, "pl-PL": Language.PL_PL, "pt-BR": Language.PT_BR,
+    "ru-RU": Language.RU_RU, "ta-IN": Language.TA_IN, "te-IN": Language.TE_IN, "th-TH": Language.TH_TH,
+    "tr-TR": Language.TR_TR, "vi-VN": Language.VI_VN,
+}
+
+
+def compile_live_config(model: str = "gemini-live-2.5-flash-native-audio", voice: Optional[str] = "Puck", language: str = "en-US", system_instruction: Optional[str] = None, tts: bool = True, tools: Optional[str] = None, tts_aggregation: str = "clause", audio_codec: str = "pcm", vad_mode: Optional[str] = None, vad_start_sensitivity: Optional[str] = None, vad_end_sensitivity: Optional[str] = None, vad_silence_ms: Optional[int] = None, vad_prefix_padding_ms: Optional[int] = None, resume_handle: Optional[str] = None, ack_audio: Optional[bool] = None, output_pacing: Optional[bool] = None, strict: bool = False, **_unused) -> LiveSessionConfig:
+    """Parses and validates the session parameters.
+
+    With strict=False (plain /ws connects) invalid tools and VAD settings are logged and
+    skipped as before; with strict=True (/connect) they raise ValueError instead.
+    """
     gender = "male" if voice == "Custom-Male" else "female"
-    logger.info(f"Starting agent with language: {language}")
-    
     prompt_text = (system_instruction or SYSTEM_PROMPT.replace("female", gender)) + f"\n\nIMPORTANT: You must converse in {language} language."
-    
-    language_map = {
-        "ar-XA": Language.AR, "bn-IN": Language.BN_IN, "cmn-CN": Language.CMN_CN, "de-DE": Language.DE_DE,
-        "en-US": Language.EN_US, "en-GB": Language.EN_GB, "en-IN": Language.EN_IN, "en-AU": Language.EN_AU,
-        "es-ES": Language.ES_ES, "es-US": Language.ES_US, "fr-FR": Language.FR_FR, "fr-CA": Language.FR_CA,
-        "gu-IN": Language.GU_IN, "hi-IN": Language.HI_IN, "id-ID": Language.ID_ID, "it-IT": Language.IT_IT,
-        "ja-JP": Language.JA_JP, "kn-IN": Language.KN_IN, "ko-KR": Language.KO_KR, "ml-IN": Language.ML_IN,
-        "mr-IN": Language.MR_IN, "nl-NL": Language.NL_NL, "pl-PL": Language.PL_PL, "pt-BR": Language.PT_BR,
-        "ru-RU": Language.RU_RU, "ta-IN": Language.TA_IN, "te-IN": Language.TE_IN, "th-TH": Language.TH_TH,
-        "tr-TR": Language.TR_TR, "vi-VN": Language.VI_VN,
-    }
-    pipecat_language = language_map.get(language, Language.EN_US)
-    
-    transport = FastAPIWebsocketTransport(
-        websocket,
-        params=FastAPIWebsocketParams(
-            audio_in_enabled=True, audio_out_enabled=True, add_wav_header=False,
-            vad_analyzer=SileroVADAnalyzer(), serializer=CustomProtobufSerializer(),
-            audio_filter=AICFilter(),
-        )
+    pipecat_language = LANGUAGE_MAP.get(language, Language.EN_US)
+
+    # Per-deployment defaults from the environment, overridable per session
+    vad_mode = vad_mode or os.getenv("LIVE_VAD_MODE", "local")
+    vad_start_sensitivity = vad_start_sensitivity or os.getenv("LIVE_VAD_START_SENSITIVITY")
+    vad_end_sensitivity = vad_end_sensitivity or os.getenv("LIVE_VAD_END_SENSITIVITY")
+    if vad_silence_ms is None and os.getenv("LIVE_VAD_SILENCE_MS"):
+        vad_silence_ms = int(os.getenv("LIVE_VAD_SILENCE_MS"))
+    if vad_prefix_padding_ms is None and os.getenv("LIVE_VAD_PREFIX_PADDING_MS"):
+        vad_prefix_padding_ms = int(os.getenv("LIVE_VAD_PREFIX_PADDING_MS"))
+
+    if vad_mode not in ("local", "server", "hybrid"):
+        if strict:
+            raise ValueError(f"Unknown vad_mode {vad_mode}")
+        logger.warning(f"Unknown vad_mode {vad_mode}, using local")
+        vad_mode = "local"
+
+    # Tuning for Gemini's automatic activity detection; it runs in every mode
+    start_sensitivity_map = {"high": StartSensitivity.START_SENSITIVITY_HIGH, "low": StartSensitivity.START_SENSITIVITY_LOW}
+    end_sensitivity_map = {"high": EndSensitivity.END_SENSITIVITY_HIGH, "low": EndSensitivity.END_SENSITIVITY_LOW}
+    gemini_vad = GeminiVADParams(
+        start_sensitivity=start_sensitivity_map.get((vad_start_sensitivity or "").lower()),
+        end_sensitivity=end_sensitivity_map.get((vad_end_sensitivity or "").lower()),
+        prefix_padding_ms=vad_prefix_padding_ms,
+        silence_duration_ms=vad_silence_ms,
     )
 
     # Dynamic Tool Registration
@@ -576,8 +812,8 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
         },
         required=["is_explicit_request"]
     )]
+    tool_specs = [ToolSpec(name="get_current_time", type="python", callable_name="get_current_time")]
 
-    
     if tools:
         try:
             tools_data = json.loads(tools)
@@ -585,6 +821,13 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
                 for tool in tools_data:
                     # Basic validation
                     if "name" in tool:
+                        try:
+                            tool_specs.append(ToolSpec.from_config(tool))
+                        except ValueError as e:
+                            if strict:
+                                raise
+                            logger.error(f"Skipping dynamic tool: {e}")
+                            continue
                         standard_tools.append(FunctionSchema(
                             name=tool.get("name"),
                             description=tool.get("description", ""),
@@ -592,29 +835,72 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
                             required=tool.get("required", [])
                         ))
         except Exception as e:
+            if strict:
+                raise ValueError(f"Invalid tools: {e}")
             logger.error(f"Failed to parse dynamic tools: {e}")
 
-    tools_schema = ToolsSchema(standard_tools=standard_tools)
-
     use_external_tts = tts or (voice in ["Custom-Male", "Custom-Female"])
+    ack_voice = None
+    if use_external_tts and (ack_audio if ack_audio is not None else ACK_AUDIO):
+        # Same voice as build_live_services picks for the external TTS
+        if voice in ["Custom-Male", "Custom-Female"]:
+            ack_voice = ack_voice_key(voice, "en-US")
+        else:
+            ack_voice = f"{language}-Chirp3-HD-{voice or 'Aoede'}"
+
+    return LiveSessionConfig(
+        model=model,
+        voice=voice,
+        language=language,
+        pipecat_language=pipecat_language,
+        prompt_text=prompt_text,
+        tool_specs=tool_specs,
+        tools_schema=ToolsSchema(standard_tools=standard_tools),
+        use_external_tts=use_external_tts,
+        tts_aggregation=tts_aggregation,
+        audio_codec=audio_codec,
+        vad_mode=vad_mode,
+        gemini_vad=gemini_vad,
+        resume_handle=resume_handle or None,
+        ack_voice=ack_voice,
+        output_pacing=output_pacing if output_pacing is not None else OUTPUT_PACING,
+    )
+
+
+def build_live_services(config: LiveSessionConfig, llm=None):
+    """Creates the Live LLM service (unless given) and, for TEXT modality, the external TTS service."""
+    voice, language = config.voice, config.language
+
     tts_service = None
-    
-    if use_external_tts:
+    if config.use_external_tts:
+        # "clause" flushes the first clause early to cut time-to-first-audio; "sentence" keeps pipecat's default
+        tts_kwargs = {"text_aggregator": ClauseTextAggregator()} if config.tts_aggregation == "clause" else {}
         voice_env = "CLONE_TTS_VOICE_KEY_MALE" if voice == "Custom-Male" else "CLONE_TTS_VOICE_KEY_FEMALE"
         voice_key_path = os.getenv(voice_env) if voice in ["Custom-Male", "Custom-Female"] else None
         
         if voice_key_path:
             with open(voice_key_path, "r") as f: key = f.read()
-            tts_service = GoogleTTSService(voice_cloning_key=key, params=GoogleTTSService.InputParams(language=Language.EN_US))
+            tts_service = LiveGoogleTTSService(voice_cloning_key=key, params=GoogleTTSService.InputParams(language=Language.EN_US), **tts_kwargs)
         else:
             voice_id = voice if voice else "Aoede"
-            tts_service = GoogleTTSService(voice_id=f"{language}-Chirp3-HD-{voice_id}", params=GoogleTTSService.InputParams(language=pipecat_language))
+            tts_service = LiveGoogleTTSService(voice_id=f"{language}-Chirp3-HD-{voice_id}", params=GoogleTTSService.InputParams(language=config.pipecat_language), **tts_kwargs)
+
+    return llm or build_live_llm(config), tts_service
+
 
-    llm_modalities = GeminiModalities.TEXT if use_external_tts else GeminiModalities.AUDIO
+def build_live_llm(config: LiveSessionConfig):
+    """Creates the Live LLM service. Resolving and refreshing its credentials blocks, so it can run in a thread."""
+    project_id = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT") or "deep-clock-339817"
+    location = os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
+    model, voice = config.model, config.voice
+
+    llm_modalities = GeminiModalities.TEXT if config.use_external_tts else GeminiModalities.AUDIO
     
     common_params = {
-        "system_instruction": prompt_text, "tools": tools_schema, "transcribe_model_audio": True,
-        "params": InputParams(language=pipecat_language, modalities=llm_modalities)
+        "system_instruction": config.prompt_text, "tools": config.tools_schema, "transcribe_model_audio": True,
+        "params": InputParams(language=config.pipecat_language, modalities=llm_modalities, vad=config.gemini_vad),
+        # Every function call of a tool_call message runs as its own task
+        "run_in_parallel": True,
     }
 
     if model == "gemini-2.5-flash-native-audio-eap-11-2025":
@@ -627,26 +913,111 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
             "model": f"models/{model}",
             "http_options": HttpOptions(api_version="v1beta")
         }
-        if not use_external_tts:
+        if not config.use_external_tts:
             # Use Zephyr as requested by user for this model
             ai_studio_params["voice_id"] = "Zephyr"
         llm = CustomGeminiLiveLLMService(**ai_studio_params)
     else:
-        vertex_params = {**common_params, "project_id": project_id, "location": location, "model": f"google/{model}"}
+        # New sessions go to the fastest healthy Live region
+        live_location = get_endpoint_manager().select("live", location)
+        vertex_params = {**common_params, "project_id": project_id, "location": live_location, "model": f"google/{model}"}
         if os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
             vertex_params["credentials_path"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if not use_external_tts and voice:
+        if not config.use_external_tts and voice:
             vertex_params["voice_id"] = voice
         llm = CustomGeminiLiveVertexLLMService(**vertex_params)
 
-    llm.register_function("get_current_time", get_current_time)
-    
-    # Register generic handler for dynamic tools
-    for tool in standard_tools:
-        if tool.name != "get_current_time":
-            llm.register_function(tool.name, dynamic_tool_handler)
+    if config.resume_handle:
+        # Continues a session handed off by a draining instance
+        llm.resumption_handle = config.resume_handle
+
+    return llm
+
+
+async def prewarm_live_session(config: LiveSessionConfig):
+    """Builds the services and opens the Live session ahead of the websocket."""
+    # The LLM's credential setup runs in a thread; the gRPC TTS client binds to the running loop
+    llm, tts_service = build_live_services(config, llm=await asyncio.to_thread(build_live_llm, config))
+    try:
+        await llm.prewarm_connection()
+    except Exception as e:
+        # The pipeline will simply connect on start as usual
+        logger.warning(f"Could not pre-warm Gemini Live session: {e}")
+    return llm, tts_service
+
+
+async def release_live_session(services):
+    llm, _ = services
+    await llm.release_prewarmed_connection()
+
 
-    context_aggregator = llm.create_context_aggregator(OpenAILLMContext())
+async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str], language: str, system_instruction: Optional[str] = None, tts: bool = True, tts_pace: float = 0.80, tools: Optional[str] = None, session_id: Optional[str] = None, tts_aggregation: str = "clause", audio_codec: str = "pcm", vad_mode: Optional[str] = None, vad_start_sensitivity: Optional[str] = None, vad_end_sensitivity: Optional[str] = None, vad_silence_ms: Optional[int] = None, vad_prefix_padding_ms: Optional[int] = None, resume_handle: Optional[str] = None, ack_audio: Optional[bool] = None, output_pacing: Optional[bool] = None, recorder: Optional[SessionRecorder] = None, prepared: Optional[PreparedSession] = None, registered: Optional[RegisteredSession] = None):
+    services = None
+    if prepared:
+        # Compiled (and usually warmed) by /connect
+        config = prepared.config
+        services = await prepared.take_resources()
+    else:
+        config = compile_live_config(
+            model=model, voice=voice, language=language, system_instruction=system_instruction, tts=tts,
+            tools=tools, tts_aggregation=tts_aggregation, audio_codec=audio_codec, vad_mode=vad_mode,
+            vad_start_sensitivity=vad_start_sensitivity, vad_end_sensitivity=vad_end_sensitivity,
+            vad_silence_ms=vad_silence_ms, vad_prefix_padding_ms=vad_prefix_padding_ms,
+            resume_handle=resume_handle, ack_audio=ack_audio, output_pacing=output_pacing,
+        )
+    llm, tts_service = services or build_live_services(config)
+    vad_mode = config.vad_mode
+    logger.info(f"Starting agent with language: {config.language}")
+    logger.info(f"VAD mode: {vad_mode}")
+
+    serializer = CustomProtobufSerializer(audio_codec=config.audio_codec)
+    serializer.recorder = recorder
+    transport = FastAPIWebsocketTransport(
+        websocket,
+        params=FastAPIWebsocketParams(
+            audio_in_enabled=True, audio_out_enabled=True, add_wav_header=False,
+            vad_analyzer=None if vad_mode == "server" else create_vad_analyzer(),
+            serializer=serializer,
+            audio_filter=AICFilter(),
+        )
+    )
+    attach_opus_tail_flush(transport.output(), serializer)
+
+    tracer = start_session_trace(session_id or str(id(websocket)), "gemini-live")
+    llm._tracer = tracer
+    llm._vad_mode = vad_mode
+    serializer.tracer = tracer
+    if tts_service:
+        tts_service._tracer = tracer
+    # Fills the silence before a slow reply; absent when off or when the bank has no clips for the voice
+    ack_stage = []
+    ack_clips = get_ack_bank().clips_for(config.ack_voice) if config.ack_voice else []
+    if ack_clips:
+        ack_player = AckAudioPlayer(ack_clips)
+        ack_player._tracer = tracer
+        ack_stage = [ack_player]
+    # Every conversion of the session's bot audio goes through one resampler
+    resamplers = SessionResamplers(session_id) if SESSION_RESAMPLING else None
+    if resamplers:
+        attach_output_resampler(transport.output(), resamplers.stream("output"))
+    # Keeps only a small lead of bot audio on the client, so barge-in stops it quickly
+    pacer_stage = []
+    if config.output_pacing:
+        pacer = OutputPacer()
+        pacer._tracer = tracer
+        serializer.pacer = pacer
+        pacer_stage = [pacer]
+    llm._recorder = recorder
+    llm._registered = registered
+
+    # All tools, including get_current_time, execute through the session's tool engine
+    tool_engine = ToolEngine(tracer=tracer)
+    for spec in config.tool_specs:
+        tool_engine.add_tool(spec)
+        llm.register_function(spec.name, tool_engine.handle)
+
+    context = OpenAILLMContext()
+    context_aggregator = llm.create_context_aggregator(context)
 
     async def handle_user_idle(processor: UserIdleProcessor, retry_count: int) -> bool:
         logger.info(f"User idle detected, retry count: {retry_count}")
@@ -668,6 +1039,8 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
         context_aggregator.user(),
         llm,
         *([tts_service] if tts_service else []),
+        *ack_stage,
+        *pacer_stage,
         transport.output(),
         context_aggregator.assistant(),
     ])
@@ -677,7 +1050,7 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
         enable_usage_metrics=True,
     ))
     
-    task.add_observer(WhiskerObserver(pipeline))
+    add_pipeline_observers(task, pipeline)
 
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, client):
@@ -689,4 +1062,34 @@ async def run_agent_live(websocket: WebSocket, model: str, voice: Optional[str],
         logger.info("Pipecat Client disconnected")
         await task.cancel()
 
-    await PipelineRunner(handle_sigint=False).run(task)
+    async def on_drain(remaining: float):
+        # Let the current answer finish, then tell the client where to pick the conversation up
+        deadline = time.monotonic() + remaining
+        resume_handle = await llm.wait_for_handoff_point(max(remaining - DRAIN_HANDOFF_MARGIN_SECONDS, 0.0))
+        tracer.record("drain_handoff", {"resumable": bool(resume_handle)})
+        message = drain_message(resume_handle, max(deadline - time.monotonic(), 0.0), session_id=session_id,
+                                resume_secret=registered.resume_secret if registered else None)
+        await task.queue_frames([OutputTransportMessageFrame(message=message)])
+
+    async def on_memory_limit(reason: str):
+        # Queued behind what is already on its way, so the current answer still finishes
+        await task.queue_frames([OutputTransportMessageFrame(message=session_limit_message(reason)), EndFrame()])
+
+    drain_id = session_id or str(id(websocket))
+    memory = SessionMemory(drain_id, on_limit=on_memory_limit)
+    memory._tracer = tracer
+    memory.track_context(context)
+    memory.track_pipeline(pipeline)
+    memory.track_text(llm, "_post_interruption_buffer")
+    get_drain_controller().register(drain_id, on_drain)
+    memory.start()
+    try:
+        await PipelineRunner(handle_sigint=False).run(task)
+    except Exception as e:
+        tracer.record("error", {"error": str(e)})
+        tracer.dump(reason="error")
+        raise
+    finally:
+        memory.stop()
+        get_drain_controller().unregister(drain_id)
+        finish_session_trace(tracer)
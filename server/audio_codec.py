@@ -0,0 +1,264 @@
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from loguru import logger
+
+import pipecat.frames.protobufs.frames_pb2 as frame_protos
+from pipecat.frames.frames import (BotStoppedSpeakingFrame, Frame, InputAudioRawFrame, InputTransportMessageFrame,
+                                   OutputAudioRawFrame, OutputTransportMessageFrame,
+                                   OutputTransportMessageUrgentFrame, TTSStoppedFrame)
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.serializers.protobuf import ProtobufFrameSerializer
+
+from output_pacing import PACE_PONG_MESSAGE, PLAYBACK_REPORT_MESSAGE
+from session_recorder import REC_INBOUND, REC_OUTBOUND
+
+# Audio frames carrying Opus instead of PCM are tagged with this name in the protobuf
+# AudioRawFrame, in both directions, so PCM and Opus frames can never be confused.
+OPUS_FRAME_NAME = "opus"
+OPUS_FRAME_MS = 20
+OPUS_BITRATE = int(os.getenv("OPUS_BITRATE", "24000"))
+# RTVI client message the browser sends when bot audio starts playing after silence
+PLAYBACK_START_MESSAGE = "playback_start"
+
+
+def opus_available() -> bool:
+    """True when opuslib and the native libopus it wraps can be loaded."""
+    try:
+        import opuslib  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def pack_opus_packets(packets: List[bytes]) -> bytes:
+    """Concatenates Opus packets, each prefixed with its 2-byte big-endian length."""
+    return b"".join(struct.pack(">H", len(p)) + p for p in packets)
+
+
+def unpack_opus_packets(data: bytes) -> List[bytes]:
+    packets = []
+    offset = 0
+    while offset + 2 <= len(data):
+        (size,) = struct.unpack_from(">H", data, offset)
+        offset += 2
+        packets.append(data[offset:offset + size])
+        offset += size
+    return packets
+
+
+class OpusStreamEncoder:
+    """Encodes a PCM stream of arbitrary chunk sizes into 20 ms Opus packets."""
+
+    def __init__(self, sample_rate: int, num_channels: int = 1):
+        import opuslib
+
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self._encoder = opuslib.Encoder(sample_rate, num_channels, opuslib.APPLICATION_VOIP)
+        self._encoder.bitrate = OPUS_BITRATE
+        self._samples_per_frame = sample_rate * OPUS_FRAME_MS // 1000
+        self._bytes_per_frame = self._samples_per_frame * num_channels * 2
+        self._pending = bytearray()
+
+    def encode(self, pcm: bytes) -> bytes:
+        self._pending.extend(pcm)
+        packets = []
+        while len(self._pending) >= self._bytes_per_frame:
+            chunk = bytes(self._pending[:self._bytes_per_frame])
+            del self._pending[:self._bytes_per_frame]
+            packets.append(self._encoder.encode(chunk, self._samples_per_frame))
+        return pack_opus_packets(packets) if packets else b""
+
+    def padding(self) -> bytes:
+        """Silence completing the partial frame held back, so the end of a response can be encoded."""
+        if not self._pending:
+            return b""
+        return b"\x00" * (self._bytes_per_frame - len(self._pending))
+
+    def reset(self):
+        self._pending.clear()
+
+
+class OpusStreamDecoder:
+    def __init__(self, sample_rate: int, num_channels: int = 1):
+        import opuslib
+
+        self._decoder = opuslib.Decoder(sample_rate, num_channels)
+        # Largest Opus frame (120 ms), so any packet the client sends fits
+        self._max_samples = sample_rate * 120 // 1000
+        self.errors = 0
+
+    def decode(self, data: bytes) -> bytes:
+        pcm = []
+        for packet in unpack_opus_packets(data):
+            try:
+                pcm.append(self._decoder.decode(packet, self._max_samples))
+            except Exception as e:
+                # A malformed packet is dropped; the rest of the stream still decodes
+                if not self.errors:
+                    logger.warning(f"Dropping malformed Opus packet ({len(packet)} bytes): {e}")
+                self.errors += 1
+        return b"".join(pcm)
+
+
+def attach_opus_tail_flush(output, serializer: "CodecProtobufSerializer"):
+    """Makes an output transport flush the serializer's partial Opus frame when bot audio ends.
+
+    The output transport pushes TTSStoppedFrame and BotStoppedSpeakingFrame downstream only
+    after the audio queued before them has been written, so the tail is padded to a full
+    frame and sent right behind the response instead of being prepended to the next one.
+    """
+    push_frame = output.push_frame
+
+    async def push_frame_flushing_tail(frame: Frame, direction: FrameDirection = FrameDirection.DOWNSTREAM):
+        if direction == FrameDirection.DOWNSTREAM and isinstance(frame, (TTSStoppedFrame, BotStoppedSpeakingFrame)):
+            tail = serializer.audio_tail()
+            if tail:
+                await output.write_audio_frame(tail)
+        await push_frame(frame, direction)
+
+    output.push_frame = push_frame_flushing_tail
+
+
+class CodecProtobufSerializer(ProtobufFrameSerializer):
+    """Protobuf serializer that can carry audio as Opus instead of raw 16-bit PCM.
+
+    With audio_codec="opus", outbound bot audio is encoded into 20 ms Opus packets and
+    inbound frames tagged as Opus are decoded back to PCM before entering the pipeline.
+
+    Outbound audio and messages, nearly all of the traffic, skip the generic serializer
+    (a dataclass walk and a new protobuf per frame): each has one protobuf reused for the
+    whole session, where only the payload changes. Audio frames carry just the audio,
+    sample rate and channel count, which is all the client reads. Messages are encoded
+    with orjson. The bytes on the wire decode exactly as before.
+    """
+
+    def __init__(self, audio_codec: str = "pcm"):
+        super().__init__()
+        if audio_codec == "opus" and not opus_available():
+            logger.warning("Opus requested but opuslib/libopus is unavailable, falling back to PCM")
+            audio_codec = "pcm"
+        self._audio_codec = audio_codec
+        self._encoder: Optional[OpusStreamEncoder] = None
+        self._decoders: Dict[int, OpusStreamDecoder] = {}
+        # Optional SessionRecorder capturing the serialized traffic in both directions
+        self.recorder = None
+        # Optional SessionTracer; the serializer sees the first audio written by transport.output()
+        # and the client's playback report, so it marks both turn stages
+        self.tracer = None
+        # Optional OutputPacer, fed the client's RTT probe replies and playback reports
+        self.pacer = None
+        # Reused for every outbound frame of their kind; see _serialize_audio/_serialize_message
+        self._audio_proto = frame_protos.Frame()
+        if audio_codec == "opus":
+            self._audio_proto.audio.name = OPUS_FRAME_NAME
+        self._message_proto = frame_protos.Frame()
+
+    def reset_audio(self):
+        """Drops partially encoded bot audio, e.g. after an interruption."""
+        if self._encoder:
+            self._encoder.reset()
+
+    def audio_tail(self) -> Optional[OutputAudioRawFrame]:
+        """Silence that, written after the last bot audio, flushes the partial Opus frame still held back."""
+        padding = self._encoder.padding() if self._encoder else b""
+        if not padding:
+            return None
+        return OutputAudioRawFrame(padding, sample_rate=self._encoder.sample_rate,
+                                   num_channels=self._encoder.num_channels)
+
+    async def serialize(self, frame: Frame) -> str | bytes | None:
+        data = await self._serialize(frame)
+        if data and self.tracer and isinstance(frame, OutputAudioRawFrame):
+            self.tracer.mark("first_audio_out")
+        if data and self.recorder:
+            self.recorder.record(REC_OUTBOUND, data.encode("utf-8") if isinstance(data, str) else data)
+        return data
+
+    async def _serialize(self, frame: Frame) -> str | bytes | None:
+        # Exact types, as in ProtobufFrameSerializer.SERIALIZABLE_TYPES
+        if type(frame) is OutputAudioRawFrame:
+            return self._serialize_audio(frame)
+        if isinstance(frame, (OutputTransportMessageFrame, OutputTransportMessageUrgentFrame)):
+            return self._serialize_message(frame.message)
+        return await super().serialize(frame)
+
+    def _serialize_audio(self, frame: OutputAudioRawFrame) -> bytes | None:
+        audio = frame.audio
+        if self._audio_codec == "opus":
+            if not self._encoder or self._encoder.sample_rate != frame.sample_rate:
+                self._encoder = OpusStreamEncoder(frame.sample_rate, frame.num_channels)
+            audio = self._encoder.encode(audio)
+            if not audio:
+                return None
+        proto = self._audio_proto.audio
+        if proto.sample_rate != frame.sample_rate or proto.num_channels != frame.num_channels:
+            proto.sample_rate = frame.sample_rate
+            proto.num_channels = frame.num_channels
+        proto.audio = audio
+        return self._audio_proto.SerializeToString()
+
+    def _serialize_message(self, message: Any) -> bytes:
+        try:
+            data = orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            # Something orjson can't encode natively; json.dumps is what the generic path uses
+            data = json.dumps(message).encode("utf-8")
+        self._message_proto.message.data = data.decode("utf-8")
+        return self._message_proto.SerializeToString()
+
+    async def deserialize(self, data: str | bytes) -> Frame | None:
+        if self.recorder:
+            self.recorder.record(REC_INBOUND, data.encode("utf-8") if isinstance(data, str) else data)
+        if self._audio_codec == "opus":
+            proto = frame_protos.Frame.FromString(data)
+            if proto.WhichOneof("frame") == "audio" and proto.audio.name == OPUS_FRAME_NAME:
+                sample_rate = proto.audio.sample_rate
+                decoder = self._decoders.get(sample_rate)
+                if decoder is None:
+                    decoder = self._decoders[sample_rate] = OpusStreamDecoder(sample_rate)
+                audio = decoder.decode(proto.audio.audio)
+                if not audio:
+                    return None
+                return InputAudioRawFrame(
+                    audio=audio,
+                    sample_rate=sample_rate,
+                    num_channels=proto.audio.num_channels or 1,
+                )
+        frame = await super().deserialize(data)
+        if not isinstance(frame, InputTransportMessageFrame):
+            return frame
+        message = self._client_message(frame.message)
+        if not message:
+            return frame
+        kind, payload = message
+        if kind == PLAYBACK_START_MESSAGE:
+            if self.tracer:
+                self.tracer.mark("playback_start")
+            return None
+        if kind == PACE_PONG_MESSAGE:
+            if self.pacer:
+                self.pacer.on_pong(float(payload.get("ts", 0)))
+            return None
+        if kind == PLAYBACK_REPORT_MESSAGE:
+            if self.pacer:
+                self.pacer.on_playback_report(int(payload.get("epoch", 0)), float(payload.get("played_ms", 0)),
+                                              float(payload.get("buffered_ms", 0)))
+            return None
+        return frame
+
+    @staticmethod
+    def _client_message(message) -> Optional[Tuple[str, dict]]:
+        """(t, d) of an RTVI client-message, or None for anything else."""
+        if not isinstance(message, dict) or message.get("type") != "client-message":
+            return None
+        data = message.get("data")
+        if not isinstance(data, dict):
+            return None
+        payload = data.get("d")
+        return data.get("t"), payload if isinstance(payload, dict) else {}
@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, List
+
+from loguru import logger
+
+# Bot types this instance serves; the others are never imported
+ENABLED_BOT_TYPES = [b.strip() for b in os.getenv("ENABLED_BOT_TYPES", "gemini-live,tts-llm-stt").split(",") if b.strip()]
+# Import the enabled bot modules (and load the VAD model) in lifespan, before serving traffic
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+# Startup above this many milliseconds is logged as a warning (0 disables the check)
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "0"))
+
+BOT_MODULES = {
+    "gemini-live": "agent_live",
+    "tts-llm-stt": "agent",
+}
+
+_lock = threading.Lock()
+_import_profile: List[Dict[str, Any]] = []
+_patched = False
+
+
+def _apply_library_patches():
+    """Patches for third-party bugs, applied once before the first bot module is imported."""
+    global _patched
+    if _patched:
+        return
+    _patched = True
+
+    import websockets
+
+    # The GeminiMultimodalLiveLLMService uses the 'websockets' library but doesn't import it.
+    # This patch injects the websockets module into the library's namespace.
+    import pipecat.services.gemini_multimodal_live.gemini
+    pipecat.services.gemini_multimodal_live.gemini.websockets = websockets
+
+    # Monkey-patch for google-genai BaseApiClient to fix AttributeError in aclose
+    from google.genai._api_client import BaseApiClient
+
+    async def patched_aclose(self):
+        if hasattr(self, '_async_httpx_client') and self._async_httpx_client:
+            try:
+                await self._async_httpx_client.aclose()
+            except Exception:
+                pass
+        if hasattr(self, '_aiohttp_session') and self._aiohttp_session:
+            try:
+                await self._aiohttp_session.close()
+            except Exception:
+                pass
+
+    BaseApiClient.aclose = patched_aclose
+
+
+def _timed(step: str, fn) -> Any:
+    modules_before = len(sys.modules)
+    started = time.perf_counter()
+    result = fn()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _import_profile.append({
+        "step": step,
+        "ms": round(elapsed_ms, 1),
+        "modules_loaded": len(sys.modules) - modules_before,
+    })
+    logger.info(f"Startup: {step} took {elapsed_ms:.0f}ms")
+    return result
+
+
+def load_bot_module(bot_type: str) -> ModuleType:
+    """Imports (once) and returns the module implementing a bot type. Blocking."""
+    if bot_type not in BOT_MODULES:
+        raise ValueError(f"Unknown bot_type {bot_type}")
+    if bot_type not in ENABLED_BOT_TYPES:
+        raise ValueError(f"bot_type {bot_type} is not enabled on this instance")
+    name = BOT_MODULES[bot_type]
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        if name not in sys.modules:
+            if not _patched:
+                _timed("library patches", _apply_library_patches)
+            _timed(f"import {name} ({bot_type})", lambda: importlib.import_module(name))
+    return sys.modules[name]
+
+
+async def get_bot_module(bot_type: str) -> ModuleType:
+    """load_bot_module that keeps a cold import off the event loop."""
+    module = sys.modules.get(BOT_MODULES.get(bot_type, ""))
+    if module is not None and bot_type in ENABLED_BOT_TYPES:
+        return module
+    return await asyncio.to_thread(load_bot_module, bot_type)
+
+
+def warm_up():
+    """Preloads the enabled bot modules and the shared VAD model. Blocking; run in a thread."""
+    for bot_type in ENABLED_BOT_TYPES:
+        try:
+            load_bot_module(bot_type)
+        except Exception as e:
+            logger.error(f"Warm-up of {bot_type} failed: {e}")
+    from vad_batcher import VAD_BATCHING, get_vad_scheduler
+
+    if VAD_BATCHING:
+        _timed("load Silero VAD model", get_vad_scheduler().preload)
+
+
+def check_startup_budget(startup_ms: float):
+    _import_profile.append({"step": "total startup", "ms": round(startup_ms, 1)})
+    if STARTUP_BUDGET_MS and startup_ms > STARTUP_BUDGET_MS:
+        logger.warning(f"Startup took {startup_ms:.0f}ms, over the {STARTUP_BUDGET_MS:.0f}ms budget: {_import_profile}")
+    else:
+        logger.info(f"Startup took {startup_ms:.0f}ms")
+
+
+def startup_report() -> Dict[str, Any]:
+    return {
+        "enabled_bot_types": ENABLED_BOT_TYPES,
+        "loaded_bot_types": [b for b, m in BOT_MODULES.items() if m in sys.modules],
+        "warmup": STARTUP_WARMUP,
+        "budget_ms": STARTUP_BUDGET_MS or None,
+        "profile": list(_import_profile),
+    }
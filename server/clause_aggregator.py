@@ -0,0 +1,79 @@
+import re
+from typing import Optional
+
+from pipecat.utils.text.base_text_aggregator import BaseTextAggregator
+
+# Danda, double danda, !, ?, ellipsis and em-dash always end a clause. Latin '.', ',', ';', ':'
+# and the Arabic comma only count when followed by whitespace, so "1,000" or "2.5" never split.
+CLAUSE_END_RE = re.compile(r"[।॥!?…—]|[.,;:،](?=\s)|\n")
+SENTENCE_END_RE = re.compile(r"[।॥!?…]|\.(?=\s)|\n")
+
+
+class ClauseTextAggregator(BaseTextAggregator):
+    """Adaptive TTS text aggregator that trades chunk size for time-to-first-audio.
+
+    The first chunk of every response is flushed as soon as a clause ends (comma, danda,
+    etc.) or `first_max_words` words have arrived, so TTS can start speaking early. Later
+    chunks wait for a sentence boundary with at least `min_chars` characters, which gives
+    the TTS engine enough context for natural prosody. Text longer than `max_chars`
+    without a sentence boundary is flushed at the last clause boundary instead.
+    """
+
+    def __init__(
+        self,
+        *,
+        first_min_chars: int = 6,
+        first_max_words: int = 6,
+        min_chars: int = 60,
+        max_chars: int = 250,
+    ):
+        self._text = ""
+        self._first_flushed = False
+        self._first_min_chars = first_min_chars
+        self._first_max_words = first_max_words
+        self._min_chars = min_chars
+        self._max_chars = max_chars
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    async def aggregate(self, text: str) -> Optional[str]:
+        self._text += text
+        if not self._first_flushed:
+            end = self._first_clause_end()
+        else:
+            end = self._last_boundary(SENTENCE_END_RE, self._min_chars)
+            if not end and len(self._text) > self._max_chars:
+                end = self._last_boundary(CLAUSE_END_RE, 1)
+
+        if not end:
+            return None
+        result = self._text[:end]
+        self._text = self._text[end:]
+        self._first_flushed = True
+        return result
+
+    def _first_clause_end(self) -> int:
+        for match in CLAUSE_END_RE.finditer(self._text):
+            if len(self._text[:match.end()].strip()) >= self._first_min_chars:
+                return match.end()
+
+        # No clause boundary yet: flush on word count, cutting at the last complete word
+        if len(self._text.split()) > self._first_max_words:
+            return self._text.rstrip().rfind(" ") + 1
+        return 0
+
+    def _last_boundary(self, pattern: re.Pattern, min_chars: int) -> int:
+        end = 0
+        for match in pattern.finditer(self._text):
+            end = match.end()
+        return end if end >= min_chars else 0
+
+    async def handle_interruption(self):
+        self._text = ""
+        self._first_flushed = False
+
+    async def reset(self):
+        self._text = ""
+        self._first_flushed = False
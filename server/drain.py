@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from loguru import logger
+
+# SIGTERM starts a drain instead of an immediate shutdown (Cloud Run sends SIGKILL 10s later)
+DRAIN_ON_SIGTERM = os.getenv("DRAIN_ON_SIGTERM", "true").lower() == "true"
+# In-flight sessions keep running at most this long after SIGTERM
+DRAIN_DEADLINE_SECONDS = float(os.getenv("DRAIN_DEADLINE_SECONDS", "8"))
+# The hand-off hint goes out at the latest this long before the deadline, so the client has time to reconnect
+DRAIN_HANDOFF_MARGIN_SECONDS = float(os.getenv("DRAIN_HANDOFF_MARGIN_SECONDS", "3"))
+
+DRAIN_MESSAGE = "drain"
+
+
+def drain_message(resume_handle: Optional[str], deadline_seconds: float, session_id: Optional[str] = None,
+                  resume_secret: Optional[str] = None) -> Dict[str, Any]:
+    """RTVI server-message telling the client to reconnect through /connect (and resume, if it can).
+
+    `session_id` and `resume_secret` let the client reconnect with resume_session, picking the
+    session's params and latest resumption handle up from the session registry on whichever
+    instance it lands.
+    """
+    return {
+        "label": "rtvi-ai",
+        "type": "server-message",
+        "data": {
+            "type": DRAIN_MESSAGE,
+            "reconnect": True,
+            "resume_handle": resume_handle,
+            "session_id": session_id,
+            "resume_secret": resume_secret,
+            "deadline_ms": round(deadline_seconds * 1000),
+        },
+    }
+
+
+class DrainController:
+    """Tracks the sessions of this instance and winds them down on shutdown.
+
+    Sessions register a hand-off callback when their pipeline starts. `drain()` flips the
+    instance into draining mode (no new sessions), calls every callback with the time
+    left, and waits until the sessions have ended or the deadline has passed.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Callable[[float], Awaitable[None]]] = {}
+        # Running hand-offs; the loop only keeps weak references to tasks
+        self._handoffs: Set[asyncio.Task] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._drain_started: Optional[float] = None
+        self._handoffs_sent = 0
+
+    @property
+    def draining(self) -> bool:
+        return self._drain_started is not None
+
+    def register(self, session_id: str, on_drain: Callable[[float], Awaitable[None]]):
+        self._sessions[session_id] = on_drain
+        self._idle.clear()
+        if self.draining:
+            # Raced with the drain; hand it off right away
+            remaining = DRAIN_DEADLINE_SECONDS - (time.monotonic() - self._drain_started)
+            self._start_hand_off(session_id, on_drain, max(remaining, 0.0))
+
+    def unregister(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        if not self._sessions:
+            self._idle.set()
+
+    def _start_hand_off(self, session_id: str, on_drain: Callable[[float], Awaitable[None]], remaining: float):
+        task = asyncio.create_task(self._hand_off(session_id, on_drain, remaining))
+        self._handoffs.add(task)
+        task.add_done_callback(self._handoffs.discard)
+
+    async def _hand_off(self, session_id: str, on_drain: Callable[[float], Awaitable[None]], remaining: float):
+        try:
+            await on_drain(remaining)
+            self._handoffs_sent += 1
+        except Exception as e:
+            logger.warning(f"Hand-off of session {session_id} failed: {e}")
+
+    async def drain(self, deadline_seconds: float = DRAIN_DEADLINE_SECONDS):
+        if self.draining:
+            return
+        self._drain_started = time.monotonic()
+        logger.warning(f"Draining: {len(self._sessions)} active session(s), deadline {deadline_seconds:.0f}s")
+        for session_id, on_drain in list(self._sessions.items()):
+            self._start_hand_off(session_id, on_drain, deadline_seconds)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=deadline_seconds)
+            logger.info(f"Drained in {(time.monotonic() - self._drain_started) * 1000:.0f}ms")
+        except asyncio.TimeoutError:
+            logger.warning(f"Drain deadline passed with {len(self._sessions)} session(s) still active")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "active_sessions": len(self._sessions),
+            "handoffs_sent": self._handoffs_sent,
+            "draining_for_seconds": round(time.monotonic() - self._drain_started, 1) if self.draining else None,
+        }
+
+
+_controller: Optional[DrainController] = None
+
+
+def get_drain_controller() -> DrainController:
+    global _controller
+    if _controller is None:
+        _controller = DrainController()
+    return _controller
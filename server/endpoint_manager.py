@@ -0,0 +1,337 @@
+import asyncio
+import os
+import ssl
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from percentiles import median
+
+# Route new sessions to the fastest healthy region per service; opt-in, like LLM_ROUTING
+REGION_ROUTING = os.getenv("REGION_ROUTING", "false").lower() == "true"
+# Candidate locations per service besides the default one (GCP_LOCATION; "us" for STT, which uses the Speech v2 multi-regions)
+REGION_CANDIDATES = {
+    "live": os.getenv("REGION_CANDIDATES_LIVE", "us-central1,us-east4,europe-west4"),
+    "llm": os.getenv("REGION_CANDIDATES_LLM", "us-central1,us-east4,europe-west4"),
+    "stt": os.getenv("REGION_CANDIDATES_STT", "us,eu"),
+    "tts": os.getenv("REGION_CANDIDATES_TTS", "us-central1,us-east4,europe-west4"),
+}
+# "network": TLS handshakes with the regional endpoints; "local": simulated probes from REGION_LOCAL_PROFILE, no network
+REGION_PROBE_MODE = os.getenv("REGION_PROBE_MODE", "network")
+# Local mode: "us-central1=40,europe-west4=120,llm@us-east4=fail" (ms or "fail"; service@ overrides one service)
+REGION_LOCAL_PROFILE = os.getenv("REGION_LOCAL_PROFILE", "")
+REGION_PROBE_INTERVAL_SECONDS = float(os.getenv("REGION_PROBE_INTERVAL_SECONDS", "30"))
+REGION_PROBE_TIMEOUT_SECONDS = float(os.getenv("REGION_PROBE_TIMEOUT_SECONDS", "2"))
+# Probe latencies kept per endpoint; endpoints are ranked by their median
+REGION_LATENCY_WINDOW = int(os.getenv("REGION_LATENCY_WINDOW", "10"))
+# Another region has to be this much faster before new sessions move to it
+REGION_SWITCH_MARGIN_MS = float(os.getenv("REGION_SWITCH_MARGIN_MS", "20"))
+# A breaker opens after this many failures in a row, or at this error rate once the window has enough outcomes
+REGION_BREAKER_FAILURES = int(os.getenv("REGION_BREAKER_FAILURES", "3"))
+REGION_BREAKER_ERROR_RATE = float(os.getenv("REGION_BREAKER_ERROR_RATE", "0.5"))
+REGION_BREAKER_MIN_SAMPLES = int(os.getenv("REGION_BREAKER_MIN_SAMPLES", "6"))
+REGION_ERROR_WINDOW_SECONDS = float(os.getenv("REGION_ERROR_WINDOW_SECONDS", "300"))
+# An open breaker lets the next probe through (half-open) after this long
+REGION_BREAKER_COOLDOWN_SECONDS = float(os.getenv("REGION_BREAKER_COOLDOWN_SECONDS", "60"))
+
+# Latency of local-mode probes for locations REGION_LOCAL_PROFILE doesn't mention
+_LOCAL_DEFAULT_MS = 100.0
+_DECISION_HISTORY = 200
+
+
+def default_location(service: str) -> str:
+    """Location a service uses without routing: GCP_LOCATION, or the "us" multi-region for STT."""
+    if service == "stt":
+        return "us"
+    return os.getenv("GCP_LOCATION") or os.getenv("GOOGLE_CLOUD_LOCATION") or "us-central1"
+
+
+def endpoint_host(service: str, location: str) -> str:
+    """Hostname serving a service in a location (Live, LLM and Gemini TTS all go through Vertex AI)."""
+    if service == "stt":
+        return "speech.googleapis.com" if location == "global" else f"{location}-speech.googleapis.com"
+    return "aiplatform.googleapis.com" if location == "global" else f"{location}-aiplatform.googleapis.com"
+
+
+def parse_local_profile(spec: str) -> Dict[Tuple[Optional[str], str], Optional[float]]:
+    """"us-central1=40,llm@us-east4=fail" -> {(None, "us-central1"): 40.0, ("llm", "us-east4"): None}."""
+    profile = {}
+    for item in spec.split(","):
+        key, _, value = item.strip().partition("=")
+        if not key or not value:
+            continue
+        service, _, location = key.rpartition("@")
+        profile[(service or None, location)] = None if value.strip() == "fail" else float(value)
+    return profile
+
+
+class CircuitBreaker:
+    """Closed: routable. Open: skipped until the cooldown has passed. Half-open: the next outcome decides."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.outcomes: Deque[Tuple[float, bool]] = deque()
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def _prune(self, now: float):
+        cutoff = now - REGION_ERROR_WINDOW_SECONDS
+        while self.outcomes and self.outcomes[0][0] < cutoff:
+            self.outcomes.popleft()
+
+    def error_rate(self, now: float) -> Optional[float]:
+        self._prune(now)
+        if not self.outcomes:
+            return None
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+    def record(self, ok: bool, now: float) -> Optional[str]:
+        """Adds an outcome; returns the new state if it changed."""
+        if self.state == self.OPEN:
+            if now - self.opened_at < REGION_BREAKER_COOLDOWN_SECONDS:
+                return None
+            self.state = self.HALF_OPEN
+        self.outcomes.append((now, ok))
+        if ok:
+            self.consecutive_failures = 0
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                # Start over, so the failures that tripped it don't trip it again
+                self.outcomes.clear()
+                return self.CLOSED
+            return None
+        self.consecutive_failures += 1
+        rate = self.error_rate(now)
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= REGION_BREAKER_FAILURES or \
+                (len(self.outcomes) >= REGION_BREAKER_MIN_SAMPLES and rate >= REGION_BREAKER_ERROR_RATE):
+            self.state = self.OPEN
+            self.opened_at = now
+            self.trips += 1
+            return self.OPEN
+        return None
+
+
+class _Endpoint:
+    def __init__(self):
+        self.latency: Deque[float] = deque(maxlen=REGION_LATENCY_WINDOW)
+        self.breaker = CircuitBreaker()
+        self.last_error: Optional[str] = None
+        self.probed_at: Optional[float] = None
+
+    @property
+    def median(self) -> Optional[float]:
+        return median(list(self.latency))
+
+
+class EndpointManager:
+    """Picks the location of each service (Live, LLM, STT, TTS) for new sessions.
+
+    Every candidate location is probed in the background: a TLS handshake with its
+    regional endpoint, or a simulated probe in local mode. Probe latencies rank the
+    locations, and probe failures plus the errors sessions report (record_failure) feed
+    a circuit breaker per service and location. New sessions go to the lowest-latency
+    location whose breaker is closed. They only move when another one is faster by the
+    switch margin, and they stay on the default location until anything has been
+    measured or when every candidate is tripped. Running sessions keep their location.
+    """
+
+    def __init__(self, candidates: Optional[Dict[str, str]] = None, mode: str = REGION_PROBE_MODE,
+                 local_profile: str = REGION_LOCAL_PROFILE, interval_seconds: float = REGION_PROBE_INTERVAL_SECONDS):
+        specs = candidates or REGION_CANDIDATES
+        self._candidates = {service: [loc.strip() for loc in spec.split(",") if loc.strip()] for service, spec in specs.items()}
+        self._mode = mode
+        self._simulated = parse_local_profile(local_profile)
+        self._interval = interval_seconds
+        self._endpoints: Dict[Tuple[str, str], _Endpoint] = {}
+        self._selected: Dict[str, str] = {}
+        self._decisions: Deque[Dict[str, Any]] = deque(maxlen=_DECISION_HISTORY)
+        self._task: Optional[asyncio.Task] = None
+        self._ssl: Optional[ssl.SSLContext] = None
+        self._rounds = 0
+
+    def _endpoint(self, service: str, location: str) -> _Endpoint:
+        endpoint = self._endpoints.get((service, location))
+        if endpoint is None:
+            endpoint = self._endpoints[(service, location)] = _Endpoint()
+        return endpoint
+
+    def candidates(self, service: str, default_location: str) -> List[str]:
+        locations = [default_location] + self._candidates.get(service, [])
+        return list(dict.fromkeys(locations))
+
+    # ── Routing ───────────────────────────────────────────────────────
+
+    def select(self, service: str, default_location: str, session_id: Optional[str] = None) -> str:
+        """Location a new session should use for `service`."""
+        if not REGION_ROUTING:
+            return default_location
+        healthy = [loc for loc in self.candidates(service, default_location)
+                   if self._endpoint(service, loc).breaker.state == CircuitBreaker.CLOSED]
+        if not healthy:
+            logger.warning(f"Every {service} region is tripped; staying on {default_location}")
+            return default_location
+        measured = [loc for loc in healthy if self._endpoint(service, loc).median is not None]
+        if not measured:
+            choice = default_location if default_location in healthy else healthy[0]
+        else:
+            best = min(measured, key=lambda loc: self._endpoint(service, loc).median)
+            current = self._selected.get(service)
+            choice = best
+            if current in measured and current != best:
+                gain = self._endpoint(service, current).median - self._endpoint(service, best).median
+                if gain * 1000 < REGION_SWITCH_MARGIN_MS:
+                    choice = current
+        previous = self._selected.get(service)
+        if choice != previous:
+            self._selected[service] = choice
+            self._decide(service, previous, choice, session_id)
+        return choice
+
+    def _decide(self, service: str, previous: Optional[str], choice: str, session_id: Optional[str]):
+        endpoint = self._endpoint(service, choice)
+        reason = "tripped" if previous and self._endpoint(service, previous).breaker.state != CircuitBreaker.CLOSED \
+            else "faster" if previous else "initial"
+        self._decisions.append({
+            "at": time.time(),
+            "service": service,
+            "from": previous,
+            "to": choice,
+            "reason": reason,
+            "median_ms": round(endpoint.median * 1000, 1) if endpoint.median is not None else None,
+            "session_id": session_id,
+        })
+        logger.info(f"Region routing for {service}: {previous} -> {choice} ({reason})")
+
+    # ── Outcomes ──────────────────────────────────────────────────────
+
+    def _record(self, service: str, location: str, ok: bool, error: Optional[str] = None):
+        endpoint = self._endpoint(service, location)
+        if error:
+            endpoint.last_error = error
+        transition = endpoint.breaker.record(ok, time.monotonic())
+        if transition == CircuitBreaker.OPEN:
+            logger.warning(f"Circuit breaker for {service} in {location} opened: {endpoint.last_error}")
+        elif transition == CircuitBreaker.CLOSED:
+            logger.info(f"Circuit breaker for {service} in {location} closed again")
+
+    def record_success(self, service: str, location: Optional[str]):
+        if location:
+            self._record(service, location, True)
+
+    def record_failure(self, service: str, location: Optional[str], error: Any):
+        if location:
+            self._record(service, location, False, str(error))
+
+    # ── Probing ───────────────────────────────────────────────────────
+
+    async def _probe(self, service: str, location: str) -> float:
+        """Seconds to reach the endpoint; raises when it can't be reached."""
+        if self._mode == "local":
+            key = (service, location) if (service, location) in self._simulated else (None, location)
+            latency_ms = self._simulated.get(key, _LOCAL_DEFAULT_MS)
+            if latency_ms is None:
+                raise ConnectionError("simulated failure")
+            await asyncio.sleep(latency_ms / 1000)
+            return latency_ms / 1000
+        host = endpoint_host(service, location)
+        if self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        started = time.monotonic()
+        _, writer = await asyncio.open_connection(host, 443, ssl=self._ssl, server_hostname=host)
+        elapsed = time.monotonic() - started
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return elapsed
+
+    async def probe_once(self):
+        """Probes every candidate of every service once; endpoints sharing a host share the probe."""
+        groups: Dict[Any, List[Tuple[str, str]]] = {}
+        for service in self._candidates:
+            for location in self.candidates(service, default_location(service)):
+                key = (service, location) if self._mode == "local" else endpoint_host(service, location)
+                groups.setdefault(key, []).append((service, location))
+
+        async def probe(targets: List[Tuple[str, str]]):
+            try:
+                latency = await asyncio.wait_for(self._probe(*targets[0]), timeout=REGION_PROBE_TIMEOUT_SECONDS)
+            except Exception as e:
+                for service, location in targets:
+                    self.record_failure(service, location, f"probe: {e.__class__.__name__} {e}".strip())
+                return
+            for service, location in targets:
+                endpoint = self._endpoint(service, location)
+                endpoint.latency.append(latency)
+                endpoint.probed_at = time.time()
+                self.record_success(service, location)
+
+        await asyncio.gather(*(probe(targets) for targets in groups.values()))
+        self._rounds += 1
+
+    async def _probe_loop(self):
+        while True:
+            try:
+                await self.probe_once()
+            except Exception as e:
+                logger.warning(f"Region probe round failed: {e}")
+            await asyncio.sleep(self._interval)
+
+    async def start(self):
+        if self._task is None:
+            logger.info(f"Region routing on ({self._mode} probes every {self._interval:.0f}s)")
+            self._task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def simulate(self, service: Optional[str], location: str, latency_ms: Optional[float] = None, fail: bool = False):
+        """Local mode: changes the simulated probe of a location, for one service or (service None) all."""
+        if self._mode != "local":
+            raise ValueError("Simulated probes need REGION_PROBE_MODE=local")
+        self._simulated[(service, location)] = None if fail else (latency_ms if latency_ms is not None else _LOCAL_DEFAULT_MS)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        services = {}
+        for (service, location), endpoint in sorted(self._endpoints.items()):
+            rate = endpoint.breaker.error_rate(now)
+            services.setdefault(service, {})[location] = {
+                "median_ms": round(endpoint.median * 1000, 1) if endpoint.median is not None else None,
+                "samples": len(endpoint.latency),
+                "error_rate": round(rate, 3) if rate is not None else None,
+                "breaker": endpoint.breaker.state,
+                "trips": endpoint.breaker.trips,
+                "last_error": endpoint.last_error,
+                "probed_at": endpoint.probed_at,
+            }
+        return {
+            "enabled": REGION_ROUTING,
+            "mode": self._mode,
+            "probe_rounds": self._rounds,
+            "selected": dict(self._selected),
+            "endpoints": services,
+            "decisions": list(self._decisions),
+        }
+
+
+_manager: Optional[EndpointManager] = None
+
+
+def get_endpoint_manager() -> EndpointManager:
+    global _manager
+    if _manager is None:
+        _manager = EndpointManager()
+    return _manager
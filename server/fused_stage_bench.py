@@ -0,0 +1,140 @@
+"""Compares the per-frame cost of the STT pipeline before and after fusing its pass-through processors.
+
+Both chains mirror the non-skip_stt pipeline in agent.py between transport.input() and
+transport.output(). The services and context aggregators are stand-ins that only push frames
+on, so the numbers measure the queue hops the pipeline adds, not the services' own work.
+--seconds of 20 ms, 16 kHz input audio are fed through each chain, then an EndFrame.
+
+"separate": every broadcaster, transcript processor and the context logger is its own
+processor, so each input audio frame crosses every one of them. "fused": the user-side taps
+share one FusedStage that drops input audio, the context logger and the bot broadcaster are
+taps in their own stages, and only transcript.assistant() stays a pipecat processor.
+
+Usage:
+    python fused_stage_bench.py [--seconds 60] [--repeat 2] [--json]
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from pipecat.frames.frames import EndFrame, InputAudioRawFrame
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.processors.transcript_processor import TranscriptProcessor
+
+from processors.fused_stage import FrameTap, FusedStage
+
+_FRAME_MS = 20
+_SAMPLE_RATE = 16000
+
+
+class _StandIn(FrameProcessor):
+    """Pushes every frame on, standing in for a service, an aggregator or a broadcaster."""
+
+    async def process_frame(self, frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
+
+
+class _AudioHops(BaseObserver):
+    """Counts how many times input audio frames are pushed from one processor to the next."""
+
+    def __init__(self):
+        super().__init__()
+        self.hops = 0
+
+    async def on_push_frame(self, data: FramePushed):
+        if isinstance(data.frame, InputAudioRawFrame):
+            self.hops += 1
+
+
+def _separate() -> List[FrameProcessor]:
+    transcript = TranscriptProcessor()
+    return [
+        _StandIn(name="stt"),
+        _StandIn(name="user_broadcaster"),
+        transcript.user(),
+        _StandIn(name="user_aggregator"),
+        _StandIn(name="context_logger"),
+        _StandIn(name="llm"),
+        _StandIn(name="bot_broadcaster"),
+        _StandIn(name="tts"),
+        transcript.assistant(),
+        _StandIn(name="assistant_aggregator"),
+    ]
+
+
+def _fused() -> List[FrameProcessor]:
+    transcript = TranscriptProcessor()
+    return [
+        _StandIn(name="stt"),
+        FusedStage([FrameTap(), FrameTap()], drop_input_audio=True, name="user_taps"),
+        _StandIn(name="user_aggregator"),
+        FusedStage([FrameTap()], name="context_logger"),
+        _StandIn(name="llm"),
+        FusedStage([FrameTap()], name="bot_broadcaster"),
+        _StandIn(name="tts"),
+        transcript.assistant(),
+        _StandIn(name="assistant_aggregator"),
+    ]
+
+
+async def _measure(build: Callable[[], List[FrameProcessor]], frames: int) -> Dict[str, float]:
+    hops = _AudioHops()
+    task = PipelineTask(Pipeline(build()), params=PipelineParams(), observers=[hops])
+    audio = b"\0" * (_SAMPLE_RATE * _FRAME_MS // 1000 * 2)
+
+    async def feed():
+        for i in range(frames):
+            await task.queue_frames([InputAudioRawFrame(audio, _SAMPLE_RATE, 1)])
+            if i % 50 == 0:
+                await asyncio.sleep(0)
+        await task.queue_frames([EndFrame()])
+
+    feeder = asyncio.create_task(feed())
+    started = time.process_time()
+    await PipelineRunner(handle_sigint=False).run(task)
+    cpu = time.process_time() - started
+    await feeder
+    return {"hops": hops.hops, "cpu": cpu}
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    frames = int(args.seconds * 1000 / _FRAME_MS)
+    results = []
+    for chain, build in (("separate", _separate), ("fused", _fused)):
+        runs = [await _measure(build, frames) for _ in range(args.repeat)]
+        cpu = min(r["cpu"] for r in runs)
+        results.append({
+            "chain": chain,
+            "processors": len(build()),
+            "hops_per_audio_frame": round(runs[0]["hops"] / frames, 1),
+            "cpu_ms_per_audio_second": round(cpu * 1000 / args.seconds, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame pipeline cost with and without FusedStage")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Seconds of input audio per run")
+    parser.add_argument("--repeat", type=int, default=2, help="Runs per chain; the fastest one is reported")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['chain']:<10}{result['processors']:>3} processors"
+              f"{result['hops_per_audio_frame']:>6} hops/audio frame"
+              f"{result['cpu_ms_per_audio_second']:>8} ms CPU/audio second")
+
+
+if __name__ == "__main__":
+    main()
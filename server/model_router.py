@@ -0,0 +1,181 @@
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from percentiles import percentile
+
+# Routing is opt-in; TTFB is always recorded so /admin/routing shows the numbers either way
+LLM_ROUTING = os.getenv("LLM_ROUTING", "false").lower() == "true"
+# "turn": re-route before every LLM call; "session": only when a session starts
+LLM_ROUTING_SCOPE = os.getenv("LLM_ROUTING_SCOPE", "turn")
+LLM_TTFB_SLO_MS = float(os.getenv("LLM_TTFB_SLO_MS", "1500"))
+# Faster tiers to fall back to, in order: "model" or "model@thinking_level"
+LLM_FALLBACK_TIERS = os.getenv("LLM_FALLBACK_TIERS", "gemini-2.5-flash-lite,gemini-3.1-flash-lite-preview@minimal")
+LLM_ROUTING_WINDOW_SECONDS = float(os.getenv("LLM_ROUTING_WINDOW_SECONDS", "120"))
+LLM_ROUTING_MIN_SAMPLES = int(os.getenv("LLM_ROUTING_MIN_SAMPLES", "10"))
+# A slower tier is trusted again once its p95 is below SLO * this ratio
+LLM_ROUTING_RECOVERY_RATIO = float(os.getenv("LLM_ROUTING_RECOVERY_RATIO", "0.8"))
+LLM_ROUTING_COOLDOWN_SECONDS = float(os.getenv("LLM_ROUTING_COOLDOWN_SECONDS", "30"))
+
+# Models that default to minimal thinking (lowest latency) when no level is given
+_MINIMAL_THINKING_MODELS = ("gemini-3.1-flash-lite-preview", "gemini-3-flash-preview")
+_MAX_SAMPLES = 1000
+_DECISION_HISTORY = 200
+
+
+@dataclass(frozen=True)
+class RouteTier:
+    model: str
+    thinking_level: Optional[str] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "RouteTier":
+        model, _, thinking_level = spec.strip().partition("@")
+        return cls(model=model, thinking_level=thinking_level or None)
+
+    def extra_params(self) -> Dict[str, Any]:
+        """Generation params for the tier, passed as GoogleVertexLLMService.InputParams.extra."""
+        level = self.thinking_level or ("minimal" if self.model in _MINIMAL_THINKING_MODELS else None)
+        return {"thinking_config": {"thinking_level": level}} if level else {}
+
+    def __str__(self):
+        return f"{self.model}@{self.thinking_level}" if self.thinking_level else self.model
+
+
+def llm_location_for(model: str, location: str) -> str:
+    """Gemini 3 models are only served from the global endpoint."""
+    return "global" if "gemini-3" in model else location
+
+
+class _Route:
+    """Routing state for one requested model in one location."""
+
+    def __init__(self, tiers: List[RouteTier]):
+        self.tiers = tiers
+        self.index = 0
+        self.changed_at = 0.0
+
+
+class LatencyRouter:
+    """Routes LLM calls across model tiers based on rolling TTFB percentiles.
+
+    TTFB is tracked per (model, location) over a sliding time window. When the p95 of the
+    tier in use breaches the SLO, new calls move one tier down the fallback chain. Once the
+    cooldown has passed, calls move back up if the slower tier has recovered (p95 under
+    SLO * recovery ratio) or has gone without samples long enough that it has to be probed
+    again. Every move is logged and kept for /admin/routing.
+    """
+
+    def __init__(
+        self,
+        slo_ms: float = LLM_TTFB_SLO_MS,
+        fallback_tiers: str = LLM_FALLBACK_TIERS,
+        window_seconds: float = LLM_ROUTING_WINDOW_SECONDS,
+        min_samples: int = LLM_ROUTING_MIN_SAMPLES,
+        recovery_ratio: float = LLM_ROUTING_RECOVERY_RATIO,
+        cooldown_seconds: float = LLM_ROUTING_COOLDOWN_SECONDS,
+    ):
+        self._slo = slo_ms / 1000
+        self._fallbacks = [RouteTier.parse(s) for s in fallback_tiers.split(",") if s.strip()]
+        self._window = window_seconds
+        self._min_samples = min_samples
+        self._recovery_ratio = recovery_ratio
+        self._cooldown = cooldown_seconds
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = {}
+        self._routes: Dict[Tuple[str, str], _Route] = {}
+        self._decisions: Deque[Dict[str, Any]] = deque(maxlen=_DECISION_HISTORY)
+
+    def record(self, model: str, location: str, ttfb: float):
+        samples = self._samples.get((model, location))
+        if samples is None:
+            samples = self._samples[(model, location)] = deque(maxlen=_MAX_SAMPLES)
+        samples.append((time.monotonic(), ttfb))
+
+    def _recent(self, model: str, location: str) -> List[float]:
+        """TTFB values of a model in the location that actually serves it, within the window."""
+        samples = self._samples.get((model, location))
+        if not samples:
+            return []
+        cutoff = time.monotonic() - self._window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return [value for _, value in samples]
+
+    def select(self, requested_model: str, location: str, session_id: Optional[str] = None) -> RouteTier:
+        """Tier to use for the next call of a session that asked for `requested_model`."""
+        requested = RouteTier(requested_model)
+        if not LLM_ROUTING:
+            return requested
+        route = self._routes.get((requested_model, location))
+        if route is None:
+            tiers = [requested] + [t for t in self._fallbacks if t != requested]
+            route = self._routes[(requested_model, location)] = _Route(tiers)
+
+        now = time.monotonic()
+        if now - route.changed_at >= self._cooldown:
+            current = route.tiers[route.index]
+            values = self._recent(current.model, llm_location_for(current.model, location))
+            p95 = percentile(values, 95)
+            if route.index < len(route.tiers) - 1 and len(values) >= self._min_samples and p95 > self._slo:
+                self._move(route, route.index + 1, requested_model, location, session_id,
+                           f"p95 {p95 * 1000:.0f}ms > SLO {self._slo * 1000:.0f}ms")
+            elif route.index > 0:
+                upper = route.tiers[route.index - 1]
+                upper_values = self._recent(upper.model, llm_location_for(upper.model, location))
+                upper_p95 = percentile(upper_values, 95)
+                if len(upper_values) < self._min_samples:
+                    self._move(route, route.index - 1, requested_model, location, session_id,
+                               "probing slower tier without recent samples")
+                elif upper_p95 < self._slo * self._recovery_ratio:
+                    self._move(route, route.index - 1, requested_model, location, session_id,
+                               f"recovered, p95 {upper_p95 * 1000:.0f}ms")
+        return route.tiers[route.index]
+
+    def _move(self, route: _Route, index: int, requested_model: str, location: str,
+              session_id: Optional[str], reason: str):
+        previous = route.tiers[route.index]
+        route.index = index
+        route.changed_at = time.monotonic()
+        decision = {
+            "at": time.time(),
+            "requested_model": requested_model,
+            "location": location,
+            "from": str(previous),
+            "to": str(route.tiers[index]),
+            "reason": reason,
+            "session_id": session_id,
+        }
+        self._decisions.append(decision)
+        logger.info(f"LLM routing for {requested_model} ({location}): {previous} -> {route.tiers[index]} ({reason})")
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for model, location in list(self._samples):
+            values = self._recent(model, location)
+            models[f"{location}/{model}"] = {
+                "samples": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 1) if values else None,
+                "p95_ms": round(percentile(values, 95) * 1000, 1) if values else None,
+            }
+        return {
+            "enabled": LLM_ROUTING,
+            "scope": LLM_ROUTING_SCOPE,
+            "slo_ms": self._slo * 1000,
+            "ttfb": models,
+            "routes": {f"{loc}/{m}": str(r.tiers[r.index]) for (m, loc), r in self._routes.items()},
+            "decisions": list(self._decisions),
+        }
+
+
+_router: Optional[LatencyRouter] = None
+
+
+def get_model_router() -> LatencyRouter:
+    global _router
+    if _router is None:
+        _router = LatencyRouter()
+    return _router
@@ -0,0 +1,72 @@
+import os
+import weakref
+from typing import Any, Dict, Optional
+
+# Bot audio is released to the websocket at playback speed, keeping only a target lead of
+# audio buffered on the client; overridable per session with output_pacing
+OUTPUT_PACING = os.getenv("OUTPUT_PACING", "false").lower() == "true"
+# Audio the client should have buffered (its jitter buffer), before per-client adjustments
+OUTPUT_PACING_LEAD_MS = float(os.getenv("OUTPUT_PACING_LEAD_MS", "200"))
+# Bounds of the per-client jitter buffer
+OUTPUT_PACING_MIN_LEAD_MS = float(os.getenv("OUTPUT_PACING_MIN_LEAD_MS", "100"))
+OUTPUT_PACING_MAX_LEAD_MS = float(os.getenv("OUTPUT_PACING_MAX_LEAD_MS", "800"))
+# Each client-reported underrun grows that client's jitter buffer by this much
+OUTPUT_PACING_UNDERRUN_STEP_MS = float(os.getenv("OUTPUT_PACING_UNDERRUN_STEP_MS", "40"))
+# ...and each this many seconds of audio played without one shrinks it back by a step
+OUTPUT_PACING_DECAY_SECONDS = float(os.getenv("OUTPUT_PACING_DECAY_SECONDS", "10"))
+# RTT probes while bot audio is flowing
+OUTPUT_PACING_PING_SECONDS = float(os.getenv("OUTPUT_PACING_PING_SECONDS", "2"))
+# RTT assumed until the client answers a probe (older clients never do)
+OUTPUT_PACING_DEFAULT_RTT_MS = float(os.getenv("OUTPUT_PACING_DEFAULT_RTT_MS", "100"))
+# Bot audio is released in pieces of at most this length
+OUTPUT_PACING_CHUNK_MS = float(os.getenv("OUTPUT_PACING_CHUNK_MS", "20"))
+
+# Server messages (RTVI server-message data.type) and client messages (client-message data.t);
+# must match client/src/opusSerializer.ts
+PACE_PING_MESSAGE = "pace_ping"
+PACE_FLUSH_MESSAGE = "pace_flush"
+PACE_PONG_MESSAGE = "pace_pong"
+PLAYBACK_REPORT_MESSAGE = "playback"
+
+
+def pace_message(kind: str, **data) -> Dict[str, Any]:
+    """RTVI server-message of the pacing protocol (a probe or a flush)."""
+    return {"label": "rtvi-ai", "type": "server-message", "data": {"type": kind, **data}}
+
+
+class OutputPacingStats:
+    """Counters over every paced session, plus a snapshot of the ones still running."""
+
+    def __init__(self):
+        self._pacers = weakref.WeakSet()
+        self.sessions = 0
+        self.underruns = 0
+        self.flushes = 0
+        self.reports = 0
+        self.rtt_samples = 0
+
+    def register(self, pacer):
+        self._pacers.add(pacer)
+        self.sessions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": OUTPUT_PACING,
+            "lead_ms": OUTPUT_PACING_LEAD_MS,
+            "sessions": self.sessions,
+            "underruns": self.underruns,
+            "flushes": self.flushes,
+            "reports": self.reports,
+            "rtt_samples": self.rtt_samples,
+            "active": [pacer.snapshot() for pacer in list(self._pacers)],
+        }
+
+
+_stats: Optional[OutputPacingStats] = None
+
+
+def get_output_pacing_stats() -> OutputPacingStats:
+    global _stats
+    if _stats is None:
+        _stats = OutputPacingStats()
+    return _stats
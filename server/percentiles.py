@@ -0,0 +1,13 @@
+from typing import List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (the sample at rank len * pct / 100); None without samples."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def median(values: List[float]) -> Optional[float]:
+    return percentile(values, 50)
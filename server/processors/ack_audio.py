@@ -0,0 +1,134 @@
+import asyncio
+import random
+import time
+from array import array
+from typing import List, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InterruptionFrame,
+    OutputAudioRawFrame,
+    StartFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+    VADUserStartedSpeakingFrame,
+    VADUserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from ack_bank import ACK_AUDIO_DELAY_MS, ACK_AUDIO_FADE_MS, AckClip, get_ack_bank
+
+# Clips are pushed in chunks of this length, at most one chunk ahead of playback
+_CHUNK_MS = 40
+
+
+class AckAudioPlayer(FrameProcessor):
+    """Plays a short acknowledgement when the reply is slow to start.
+
+    A timer starts when the user stops speaking. If no TTS audio has come through when it
+    fires, and the bot isn't speaking, one clip plays (never the same one twice in a row).
+    The clip is paced in real time, so at most one chunk waits in the output queue. The
+    first TTS frame of the reply stops it, with a short fade instead of a click, and the
+    reply follows at once. The user speaking again or an interruption stops it too.
+
+    Pipeline placement: right after the TTS service.
+    """
+
+    def __init__(self, clips: List[AckClip], *, delay_ms: float = ACK_AUDIO_DELAY_MS, **kwargs):
+        super().__init__(**kwargs)
+        self._clips = clips
+        self._delay = delay_ms / 1000
+        self._timer_task: Optional[asyncio.Task] = None
+        self._play_task: Optional[asyncio.Task] = None
+        self._playing: Optional[AckClip] = None
+        self._position = 0
+        self._last_clip: Optional[AckClip] = None
+        self._bot_speaking = False
+        self._tracer = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            # Converted to the output rate once here, not on every play by the output transport
+            self._clips = [clip.at_rate(frame.audio_out_sample_rate) for clip in self._clips]
+        elif isinstance(frame, (TTSStartedFrame, TTSAudioRawFrame)):
+            await self._step_aside(fade=True)
+        elif isinstance(frame, (UserStoppedSpeakingFrame, VADUserStoppedSpeakingFrame)):
+            if self._clips and self._timer_task is None and self._playing is None:
+                self._timer_task = self.create_task(self._fire_after_delay())
+        elif isinstance(frame, (UserStartedSpeakingFrame, VADUserStartedSpeakingFrame, InterruptionFrame)):
+            # The output queue is flushed on interruption; nothing to fade
+            await self._step_aside(fade=False)
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            await self._step_aside(fade=False)
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._bot_speaking = True
+        elif isinstance(frame, BotStoppedSpeakingFrame):
+            self._bot_speaking = False
+
+        await self.push_frame(frame, direction)
+
+    async def _fire_after_delay(self):
+        await asyncio.sleep(self._delay)
+        self._timer_task = None
+        if self._bot_speaking:
+            return
+        candidates = [clip for clip in self._clips if clip is not self._last_clip] or self._clips
+        clip = random.choice(candidates)
+        self._last_clip = clip
+        self._playing, self._position = clip, 0
+        get_ack_bank().plays += 1
+        logger.debug(f"No reply audio after {self._delay * 1000:.0f}ms, playing acknowledgement {clip.name}")
+        if self._tracer:
+            self._tracer.record("ack_audio", {"clip": clip.name, "delay": self._delay})
+        self._play_task = self.create_task(self._play(clip))
+
+    async def _play(self, clip: AckClip):
+        chunk_bytes = int(clip.sample_rate * _CHUNK_MS / 1000) * 2
+        started = time.monotonic()
+        pushed = 0.0
+        while self._position < len(clip.audio):
+            chunk = clip.audio[self._position:self._position + chunk_bytes]
+            self._position += len(chunk)
+            await self.push_frame(OutputAudioRawFrame(chunk, clip.sample_rate, 1))
+            pushed += len(chunk) / 2 / clip.sample_rate
+            # Stay one chunk ahead of playback
+            await asyncio.sleep(max(pushed - _CHUNK_MS / 1000 - (time.monotonic() - started), 0.0))
+        self._playing = None
+        self._play_task = None
+        get_ack_bank().completed += 1
+
+    async def _step_aside(self, fade: bool):
+        if self._timer_task:
+            await self.cancel_task(self._timer_task)
+            self._timer_task = None
+        clip = self._playing
+        if not clip:
+            return
+        if self._play_task:
+            await self.cancel_task(self._play_task)
+            self._play_task = None
+        self._playing = None
+        get_ack_bank().stepped_aside += 1
+        if fade and self._position < len(clip.audio):
+            await self.push_frame(OutputAudioRawFrame(self._fade_out(clip), clip.sample_rate, 1))
+
+    def _fade_out(self, clip: AckClip) -> bytes:
+        """The next few milliseconds of the clip, ramped down to silence."""
+        count = max(int(clip.sample_rate * ACK_AUDIO_FADE_MS / 1000), 1)
+        tail = array("h", clip.audio[self._position:self._position + count * 2])
+        for i in range(len(tail)):
+            tail[i] = int(tail[i] * (1 - i / len(tail)))
+        return tail.tobytes()
+
+    async def cleanup(self):
+        await super().cleanup()
+        await self._step_aside(fade=False)
@@ -10,51 +10,96 @@ from pipecat.frames.frames import (
 from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from loguru import logger
 
+from pipecat.audio.utils import create_file_resampler
+
+from endpoint_manager import get_endpoint_manager
+from resampling import STT_SAMPLE_RATE
+from stt_race import language_set_label, race_recognize, result_confidence
+
 
 class AudioAccumulator(FrameProcessor):
-    def __init__(self, context, *, project_id, stt_languages=None, **kwargs):
+    def __init__(self, context, *, project_id, stt_languages=None, stt_language_sets=None, stt_location="us", resampler=None, **kwargs):
         super().__init__(**kwargs)
         self._context = context
         self._audio_frames = []
         self._accumulating = False
         self._project_id = project_id
         self._stt_languages = stt_languages or ["en-US"]
+        # Two or more sets: one recognition per set, raced (see stt_race)
+        self._stt_language_sets = stt_language_sets or []
+        self._stt_location = stt_location
+        # The session's "stt" stream (SessionResamplers); without one, pipecat's one-shot resampler
+        self._resampler = resampler
         self._stt_client = None
         self._stt_task = None
-        logger.info(f"AudioAccumulator initialized with parallel STT (languages={self._stt_languages})")
+        if self._stt_language_sets:
+            logger.info(f"AudioAccumulator initialized with racing STT (language sets={self._stt_language_sets})")
+        else:
+            logger.info(f"AudioAccumulator initialized with parallel STT (languages={self._stt_languages})")
 
     async def _get_stt_client(self):
         if self._stt_client is None:
+            from google.api_core.client_options import ClientOptions
             from google.cloud.speech_v2 import SpeechAsyncClient
-            self._stt_client = SpeechAsyncClient()
+            # Recognizers outside "global" are served from their regional endpoint
+            client_options = None
+            if self._stt_location != "global":
+                client_options = ClientOptions(api_endpoint=f"{self._stt_location}-speech.googleapis.com")
+            self._stt_client = SpeechAsyncClient(client_options=client_options)
         return self._stt_client
 
-    async def _run_parallel_stt(self, audio_data: bytes):
-        try:
-            from google.cloud.speech_v2.types import cloud_speech
-
-            client = await self._get_stt_client()
-            config = cloud_speech.RecognitionConfig(
-                explicit_decoding_config=cloud_speech.ExplicitDecodingConfig(
-                    encoding=cloud_speech.ExplicitDecodingConfig.AudioEncoding.LINEAR16,
-                    sample_rate_hertz=16000,
-                    audio_channel_count=1,
-                ),
-                language_codes=self._stt_languages,
-                model="latest_long",
-            )
-            request = cloud_speech.RecognizeRequest(
-                recognizer=f"projects/{self._project_id}/locations/us/recognizers/_",
-                config=config,
-                content=audio_data,
-            )
+    async def _recognize(self, audio_data: bytes, languages):
+        """One recognition of the utterance; returns (transcription, lowest result confidence)."""
+        from google.cloud.speech_v2.types import cloud_speech
 
+        client = await self._get_stt_client()
+        config = cloud_speech.RecognitionConfig(
+            explicit_decoding_config=cloud_speech.ExplicitDecodingConfig(
+                encoding=cloud_speech.ExplicitDecodingConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=STT_SAMPLE_RATE,
+                audio_channel_count=1,
+            ),
+            language_codes=languages,
+            model="latest_long",
+        )
+        request = cloud_speech.RecognizeRequest(
+            recognizer=f"projects/{self._project_id}/locations/{self._stt_location}/recognizers/_",
+            config=config,
+            content=audio_data,
+        )
+
+        try:
             response = await client.recognize(request=request)
+        except Exception as e:
+            get_endpoint_manager().record_failure("stt", self._stt_location, e)
+            raise
+        get_endpoint_manager().record_success("stt", self._stt_location)
+
+        transcription = ""
+        confidences = []
+        for result in response.results:
+            if result.alternatives:
+                transcription += result.alternatives[0].transcript
+                confidences.append(result_confidence(result))
+        return transcription, min(confidences, default=0.0)
 
-            transcription = ""
-            for result in response.results:
-                if result.alternatives:
-                    transcription += result.alternatives[0].transcript
+    async def _run_parallel_stt(self, audio_data: bytes, sample_rate: int):
+        try:
+            if self._resampler:
+                audio_data = await self._resampler.resample_whole(audio_data, sample_rate, STT_SAMPLE_RATE)
+            elif sample_rate != STT_SAMPLE_RATE:
+                audio_data = await create_file_resampler().resample(audio_data, sample_rate, STT_SAMPLE_RATE)
+            if self._stt_language_sets:
+                attempts = {
+                    language_set_label(languages): (lambda languages=languages: self._recognize(audio_data, languages))
+                    for languages in self._stt_language_sets
+                }
+                winner = await race_recognize(attempts)
+                transcription = winner[1] if winner else ""
+                if winner:
+                    logger.info(f"STT race won by {winner[0]} (confidence {winner[2]:.2f})")
+            else:
+                transcription, _ = await self._recognize(audio_data, self._stt_languages)
 
             if transcription.strip():
                 logger.info(f"Parallel STT result: {transcription.strip()}")
@@ -88,6 +133,7 @@ class AudioAccumulator(FrameProcessor):
                 logger.info(f"AudioAccumulator: Sending {len(self._audio_frames)} audio frames to LLM")
 
                 audio_data = b''.join([f.audio for f in self._audio_frames])
+                sample_rate = self._audio_frames[0].sample_rate
 
                 self._context.add_audio_frames_message(
                     audio_frames=self._audio_frames,
@@ -108,7 +154,7 @@ class AudioAccumulator(FrameProcessor):
                 }))
 
                 self._stt_task = asyncio.create_task(
-                    self._run_parallel_stt(audio_data)
+                    self._run_parallel_stt(audio_data, sample_rate)
                 )
         elif isinstance(frame, AudioRawFrame) and self._accumulating:
             self._audio_frames.append(frame)
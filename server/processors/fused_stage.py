@@ -0,0 +1,44 @@
+from typing import Sequence, Tuple, Type
+
+from pipecat.frames.frames import AudioRawFrame, Frame, InputAudioRawFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+
+class FrameTap:
+    """A lightweight observer that runs inside a FusedStage instead of as its own processor.
+
+    Taps see the frames matching `frame_types` before the stage pushes them on, and can push
+    extra frames through the stage. They never see audio.
+    """
+
+    frame_types: Tuple[Type[Frame], ...] = (Frame,)
+
+    async def process(self, stage: "FusedStage", frame: Frame, direction: FrameDirection):
+        pass
+
+
+class FusedStage(FrameProcessor):
+    """Runs several taps in one processor: one queue and one task instead of one per tap.
+
+    Audio takes a fast lane straight through without any tap dispatch. With
+    drop_input_audio=True, input audio also stops here, for stages placed after the last
+    processor that needs it (STT) so the microphone stream skips the rest of the pipeline.
+    """
+
+    def __init__(self, taps: Sequence[FrameTap], *, drop_input_audio: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self._taps = list(taps)
+        self._drop_input_audio = drop_input_audio
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, AudioRawFrame):
+            if not (self._drop_input_audio and isinstance(frame, InputAudioRawFrame)):
+                await self.push_frame(frame, direction)
+            return
+
+        for tap in self._taps:
+            if isinstance(frame, tap.frame_types):
+                await tap.process(self, frame, direction)
+        await self.push_frame(frame, direction)
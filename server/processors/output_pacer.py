@@ -0,0 +1,231 @@
+import asyncio
+import time
+from typing import Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    CancelFrame,
+    Frame,
+    InterruptionFrame,
+    OutputAudioRawFrame,
+    OutputTransportMessageUrgentFrame,
+    StartFrame,
+    SystemFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from output_pacing import (
+    OUTPUT_PACING_CHUNK_MS,
+    OUTPUT_PACING_DECAY_SECONDS,
+    OUTPUT_PACING_DEFAULT_RTT_MS,
+    OUTPUT_PACING_LEAD_MS,
+    OUTPUT_PACING_MAX_LEAD_MS,
+    OUTPUT_PACING_MIN_LEAD_MS,
+    OUTPUT_PACING_PING_SECONDS,
+    OUTPUT_PACING_UNDERRUN_STEP_MS,
+    PACE_FLUSH_MESSAGE,
+    PACE_PING_MESSAGE,
+    get_output_pacing_stats,
+    pace_message,
+)
+
+
+class OutputPacer(FrameProcessor):
+    """Releases bot audio at playback speed so the client only buffers a small lead.
+
+    TTS and Live audio arrive in bursts; written straight to the websocket, seconds of it
+    pile up in socket and client buffers and keep playing after a barge-in. This stage
+    queues downstream frames (in order) and releases audio in small pieces whenever the
+    estimated audio still ahead of the client's playhead drops below the target lead.
+
+    The estimate is a playback clock started when audio reaches an idle client, corrected
+    by the client's playback reports. The target is the client's jitter buffer plus half
+    the RTT (the audio in flight). The jitter buffer starts at the configured lead, grows
+    with the RTT variance, and grows a step per underrun (the client ran dry while audio
+    was being held back here), decaying again while playback is clean.
+
+    On interruption the queue is dropped and the client is told to flush its player, so
+    barge-in cuts off at most the audio in flight.
+
+    Pipeline placement: right before transport.output().
+    """
+
+    def __init__(self, *, lead_ms: float = OUTPUT_PACING_LEAD_MS, **kwargs):
+        super().__init__(**kwargs)
+        self._lead = lead_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queued = 0.0
+        self._release_task: Optional[asyncio.Task] = None
+        # Seconds of audio released since the last flush, and how much of it the client has played as of `_at`
+        self._sent = 0.0
+        self._played = 0.0
+        self._at = time.monotonic()
+        self._srtt: Optional[float] = None
+        self._rttvar = 0.0
+        self._boost = 0.0
+        self._clean = 0.0
+        self._starved = False
+        self._epoch = 0
+        self._last_ping = 0.0
+        self._underruns = 0
+        self._tracer = None
+        get_output_pacing_stats().register(self)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if direction == FrameDirection.UPSTREAM:
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, StartFrame):
+            await self.push_frame(frame, direction)
+            self._release_task = self.create_task(self._release_loop())
+        elif isinstance(frame, InterruptionFrame):
+            await self._flush(frame)
+        elif isinstance(frame, CancelFrame):
+            await self._stop()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, SystemFrame):
+            await self.push_frame(frame, direction)
+        else:
+            if isinstance(frame, OutputAudioRawFrame):
+                self._queued += self._duration(frame)
+            await self._queue.put(frame)
+
+    @staticmethod
+    def _duration(frame: OutputAudioRawFrame) -> float:
+        return len(frame.audio) / 2 / (frame.num_channels or 1) / frame.sample_rate
+
+    def _owd(self) -> float:
+        rtt = self._srtt if self._srtt is not None else OUTPUT_PACING_DEFAULT_RTT_MS / 1000
+        return rtt / 2
+
+    def _jitter_buffer(self) -> float:
+        return min(max(self._lead + 2 * self._rttvar + self._boost, OUTPUT_PACING_MIN_LEAD_MS / 1000),
+                   OUTPUT_PACING_MAX_LEAD_MS / 1000)
+
+    def _advance(self, now: float):
+        # `_at` is in the future while released audio is still on its way to an idle client
+        if now > self._at:
+            self._played = min(self._sent, self._played + now - self._at)
+            self._at = now
+
+    def _ahead(self) -> float:
+        """Audio released but not yet played by the client, in flight or in its buffer."""
+        self._advance(time.monotonic())
+        return self._sent - self._played
+
+    async def _release_loop(self):
+        while True:
+            frame = await self._queue.get()
+            if not isinstance(frame, OutputAudioRawFrame):
+                await self.push_frame(frame)
+                continue
+            piece_bytes = max(int(frame.sample_rate * OUTPUT_PACING_CHUNK_MS / 1000), 1) * (frame.num_channels or 1) * 2
+            for offset in range(0, len(frame.audio), piece_bytes):
+                piece = type(frame)(frame.audio[offset:offset + piece_bytes], sample_rate=frame.sample_rate,
+                                    num_channels=frame.num_channels)
+                piece.transport_destination = frame.transport_destination
+                await self._wait_for_room()
+                self._queued -= self._duration(piece)
+                self._account(self._duration(piece))
+                await self.push_frame(piece)
+            if self._queue.empty():
+                self._queued = 0.0  # No rounding leftovers
+
+    async def _wait_for_room(self):
+        now = time.monotonic()
+        if now - self._last_ping >= OUTPUT_PACING_PING_SECONDS:
+            self._last_ping = now
+            await self.push_frame(OutputTransportMessageUrgentFrame(
+                message=pace_message(PACE_PING_MESSAGE, ts=now * 1000)))
+        while True:
+            excess = self._ahead() - (self._jitter_buffer() + self._owd())
+            if excess < 0:
+                return
+            await asyncio.sleep(max(excess, 0.005))
+
+    def _account(self, duration: float):
+        now = time.monotonic()
+        self._advance(now)
+        if self._played >= self._sent:
+            # The client is idle: this audio starts playing when it arrives
+            self._played = self._sent
+            self._at = now + self._owd()
+        self._sent += duration
+        self._clean += duration
+        if self._boost and self._clean >= OUTPUT_PACING_DECAY_SECONDS:
+            self._boost = max(self._boost - OUTPUT_PACING_UNDERRUN_STEP_MS / 1000, 0.0)
+            self._clean = 0.0
+
+    def on_pong(self, ts_ms: float):
+        """A reply to a probe: one RTT sample (smoothed the way TCP does)."""
+        rtt = max(time.monotonic() - ts_ms / 1000, 0.0)
+        get_output_pacing_stats().rtt_samples += 1
+        if self._srtt is None:
+            self._srtt, self._rttvar = rtt, rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+
+    def on_playback_report(self, epoch: int, played_ms: float, buffered_ms: float):
+        """The client's playback position since the last flush, and how much it has buffered."""
+        if epoch != self._epoch:
+            return  # Sent before the last flush
+        stats = get_output_pacing_stats()
+        stats.reports += 1
+        buffered = buffered_ms / 1000
+        # The client kept playing while the report was on its way
+        played = played_ms / 1000 + min(self._owd(), buffered)
+        self._played = min(played, self._sent)
+        self._at = time.monotonic()
+        if buffered > 0:
+            self._starved = False
+        elif self._queued > 0 and not self._starved:
+            # Ran dry while audio was waiting here: the jitter buffer is too small for this client
+            self._starved = True
+            self._underruns += 1
+            stats.underruns += 1
+            self._boost = min(self._boost + OUTPUT_PACING_UNDERRUN_STEP_MS / 1000, OUTPUT_PACING_MAX_LEAD_MS / 1000)
+            self._clean = 0.0
+            logger.debug(f"{self}: client underrun, jitter buffer now {self._jitter_buffer() * 1000:.0f}ms")
+            if self._tracer:
+                self._tracer.record("pacing_underrun", {"jitter_buffer": self._jitter_buffer()})
+
+    async def _flush(self, frame: InterruptionFrame):
+        dropped = self._queued
+        ahead = self._ahead()
+        await self._stop()
+        self._queue = asyncio.Queue()
+        self._queued = 0.0
+        await self.push_frame(frame)
+        if ahead > 0 or dropped > 0:
+            # After the interruption, so the transport has already dropped its own queued audio
+            self._epoch += 1
+            self._sent = self._played = 0.0
+            self._at = time.monotonic()
+            get_output_pacing_stats().flushes += 1
+            await self.push_frame(OutputTransportMessageUrgentFrame(
+                message=pace_message(PACE_FLUSH_MESSAGE, epoch=self._epoch)))
+            if self._tracer:
+                self._tracer.record("pacing_flush", {"client_ahead": ahead, "dropped": dropped})
+        self._release_task = self.create_task(self._release_loop())
+
+    async def _stop(self):
+        if self._release_task:
+            await self.cancel_task(self._release_task)
+            self._release_task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "rtt_ms": round(self._srtt * 1000, 1) if self._srtt is not None else None,
+            "rtt_var_ms": round(self._rttvar * 1000, 1),
+            "jitter_buffer_ms": round(self._jitter_buffer() * 1000),
+            "ahead_ms": round(self._ahead() * 1000),
+            "queued_ms": round(self._queued * 1000),
+            "underruns": self._underruns,
+            "flushes": self._epoch,
+        }
+
+    async def cleanup(self):
+        await super().cleanup()
+        await self._stop()
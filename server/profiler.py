@@ -0,0 +1,180 @@
+import os
+import time
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from pipecat.observers.base_observer import BaseObserver, FrameProcessed, FramePushed
+from pipecat.pipeline.base_pipeline import BasePipeline
+
+from percentiles import percentile
+
+# Built-in sampling profiler attached to every pipeline task
+PIPELINE_PROFILER = os.getenv("PIPELINE_PROFILER", "true").lower() == "true"
+# Time one frame in this many (frame counts are always exact)
+PIPELINE_PROFILER_SAMPLE_EVERY = max(1, int(os.getenv("PIPELINE_PROFILER_SAMPLE_EVERY", "16")))
+# Samples kept per processor
+PIPELINE_PROFILER_WINDOW = int(os.getenv("PIPELINE_PROFILER_WINDOW", "1024"))
+# Whisker observes every frame of the session; only for debugging
+WHISKER_DEBUG = os.getenv("WHISKER_DEBUG", "false").lower() == "true"
+
+# Sampled frames still waiting for their push/process counterpart
+_MAX_PENDING = 4096
+
+
+class _ProcessorStats:
+    """Fixed-size ring buffers for one processor class, shared by all sessions."""
+
+    __slots__ = ("process_ms", "wait_ms", "queue_depth", "index", "filled", "frames", "busy_ms")
+
+    def __init__(self, window: int):
+        self.process_ms = array("f", bytes(4 * window))
+        self.wait_ms = array("f", bytes(4 * window))
+        self.queue_depth = array("H", bytes(2 * window))
+        self.index = 0
+        self.filled = 0
+        self.frames: Dict[str, int] = defaultdict(int)
+        # Sampled time in process_frame per frame type (scaled back up by the sample rate)
+        self.busy_ms: Dict[str, float] = defaultdict(float)
+
+    def add(self, process_ms: float, wait_ms: float, depth: int):
+        i = self.index
+        self.process_ms[i] = process_ms
+        self.wait_ms[i] = wait_ms
+        self.queue_depth[i] = min(depth, 65535)
+        self.index = (i + 1) % len(self.process_ms)
+        self.filled = min(self.filled + 1, len(self.process_ms))
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        process = list(self.process_ms[:self.filled])
+        wait = list(self.wait_ms[:self.filled])
+        depth = list(self.queue_depth[:self.filled])
+        return {
+            "samples": self.filled,
+            "process_ms": {"p50": percentile(process, 50), "p95": percentile(process, 95), "max": max(process, default=None)},
+            "queue_wait_ms": {"p50": percentile(wait, 50), "p95": percentile(wait, 95), "max": max(wait, default=None)},
+            "queue_depth": {"avg": round(sum(depth) / len(depth), 2) if depth else None, "max": max(depth, default=None)},
+            "fps": {name: round(count / elapsed, 1) for name, count in sorted(self.frames.items(), key=lambda kv: -kv[1])},
+        }
+
+
+class PipelineProfile:
+    """Per-processor statistics aggregated across every session of this instance."""
+
+    def __init__(self, window: int = PIPELINE_PROFILER_WINDOW):
+        self._window = window
+        self._processors: Dict[str, _ProcessorStats] = {}
+        self._since = time.monotonic()
+
+    def stats_for(self, processor_name: str) -> _ProcessorStats:
+        stats = self._processors.get(processor_name)
+        if stats is None:
+            stats = self._processors[processor_name] = _ProcessorStats(self._window)
+        return stats
+
+    def reset(self):
+        self._processors.clear()
+        self._since = time.monotonic()
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self._since, 1e-3)
+        return {
+            "enabled": PIPELINE_PROFILER,
+            "sample_every": PIPELINE_PROFILER_SAMPLE_EVERY,
+            "seconds": round(elapsed, 1),
+            "processors": {name: stats.summary(elapsed) for name, stats in sorted(self._processors.items())},
+        }
+
+    def collapsed(self) -> str:
+        """Flamegraph collapsed-stack lines ("pipeline;processor;frame type <microseconds>")."""
+        lines = []
+        for name, stats in sorted(self._processors.items()):
+            for frame_type, busy_ms in sorted(stats.busy_ms.items()):
+                lines.append(f"pipeline;{name};{frame_type} {int(busy_ms * 1000)}")
+        return "\n".join(lines) + "\n"
+
+
+class PipelineProfilerObserver(BaseObserver):
+    """Samples process_frame time, queue wait and queue depth for every processor of a task.
+
+    Every push is counted per frame type. One frame in `sample_every` (chosen by a hash of
+    the frame id, so the push and process events of a frame agree) is also timed with the
+    pipeline clock: from the push into a processor to the start of its process_frame
+    (queue wait), and from there to the processor pushing the same frame on (process
+    time). Frames a processor consumes or replaces are counted but not timed. Pipelines
+    themselves are skipped; their time is the sum of their processors.
+    """
+
+    def __init__(self, profile: "PipelineProfile", sample_every: int = PIPELINE_PROFILER_SAMPLE_EVERY):
+        super().__init__()
+        self._profile = profile
+        self._sample_every = sample_every
+        # (processor id, frame id) -> clock ns of the push into / process start in that processor
+        self._pushed: Dict[Tuple[int, int], int] = {}
+        self._started: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+    def _sampled(self, frame) -> bool:
+        # Frame ids are sequential, so a plain modulo would lock onto interleaved frame types
+        return (((frame.id * 2654435761) & 0xFFFFFFFF) >> 16) % self._sample_every == 0
+
+    @staticmethod
+    def _remember(pending: Dict, key, value):
+        if len(pending) >= _MAX_PENDING:
+            pending.pop(next(iter(pending)))
+        pending[key] = value
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        destination = data.destination
+        if isinstance(destination, BasePipeline):
+            return
+        self._profile.stats_for(type(destination).__name__).frames[type(frame).__name__] += 1
+        if not self._sampled(frame):
+            return
+        # Leaving the source: that closes its process_frame sample
+        started = self._started.pop((id(data.source), frame.id), None)
+        if started is not None:
+            process_ns = data.timestamp - started[0]
+            stats = self._profile.stats_for(type(data.source).__name__)
+            process_ms = process_ns / 1e6
+            stats.add(process_ms, started[1] / 1e6, self._queue_depth(data.source))
+            stats.busy_ms[type(frame).__name__] += process_ms * self._sample_every
+        self._remember(self._pushed, (id(destination), frame.id), data.timestamp)
+
+    async def on_process_frame(self, data: FrameProcessed):
+        frame = data.frame
+        if isinstance(data.processor, BasePipeline) or not self._sampled(frame):
+            return
+        key = (id(data.processor), frame.id)
+        pushed_at = self._pushed.pop(key, None)
+        if pushed_at is not None:
+            self._remember(self._started, key, (data.timestamp, max(data.timestamp - pushed_at, 0)))
+
+    @staticmethod
+    def _queue_depth(processor) -> int:
+        depth = 0
+        for attr in ("_FrameProcessor__input_queue", "_FrameProcessor__process_queue"):
+            queue = getattr(processor, attr, None)
+            if queue is not None:
+                depth += queue.qsize()
+        return depth
+
+
+_profile: Optional[PipelineProfile] = None
+
+
+def get_pipeline_profile() -> PipelineProfile:
+    global _profile
+    if _profile is None:
+        _profile = PipelineProfile()
+    return _profile
+
+
+def add_pipeline_observers(task, pipeline):
+    """Attaches the sampling profiler and, when WHISKER_DEBUG is set, Whisker."""
+    if PIPELINE_PROFILER:
+        task.add_observer(PipelineProfilerObserver(get_pipeline_profile()))
+    if WHISKER_DEBUG:
+        from pipecat_whisker import WhiskerObserver
+
+        task.add_observer(WhiskerObserver(pipeline))
@@ -0,0 +1,370 @@
+"""Replays a session recording through run_agent_live / run_agent against stand-in services.
+
+The recorded inbound frames are fed to the agent through a fake websocket with their
+original timing. Model services are replaced by stand-ins driven by the recording
+(recorded Gemini Live messages, or the recorded transcripts and LLM latencies for the
+STT + LLM + TTS flow), so the only thing that changes between runs is this server's
+own code. The report compares bot response onsets and streamed metrics of the
+recording with the replay.
+
+Usage:
+    python replay.py recordings/<session_id>.rec [--report report.json] [--tail 5]
+"""
+import argparse
+import asyncio
+import json
+from collections import deque
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from loguru import logger
+from starlette.websockets import WebSocketState
+
+import pipecat.frames.protobufs.frames_pb2 as frame_protos
+from pipecat.frames.frames import (LLMFullResponseEndFrame, LLMFullResponseStartFrame, LLMTextFrame,
+                                   TranscriptionFrame, TTSAudioRawFrame, TTSStartedFrame, TTSStoppedFrame,
+                                   UserStoppedSpeakingFrame)
+from pipecat.services.google.llm import GoogleLLMService
+from pipecat.services.google.stt import GoogleSTTService
+from pipecat.services.google.tts import GoogleTTSService
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
+from pipecat.utils.time import time_now_iso8601
+
+from session_recorder import REC_INBOUND, REC_LIVE_MESSAGE, REC_OUTBOUND, load_recording
+from tracing import latency_breakdown_stats
+from percentiles import percentile
+
+load_dotenv(override=True)
+
+# A bot audio frame after at least this much outbound audio silence starts a new response
+RESPONSE_GAP_SECONDS = 0.5
+DEFAULT_LLM_LATENCY = 0.5
+STAND_IN_TTS_LATENCY = 0.15
+
+
+class ReplayClock:
+    def __init__(self):
+        self._start = asyncio.get_running_loop().time()
+
+    def now(self) -> float:
+        return asyncio.get_running_loop().time() - self._start
+
+    async def sleep_until(self, t: float):
+        await asyncio.sleep(max(0.0, t - self.now()))
+
+
+class ReplayWebSocket:
+    """Stands in for the FastAPI websocket: plays the recorded inbound frames and captures output."""
+
+    def __init__(self, inbound: List[Tuple[float, bytes]], clock: ReplayClock, end_time: float):
+        self.client_state = WebSocketState.CONNECTED
+        self.application_state = WebSocketState.CONNECTED
+        self.sent: List[Tuple[float, bytes]] = []
+        self._inbound = inbound
+        self._clock = clock
+        self._end_time = end_time
+
+    async def iter_bytes(self):
+        for t, data in self._inbound:
+            await self._clock.sleep_until(t)
+            yield data
+        await self._clock.sleep_until(self._end_time)
+        self.client_state = WebSocketState.DISCONNECTED
+
+    async def iter_text(self):
+        async for data in self.iter_bytes():
+            yield data.decode("utf-8")
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append((self._clock.now(), data))
+
+    async def send_text(self, data: str):
+        self.sent.append((self._clock.now(), data.encode("utf-8")))
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+class ReplayLiveSession:
+    """Gemini Live session that yields the recorded server messages at their original times."""
+
+    def __init__(self, messages: List[Tuple[float, Any]], clock: ReplayClock):
+        self._messages = deque(messages)
+        self._clock = clock
+
+    async def receive(self):
+        while self._messages:
+            t, message = self._messages[0]
+            await self._clock.sleep_until(t)
+            self._messages.popleft()
+            yield message
+            if message.server_content and message.server_content.turn_complete:
+                return
+        # Recording exhausted: stay connected like an idle session
+        await asyncio.Event().wait()
+
+    async def send_realtime_input(self, **kwargs):
+        pass
+
+    async def send_client_content(self, **kwargs):
+        pass
+
+    async def send_tool_response(self, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+
+def stand_in_live_client(session: ReplayLiveSession):
+    @asynccontextmanager
+    async def connect(model: str, config: Any):
+        yield session
+
+    async def aclose():
+        pass
+
+    return SimpleNamespace(aio=SimpleNamespace(live=SimpleNamespace(connect=connect), aclose=aclose))
+
+
+class StandInTTSService(TTSService):
+    """Answers every text with silence proportional to its length after a fixed latency."""
+
+    InputParams = GoogleTTSService.InputParams
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            sample_rate=24000,
+            **{k: v for k, v in kwargs.items() if k in ("text_aggregator", "text_filters")},
+        )
+
+    async def run_tts(self, text: str):
+        await self.start_ttfb_metrics()
+        yield TTSStartedFrame()
+        await asyncio.sleep(STAND_IN_TTS_LATENCY)
+        await self.stop_ttfb_metrics()
+        # Roughly 15 characters per second of speech
+        num_samples = int(self.sample_rate * max(0.2, len(text) / 15))
+        yield TTSAudioRawFrame(audio=b"\x00\x00" * num_samples, sample_rate=self.sample_rate, num_channels=1)
+        yield TTSStoppedFrame()
+
+
+class StandInSTTService(STTService):
+    """Emits the next recorded user transcript whenever local VAD ends a user turn."""
+
+    InputParams = GoogleSTTService.InputParams
+    transcripts: "deque[str]" = deque()
+
+    def __init__(self, **kwargs):
+        super().__init__()
+
+    async def run_stt(self, audio: bytes):
+        yield None
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, UserStoppedSpeakingFrame) and self.transcripts:
+            await self.push_frame(TranscriptionFrame(self.transcripts.popleft(), "", time_now_iso8601()))
+
+
+class StandInLLMService(GoogleLLMService):
+    """Answers each context with the next recorded bot response after the recorded LLM latency."""
+
+    responses: "deque[str]" = deque()
+    latencies: "deque[float]" = deque()
+
+    def __init__(self, *, model: str, system_instruction: Optional[str] = None, params=None, **kwargs):
+        super().__init__(api_key="replay", model=model, system_instruction=system_instruction, params=params)
+
+    async def _process_context(self, context):
+        await self.push_frame(LLMFullResponseStartFrame())
+        await self.start_ttfb_metrics()
+        await asyncio.sleep(self.latencies.popleft() if self.latencies else DEFAULT_LLM_LATENCY)
+        await self.stop_ttfb_metrics()
+        if self.responses:
+            await self.push_frame(LLMTextFrame(self.responses.popleft()))
+        await self.push_frame(LLMFullResponseEndFrame())
+
+
+def decode_outbound(records: List[Tuple[float, bytes]]) -> Tuple[List[float], List[Tuple[float, Dict[str, Any]]]]:
+    """Splits serialized outbound frames into audio frame times and server-message payloads."""
+    audio_times = []
+    messages = []
+    for t, data in records:
+        try:
+            proto = frame_protos.Frame.FromString(data)
+        except Exception:
+            continue
+        kind = proto.WhichOneof("frame")
+        if kind == "audio":
+            audio_times.append(t)
+        elif kind == "message":
+            try:
+                message = json.loads(proto.message.data)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and isinstance(message.get("data"), dict):
+                messages.append((t, message["data"]))
+    return audio_times, messages
+
+
+def response_onsets(audio_times: List[float]) -> List[float]:
+    onsets = []
+    last = None
+    for t in audio_times:
+        if last is None or t - last >= RESPONSE_GAP_SECONDS:
+            onsets.append(t)
+        last = t
+    return onsets
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "p50": round(percentile(values, 50), 4), "p95": round(percentile(values, 95), 4),
+            "max": round(max(values), 4)}
+
+
+def summarize(records: List[Tuple[float, bytes]]) -> Dict[str, Any]:
+    audio_times, messages = decode_outbound(records)
+    metrics: Dict[str, List[float]] = {}
+    for _, data in messages:
+        payload = data.get("payload") if data.get("type") == "metrics" else None
+        if isinstance(payload, dict) and isinstance(payload.get("value"), (int, float)):
+            metrics.setdefault(payload["type"], []).append(payload["value"])
+        elif data.get("type") == "transcription" and isinstance(data.get("ttft"), (int, float)):
+            metrics.setdefault("ttft", []).append(data["ttft"])
+    return {
+        "response_onsets": [round(t, 3) for t in response_onsets(audio_times)],
+        "metrics": {name: percentiles(values) for name, values in metrics.items()},
+    }
+
+
+def build_script(outbound: List[Tuple[float, bytes]]):
+    """Recovers per-turn user transcripts, bot responses and LLM latencies from the recording."""
+    _, messages = decode_outbound(outbound)
+    transcripts, responses, latencies = [], [], []
+    current_user: Optional[str] = None
+    current_bot: List[str] = []
+    for _, data in messages:
+        if data.get("type") == "transcription":
+            if data.get("participant") == "User":
+                if current_bot:
+                    responses.append(" ".join(current_bot))
+                    current_bot = []
+                current_user = data.get("text", "")
+            elif data.get("participant") == "Bot":
+                if current_user is not None:
+                    transcripts.append(current_user)
+                    current_user = None
+                current_bot.append(data.get("text", ""))
+        elif data.get("type") == "metrics" and (data.get("payload") or {}).get("type") == "llm_latency":
+            latencies.append(data["payload"]["value"])
+    if current_bot:
+        responses.append(" ".join(current_bot))
+    return transcripts, responses, latencies
+
+
+async def replay(path: str, tail: float) -> Dict[str, Any]:
+    metadata, records = load_recording(path)
+    params: Dict[str, str] = metadata.get("params", {})
+    bot_type = metadata.get("bot_type", "gemini-live")
+    inbound = [(t, data) for kind, t, data in records if kind == REC_INBOUND]
+    outbound = [(t, data) for kind, t, data in records if kind == REC_OUTBOUND]
+    end_time = (records[-1][1] if records else 0.0) + tail
+    logger.info(f"Replaying {bot_type} session {metadata.get('session_id')} ({len(records)} records, {end_time:.1f}s)")
+
+    clock = ReplayClock()
+    websocket = ReplayWebSocket(inbound, clock, end_time)
+    as_bool = lambda value, default: default if value is None else value.lower() == "true"
+
+    if bot_type == "gemini-live":
+        import agent_live
+        from google.genai.types import LiveServerMessage
+
+        live_messages = [(t, LiveServerMessage.model_validate_json(data)) for kind, t, data in records if kind == REC_LIVE_MESSAGE]
+        session = ReplayLiveSession(live_messages, clock)
+
+        def create_client(service):
+            service._client = stand_in_live_client(session)
+
+        for cls in (agent_live.CustomGeminiLiveVertexLLMService, agent_live.CustomGeminiLiveLLMService):
+            cls.create_client = create_client
+        agent_live.CustomGeminiLiveVertexLLMService._get_credentials = staticmethod(lambda *args: None)
+        agent_live.LiveGoogleTTSService = StandInTTSService
+
+        await agent_live.run_agent_live(
+            websocket,
+            model=params.get("model", "gemini-live-2.5-flash-native-audio"),
+            voice=params.get("voice", "Puck"),
+            language=params.get("language", "en-US"),
+            system_instruction=params.get("system_instruction"),
+            tts=as_bool(params.get("tts"), True),
+            tts_pace=float(params.get("tts_pace", 0.80)),
+            tools=params.get("tools"),
+            session_id=f"replay-{metadata.get('session_id')}",
+            tts_aggregation=params.get("tts_aggregation", "clause"),
+            audio_codec=params.get("audio_codec", "pcm"),
+            vad_mode=params.get("vad_mode"),
+        )
+    else:
+        import agent
+
+        transcripts, responses, latencies = build_script(outbound)
+        agent.GoogleSTTService = type("ReplaySTTService", (StandInSTTService,), {"transcripts": deque(transcripts)})
+        agent.CustomGoogleVertexLLMService = type("ReplayLLMService", (StandInLLMService,), {
+            "responses": deque(responses), "latencies": deque(latencies),
+        })
+        agent.CustomGoogleTTSService = StandInTTSService
+        agent.CustomVertexGeminiTTSService = StandInTTSService
+        if as_bool(params.get("skip_stt"), False):
+            logger.warning("skip_stt sessions are replayed through the stand-in STT path")
+
+        await agent.run_agent(
+            websocket,
+            tts_voice=params.get("tts_voice", "en-US-Chirp3-HD-Aoede"),
+            tts_pace=float(params.get("tts_pace", 0.80)),
+            llm_model=params.get("llm_model", "gemini-2.5-flash"),
+            stt_model=params.get("stt_model", "latest_long"),
+            stt_language=params.get("stt_language", "en-US"),
+            tts_model=params.get("tts_model", "google-tts"),
+            system_instruction=params.get("system_instruction"),
+            session_id=f"replay-{metadata.get('session_id')}",
+            audio_codec=params.get("audio_codec", "pcm"),
+        )
+
+    recorded = summarize(outbound)
+    replayed = summarize(websocket.sent)
+    deltas = [b - a for a, b in zip(recorded["response_onsets"], replayed["response_onsets"])]
+    return {
+        "recording": path,
+        "session_id": metadata.get("session_id"),
+        "bot_type": bot_type,
+        "recorded": recorded,
+        "replayed": replayed,
+        "response_onset_delta_seconds": percentiles(deltas),
+        "replayed_turn_breakdown": latency_breakdown_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session against stand-in services")
+    parser.add_argument("recording", help="Path to a .rec file written with record=true")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    parser.add_argument("--tail", type=float, default=5.0, help="Seconds to keep the session open after the last record")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.recording, args.tail))
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Compares the resampling CPU of one session: pipecat's per-stage resamplers vs SessionResamplers.
+
+A session is simulated as --turns turns. Each turn the user speaks for --utterance-seconds
+(resampled to 16 kHz for one-shot STT), a share of the turns play an acknowledgement clip
+recorded at --ack-rate, and the reply arrives as TTS audio at --tts-rate in 40 ms chunks,
+all of it going to a transport writing --out-rate.
+
+Pipecat's path: one VHQ stream resampler per output media sender, which has to be replaced
+whenever the rate changes (it raises on a second rate pair), clips converted on every play,
+and a one-shot VHQ conversion per utterance. The session path: one cached stream per rate
+pair at RESAMPLER_QUALITY, clips converted once per process (not counted), and the
+utterance flushed through the session's "stt" stream. With the default VHQ both paths use the
+same filter, so the difference is the resampler reuse alone; RESAMPLER_QUALITY=HQ adds the
+cheaper filter on top.
+
+Usage:
+    python resample_bench.py [--turns 20] [--tts-rate 16000] [--out-rate 24000] [--in-rate 48000] [--json]
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from pipecat.audio.utils import create_file_resampler, create_stream_resampler
+
+from resampling import RESAMPLER_QUALITY, STT_SAMPLE_RATE, CachedStreamResampler
+
+_CHUNK_MS = 40
+
+
+def _audio(seconds: float, rate: int) -> bytes:
+    """A tone with some noise, so soxr does real work."""
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t))
+    return (signal * 32767).astype(np.int16).tobytes()
+
+
+def _chunks(audio: bytes, rate: int) -> List[bytes]:
+    size = int(rate * _CHUNK_MS / 1000) * 2
+    return [audio[i:i + size] for i in range(0, len(audio), size)]
+
+
+def _run(coroutine):
+    """Steps a coroutine that never suspends (no event loop in the measurement)."""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("resampler suspended")
+
+
+def _pipecat_session(turns, utterance, ack, reply, args) -> int:
+    output, rate, created = None, None, 0
+    for turn in range(turns):
+        _run(create_file_resampler().resample(utterance, args.in_rate, STT_SAMPLE_RATE))
+        played = [(ack, args.ack_rate)] if turn % round(1 / args.ack_ratio) == 0 else []
+        for audio, audio_rate in played + [(reply, args.tts_rate)]:
+            if audio_rate != rate:
+                # A stream resampler raises on a second rate pair
+                output, rate = create_stream_resampler(), audio_rate
+                created += 1
+            for chunk in audio:
+                _run(output.resample(chunk, audio_rate, args.out_rate))
+    return created
+
+
+def _session_session(turns, utterance, ack, reply, args) -> int:
+    output = CachedStreamResampler()
+    stt = CachedStreamResampler()
+    for turn in range(turns):
+        _run(stt.resample_whole(utterance, args.in_rate, STT_SAMPLE_RATE))
+        if turn % round(1 / args.ack_ratio) == 0:
+            for chunk in ack:
+                _run(output.resample(chunk, args.out_rate, args.out_rate))
+        for chunk in reply:
+            _run(output.resample(chunk, args.tts_rate, args.out_rate))
+    return len(output.stats()["pairs"]) + len(stt.stats()["pairs"])
+
+
+def run(args) -> List[Dict[str, Any]]:
+    utterance = _audio(args.utterance_seconds, args.in_rate)
+    reply = _chunks(_audio(args.reply_seconds, args.tts_rate), args.tts_rate)
+    ack_pipecat = _chunks(_audio(0.8, args.ack_rate), args.ack_rate)
+    # Converted once by AckClip.at_rate and shared by every session
+    ack_session = _chunks(_audio(0.8, args.out_rate), args.out_rate)
+    session_seconds = args.turns * (args.utterance_seconds + args.reply_seconds)
+
+    results = []
+    for path, session, ack in (("pipecat", _pipecat_session, ack_pipecat), ("session", _session_session, ack_session)):
+        session(1, utterance, ack, reply, args)  # Warm-up
+        started = time.thread_time()
+        for _ in range(args.repeat):
+            resamplers = session(args.turns, utterance, ack, reply, args)
+        cpu = (time.thread_time() - started) / args.repeat
+        results.append({
+            "path": path,
+            "quality": "VHQ" if path == "pipecat" else RESAMPLER_QUALITY,
+            "resamplers": resamplers,
+            "cpu_ms_per_session": round(cpu * 1000, 1),
+            "cpu_ms_per_audio_minute": round(cpu * 1000 * 60 / session_seconds, 1),
+            "sessions_per_core": round(session_seconds / cpu),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resampling CPU per session")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--utterance-seconds", type=float, default=3.0)
+    parser.add_argument("--reply-seconds", type=float, default=5.0)
+    parser.add_argument("--in-rate", type=int, default=48000, help="Rate of the user audio reaching the accumulator")
+    parser.add_argument("--tts-rate", type=int, default=16000)
+    parser.add_argument("--ack-rate", type=int, default=22050)
+    parser.add_argument("--ack-ratio", type=float, default=0.3, help="Share of turns with an acknowledgement")
+    parser.add_argument("--out-rate", type=int, default=24000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    baseline = results[0]["cpu_ms_per_session"]
+    for result in results:
+        change = f"  {(result['cpu_ms_per_session'] / baseline - 1) * 100:+.0f}%" if result is not results[0] else ""
+        print(f"{result['path']:<9}{result['quality']:<5}{result['resamplers']:>3} resamplers"
+              f"{result['cpu_ms_per_session']:>10} ms/session{result['cpu_ms_per_audio_minute']:>8} ms/audio-min"
+              f"{result['sessions_per_core']:>8} sessions/core{change}")
+
+
+if __name__ == "__main__":
+    main()
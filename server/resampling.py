@@ -0,0 +1,143 @@
+import os
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import soxr
+from pipecat.audio.resamplers.base_audio_resampler import BaseAudioResampler
+
+# One resampler per session stream (see SessionResamplers); false: pipecat's own per-stage resamplers
+SESSION_RESAMPLING = os.getenv("SESSION_RESAMPLING", "true").lower() == "true"
+# soxr quality of the session resamplers: QQ, LQ, MQ, HQ or VHQ; VHQ matches pipecat's stream resampler
+RESAMPLER_QUALITY = os.getenv("RESAMPLER_QUALITY", "VHQ")
+# A stream's filter history is cleared after a gap this long, so one utterance's tail can't leak into the next
+RESAMPLER_CLEAR_AFTER_MS = float(os.getenv("RESAMPLER_CLEAR_AFTER_MS", "200"))
+
+# Rate of the audio sent in one-shot STT requests
+STT_SAMPLE_RATE = 16000
+
+
+class CachedStreamResampler(BaseAudioResampler):
+    """Stream resampler that keeps one soxr stream per rate pair for its whole life.
+
+    Pipecat's stream resampler is bound to the first rate pair it sees and raises on any
+    other, so a stage that gets audio at two rates (e.g. TTS and an acknowledgement clip)
+    needs a new resampler. This one keeps the filter state of every pair it has used,
+    returns audio at the target rate untouched, and counts the CPU time it spends.
+    """
+
+    def __init__(self, quality: str = RESAMPLER_QUALITY):
+        self._quality = quality
+        self._streams: Dict[Tuple[int, int], soxr.ResampleStream] = {}
+        self._last_used: Dict[Tuple[int, int], float] = {}
+        self.cpu_seconds = 0.0
+        self.samples_in = 0
+        self.passthrough_samples = 0
+
+    def _stream(self, in_rate: int, out_rate: int) -> soxr.ResampleStream:
+        key = (in_rate, out_rate)
+        stream = self._streams.get(key)
+        now = time.monotonic()
+        if stream is None:
+            stream = self._streams[key] = soxr.ResampleStream(in_rate, out_rate, 1, dtype="int16", quality=self._quality)
+        elif now - self._last_used[key] > RESAMPLER_CLEAR_AFTER_MS / 1000:
+            stream.clear()
+        self._last_used[key] = now
+        return stream
+
+    async def resample(self, audio: bytes, in_rate: int, out_rate: int) -> bytes:
+        if in_rate == out_rate:
+            self.passthrough_samples += len(audio) // 2
+            return audio
+        started = time.thread_time()
+        result = self._stream(in_rate, out_rate).resample_chunk(np.frombuffer(audio, dtype=np.int16)).tobytes()
+        self.cpu_seconds += time.thread_time() - started
+        self.samples_in += len(audio) // 2
+        return result
+
+    async def resample_whole(self, audio: bytes, in_rate: int, out_rate: int) -> bytes:
+        """A complete buffer (e.g. one utterance): flushed to the end, then the stream starts over."""
+        if in_rate == out_rate:
+            self.passthrough_samples += len(audio) // 2
+            return audio
+        started = time.thread_time()
+        stream = self._stream(in_rate, out_rate)
+        result = stream.resample_chunk(np.frombuffer(audio, dtype=np.int16), last=True).tobytes()
+        stream.clear()
+        self.cpu_seconds += time.thread_time() - started
+        self.samples_in += len(audio) // 2
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pairs": [f"{i}->{o}" for i, o in self._streams],
+            "cpu_ms": round(self.cpu_seconds * 1000, 2),
+            "samples_in": self.samples_in,
+            "passthrough_samples": self.passthrough_samples,
+        }
+
+
+class SessionResamplers:
+    """The resamplers of one session, one per stream ("output", "stt"), shared by every stage on it."""
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self._streams: Dict[str, CachedStreamResampler] = {}
+        get_resampling_stats().register(self)
+
+    def stream(self, name: str) -> CachedStreamResampler:
+        resampler = self._streams.get(name)
+        if resampler is None:
+            resampler = self._streams[name] = CachedStreamResampler()
+        return resampler
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "cpu_ms": round(sum(r.cpu_seconds for r in self._streams.values()) * 1000, 2),
+            "streams": {name: r.stats() for name, r in self._streams.items()},
+        }
+
+
+def attach_output_resampler(output, resampler: BaseAudioResampler):
+    """Makes an output transport resample with `resampler` instead of one of its own per media sender."""
+    set_transport_ready = output.set_transport_ready
+
+    async def set_transport_ready_with_resampler(frame):
+        await set_transport_ready(frame)
+        for sender in output._media_senders.values():
+            sender._resampler = resampler
+
+    output.set_transport_ready = set_transport_ready_with_resampler
+
+
+class ResamplingStats:
+    """Resampling CPU of the sessions still running."""
+
+    def __init__(self):
+        self._sessions = weakref.WeakSet()
+        self.sessions = 0
+
+    def register(self, resamplers: SessionResamplers):
+        self._sessions.add(resamplers)
+        self.sessions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        active = [s.stats() for s in list(self._sessions)]
+        return {
+            "enabled": SESSION_RESAMPLING,
+            "quality": RESAMPLER_QUALITY,
+            "sessions": self.sessions,
+            "active": active,
+        }
+
+
+_stats: Optional[ResamplingStats] = None
+
+
+def get_resampling_stats() -> ResamplingStats:
+    global _stats
+    if _stats is None:
+        _stats = ResamplingStats()
+    return _stats
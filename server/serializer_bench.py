@@ -0,0 +1,119 @@
+"""Measures outbound serialization throughput per core: the generic protobuf path vs the fast path.
+
+Each case serializes the same frame in a loop on one thread for a fixed CPU-time budget
+and reports frames per CPU second. For audio that is also expressed as real-time sessions
+one core could serialize (a session sends one chunk every --chunk-ms). Before timing, the
+fast-path bytes are decoded and checked against what the client reads from the generic ones.
+
+Usage:
+    python serializer_bench.py [--seconds 2] [--sample-rate 24000] [--chunk-ms 40] [--json]
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+import pipecat.frames.protobufs.frames_pb2 as frame_protos
+from pipecat.frames.frames import OutputAudioRawFrame, OutputTransportMessageFrame
+from pipecat.serializers.protobuf import ProtobufFrameSerializer
+
+from audio_codec import CodecProtobufSerializer, opus_available
+
+# Representative server-messages: a per-turn metric and a bot transcription
+METRICS_MESSAGE = {"label": "rtvi-ai", "type": "server-message",
+                   "data": {"type": "metrics", "payload": {"type": "tts_latency", "value": 0.4213}}}
+TRANSCRIPTION_MESSAGE = {"label": "rtvi-ai", "type": "server-message",
+                         "data": {"type": "transcription", "participant": "Bot",
+                                  "text": "Sure, your order will arrive tomorrow between ten and twelve."}}
+
+
+def _client_view(data: bytes) -> Dict[str, Any]:
+    """The fields the browser client reads from an outbound frame."""
+    proto = frame_protos.Frame.FromString(data)
+    if proto.WhichOneof("frame") == "audio":
+        return {"audio": proto.audio.audio, "sample_rate": proto.audio.sample_rate,
+                "num_channels": proto.audio.num_channels, "opus": proto.audio.name == "opus"}
+    return {"message": json.loads(proto.message.data)}
+
+
+def _measure(serialize: Callable[[], Any], seconds: float) -> float:
+    """Calls per CPU second of `serialize`, a coroutine function that never suspends.
+
+    The coroutines are stepped directly: going through an event loop per call would mostly
+    measure the loop.
+    """
+    calls = 0
+    batch = 200
+    started = time.process_time()
+    while time.process_time() - started < seconds:
+        for _ in range(batch):
+            try:
+                serialize().send(None)
+            except StopIteration:
+                pass
+        calls += batch
+    return calls / (time.process_time() - started)
+
+
+def run(seconds: float, sample_rate: int, chunk_ms: int) -> List[Dict[str, Any]]:
+    audio = OutputAudioRawFrame(bytes(int(sample_rate * chunk_ms / 1000) * 2), sample_rate=sample_rate, num_channels=1)
+    generic = ProtobufFrameSerializer()
+    fast = CodecProtobufSerializer()
+    cases = [
+        ("audio pcm", "generic", lambda: generic.serialize(audio)),
+        ("audio pcm", "fast", lambda: fast.serialize(audio)),
+    ]
+    if opus_available():
+        opus = CodecProtobufSerializer(audio_codec="opus")
+        cases.append(("audio opus", "fast", lambda: opus.serialize(audio)))
+    for name, message in (("metrics message", METRICS_MESSAGE), ("transcription message", TRANSCRIPTION_MESSAGE)):
+        frame = OutputTransportMessageFrame(message=message)
+        cases.append((name, "generic", lambda frame=frame: generic.serialize(frame)))
+        cases.append((name, "fast", lambda frame=frame: fast.serialize(frame)))
+
+    # Same bytes as far as the client is concerned
+    for frame in (audio, OutputTransportMessageFrame(message=METRICS_MESSAGE),
+                  OutputTransportMessageFrame(message=TRANSCRIPTION_MESSAGE)):
+        expected = _client_view(asyncio.run(generic.serialize(frame)))
+        actual = _client_view(asyncio.run(fast.serialize(frame)))
+        if expected != actual:
+            raise SystemExit(f"Fast path differs for {type(frame).__name__}: {actual} != {expected}")
+
+    results = []
+    frames_per_session = 1000 / chunk_ms
+    for name, path, serialize in cases:
+        rate = _measure(serialize, seconds)
+        result = {"case": name, "path": path, "frames_per_cpu_second": round(rate)}
+        if name.startswith("audio"):
+            result["realtime_sessions_per_core"] = round(rate / frames_per_session)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outbound serializer throughput per core")
+    parser.add_argument("--seconds", type=float, default=2.0, help="CPU seconds per case")
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--chunk-ms", type=int, default=40, help="Audio chunk the output transport writes")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.seconds, args.sample_rate, args.chunk_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    baseline = {}
+    for result in results:
+        if result["path"] == "generic":
+            baseline[result["case"]] = result["frames_per_cpu_second"]
+        speedup = ""
+        if result["path"] == "fast" and result["case"] in baseline:
+            speedup = f"  x{result['frames_per_cpu_second'] / baseline[result['case']]:.1f}"
+        sessions = result.get("realtime_sessions_per_core")
+        sessions = f"  ({sessions} sessions/core)" if sessions else ""
+        print(f"{result['case']:<24}{result['path']:<9}{result['frames_per_cpu_second']:>10}/s{speedup}{sessions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,28 @@
+import time
+# Startup is measured from here for STARTUP_BUDGET_MS (see bot_loader)
+_MODULE_START = time.monotonic()
+
 import asyncio
 import os
+import signal
 import argparse
-import websockets
+import hmac
+import uuid
 from contextlib import asynccontextmanager
 from typing import Any, Dict, Optional
-from urllib.parse import quote
+from urllib.parse import parse_qsl, quote, urlencode
 
 import uvicorn
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, WebSocket
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from pydantic import BaseModel, ValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from loguru import logger
 
 # Load environment variables
 load_dotenv(override=True)
 
-# Monkey-patch pipecat-ai to fix a bug in the library
-# The GeminiMultimodalLiveLLMService uses the 'websockets' library but doesn't import it.
-# This patch injects the websockets module into the library's namespace.
-import pipecat.services.gemini_multimodal_live.gemini
-pipecat.services.gemini_multimodal_live.gemini.websockets = websockets
-
-# Monkey-patch for google-genai BaseApiClient to fix AttributeError in aclose
-from google.genai._api_client import BaseApiClient
-
-async def patched_aclose(self):
-    if hasattr(self, '_async_httpx_client') and self._async_httpx_client:
-        try:
-            await self._async_httpx_client.aclose()
-        except Exception:
-            pass
-    if hasattr(self, '_aiohttp_session') and self._aiohttp_session:
-        try:
-            await self._aiohttp_session.close()
-        except Exception:
-            pass
-
-BaseApiClient.aclose = patched_aclose
-
 # Monkey-patch for Pipecat FrameProcessor to fix bug when frames arrive before StartFrame
 from pipecat.processors.frame_processor import FrameProcessor
 from pipecat.frames.frames import SystemFrame
@@ -67,14 +51,50 @@ async def patched_input_frame_task_handler(self):
 
 FrameProcessor._FrameProcessor__input_frame_task_handler = patched_input_frame_task_handler
 
-from agent_live import run_agent_live
-from agent import run_agent
+from bot_loader import STARTUP_WARMUP, check_startup_budget, get_bot_module, startup_report, warm_up
 from system_prompt import SYSTEM_PROMPT, tts_prompt
+from model_router import get_model_router
+from tracing import get_session_trace, latency_breakdown_stats, list_session_traces
+from tool_engine import close_http_session
+from audio_codec import opus_available
+from vad_batcher import shutdown_vad_scheduler, vad_scheduler_stats
+from session_recorder import RECORDING_ALLOW_CLIENT, start_session_recording
+from static_assets import StaticAssetCache
+from session_store import (SESSION_CONFIG_STORE, SESSION_PREWARM, SESSION_PREWARM_PER_CLIENT, SESSION_TOKEN_TTL_SECONDS,
+                           PreparedSession, get_session_store)
+from session_registry import RegisteredSession, get_session_registry, issue_resume_secret, session_registry_stats
+from profiler import get_pipeline_profile
+from stt_race import get_stt_race_stats
+from tts_hedge import get_tts_hedger
+from endpoint_manager import REGION_ROUTING, get_endpoint_manager
+from ack_bank import get_ack_bank
+from output_pacing import get_output_pacing_stats
+from resampling import get_resampling_stats
+from session_memory import get_session_memory
+from drain import DRAIN_DEADLINE_SECONDS, DRAIN_ON_SIGTERM, get_drain_controller
+
+static_assets = StaticAssetCache()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handles FastAPI startup and shutdown."""
+    if os.path.exists(static_assets.root):
+        await asyncio.to_thread(static_assets.load)
+    # Sessions can turn acknowledgements on with ack_audio, so the bank is read whatever ACK_AUDIO says
+    await asyncio.to_thread(get_ack_bank().load)
+    # Bot modules are imported lazily per bot_type; warm-up preloads the enabled ones
+    if STARTUP_WARMUP:
+        await asyncio.to_thread(warm_up)
+    check_startup_budget((time.monotonic() - _MODULE_START) * 1000)
+    if REGION_ROUTING:
+        # Probes run in the background; sessions stay on GCP_LOCATION until the first round is in
+        await get_endpoint_manager().start()
     yield  # Run app
+    await get_endpoint_manager().stop()
+    await get_session_store().close()
+    await get_session_registry().close()
+    await close_http_session()
+    shutdown_vad_scheduler()
 
 # Initialize FastAPI app with lifespan manager
 app = FastAPI(lifespan=lifespan)
@@ -88,9 +108,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SessionParams(BaseModel):
+    """The /ws query parameters, parsed from the /connect request when the config store is on."""
+
+    bot_type: str = "tts-llm-stt"
+    model: str = "gemini-live-2.5-flash-native-audio"
+    voice: Optional[str] = "Puck"
+    language: str = "en-US"
+    system_instruction: Optional[str] = None
+    tts: bool = True
+    tts_voice: str = "en-US-Chirp3-HD-Aoede"
+    tts_model: str = "google-tts"
+    tts_pace: float = 0.80
+    llm_model: str = "gemini-2.5-flash"
+    stt_model: str = "latest_long"
+    stt_language: str = "en-US"
+    stt_race: Optional[str] = None
+    ack_audio: Optional[bool] = None
+    output_pacing: Optional[bool] = None
+    tools: Optional[str] = None
+    skip_stt: bool = False
+    tts_aggregation: str = "clause"
+    audio_codec: str = "pcm"
+    vad_mode: Optional[str] = None
+    vad_start_sensitivity: Optional[str] = None
+    vad_end_sensitivity: Optional[str] = None
+    vad_silence_ms: Optional[int] = None
+    vad_prefix_padding_ms: Optional[int] = None
+    resume_handle: Optional[str] = None
+    # Continue a session from the registry (e.g. after a drain hand-off), on any instance
+    resume_session: Optional[str] = None
+    # Issued with the session (/connect, drain messages); resume_session needs it
+    resume_secret: Optional[str] = None
+    record: bool = False
+
+
+async def compile_session(session_id: str, bot_type: str, raw: Dict[str, Any]) -> PreparedSession:
+    """Validates and compiles the config of a session (strictly: bad params raise ValueError)."""
+    bot = await get_bot_module(bot_type)
+    if bot_type == "gemini-live":
+        config = bot.compile_live_config(**raw, strict=True)
+    else:
+        config = bot.compile_agent_config(**raw, session_id=session_id, strict=True)
+    return PreparedSession(session_id, bot_type, raw, config)
+
+
+async def prepare_session(params: SessionParams, client: Optional[str] = None) -> PreparedSession:
+    """Validates and compiles the config once, then starts warming the session's resources.
+
+    The params also go to the session registry under the token, so the /ws can land on
+    another instance; that one compiles them again and only misses the pre-warming.
+    """
+    session_id = uuid.uuid4().hex
+    resuming = {"resume_session", "resume_secret"}
+    raw = params.model_dump(exclude_none=True, exclude=resuming)
+    if params.resume_session:
+        record = await get_session_registry().resumable_session(params.resume_session, params.resume_secret)
+        if record and record.get("bot_type") == params.bot_type:
+            # Same session id, the params it started with (overridden only by what this request sets),
+            # and its latest resumption handle
+            session_id = params.resume_session
+            raw = {**record.get("params", {}), **params.model_dump(exclude_unset=True, exclude_none=True, exclude=resuming)}
+            if record.get("resume_handle") and not params.resume_handle:
+                raw["resume_handle"] = record["resume_handle"]
+        else:
+            logger.info(f"Session {params.resume_session} not resumable here, starting a new one")
+    prepared = await compile_session(session_id, params.bot_type, raw)
+    prepared.client = client
+    # A new secret on every /connect, so resuming also retires the one the client used
+    prepared.resume_secret = issue_resume_secret()
+    if SESSION_PREWARM and get_session_store().warming(client) >= SESSION_PREWARM_PER_CLIENT:
+        logger.info(f"Client {client} already holds {SESSION_PREWARM_PER_CLIENT} pre-warmed sessions, not warming {session_id}")
+    elif SESSION_PREWARM:
+        bot = await get_bot_module(params.bot_type)
+        if params.bot_type == "gemini-live":
+            prepared.start_warming(lambda: bot.prewarm_live_session(prepared.config), bot.release_live_session)
+        else:
+            prepared.start_warming(lambda: bot.prewarm_agent_session(prepared.config), None)
+    get_session_store().put(prepared)
+    await get_session_registry().put_config(prepared.token, session_id, params.bot_type, raw, SESSION_TOKEN_TTL_SECONDS,
+                                            resume_secret=prepared.resume_secret)
+    return prepared
+
+
+async def claim_session(token: str) -> Optional[PreparedSession]:
+    """The session behind a /connect token: the local one (pre-warmed), or one issued by another instance."""
+    prepared = get_session_store().take(token)
+    # Taken from the registry either way, so the token stays single use across instances
+    shared = await get_session_registry().take_config(token)
+    if prepared or not shared:
+        return prepared
+    try:
+        prepared = await compile_session(shared["session_id"], shared["bot_type"], shared["params"])
+    except (ValidationError, ValueError, KeyError) as e:
+        logger.warning(f"Session config from the registry no longer compiles: {e}")
+        return None
+    prepared.resume_secret = shared.get("resume_secret")
+    logger.info(f"Session {prepared.session_id} issued by another instance, compiled here")
+    return prepared
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
+    token: Optional[str] = None,
     bot_type: str = "tts-llm-stt",
     model: str = "gemini-live-2.5-flash-native-audio",
     #gemini-2.5-flash-native-audio-preview-09-2025
@@ -104,14 +225,63 @@ async def websocket_endpoint(
     llm_model: str = "gemini-2.5-flash",
     stt_model: str = "latest_long",
     stt_language: str = "en-US",
+    stt_race: Optional[str] = None,
+    ack_audio: Optional[bool] = None,
+    output_pacing: Optional[bool] = None,
     tools: Optional[str] = None,
     skip_stt: bool = False,
+    tts_aggregation: str = "clause",
+    audio_codec: str = "pcm",
+    vad_mode: Optional[str] = None,
+    vad_start_sensitivity: Optional[str] = None,
+    vad_end_sensitivity: Optional[str] = None,
+    vad_silence_ms: Optional[int] = None,
+    vad_prefix_padding_ms: Optional[int] = None,
+    resume_handle: Optional[str] = None,
+    resume_session: Optional[str] = None,
+    resume_secret: Optional[str] = None,
+    record: bool = False,
 ):
     await websocket.accept()
-    print("WebSocket connection accepted")
+    if get_drain_controller().draining:
+        # 1013 "try again later": the client goes back through /connect to another instance
+        stale = get_session_store().take(token) if token else None
+        if stale:
+            await stale.discard()
+        await websocket.close(code=1013, reason="Instance is draining")
+        return
+    prepared = None
+    if token:
+        prepared = await claim_session(token)
+        if not prepared:
+            # Expired or already used
+            await websocket.close(code=1008, reason="Unknown or expired session token")
+            return
+        session_id, bot_type, record = prepared.session_id, prepared.bot_type, prepared.params.get("record", False)
+        recorded_params = prepared.params
+    else:
+        session_id = uuid.uuid4().hex
+        recorded_params = dict(websocket.query_params)
+        if record and not recording_allowed(websocket.headers):
+            logger.warning("Ignoring record=true from a client without the admin token")
+            record = False
+        previous = await get_session_registry().resumable_session(resume_session, resume_secret) if resume_session else None
+        if previous and previous.get("bot_type") == bot_type:
+            session_id = resume_session
+            resume_handle = resume_handle or previous.get("resume_handle")
+    try:
+        bot = await get_bot_module(bot_type)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    print(f"WebSocket connection accepted (session {session_id})")
+    recorder = start_session_recording(session_id, bot_type, recorded_params, enabled=record)
+    registered = RegisteredSession(session_id, bot_type, recorded_params,
+                                   resume_secret=prepared.resume_secret if prepared else None)
+    registered.start()
     try:
         if bot_type == "gemini-live":
-            await run_agent_live(
+            await bot.run_agent_live(
                 websocket,
                 model=model,
                 voice=voice,
@@ -120,28 +290,64 @@ async def websocket_endpoint(
                 tts=tts,
                 tts_pace=tts_pace,
                 tools=tools,
+                session_id=session_id,
+                tts_aggregation=tts_aggregation,
+                audio_codec=audio_codec,
+                vad_mode=vad_mode,
+                vad_start_sensitivity=vad_start_sensitivity,
+                vad_end_sensitivity=vad_end_sensitivity,
+                vad_silence_ms=vad_silence_ms,
+                vad_prefix_padding_ms=vad_prefix_padding_ms,
+                resume_handle=resume_handle,
+                ack_audio=ack_audio,
+                output_pacing=output_pacing,
+                recorder=recorder,
+                prepared=prepared,
+                registered=registered,
             )
         elif bot_type == "tts-llm-stt":
-            await run_agent(
+            await bot.run_agent(
                 websocket,
                 tts_voice=tts_voice,
                 tts_pace=tts_pace,
                 llm_model=llm_model,
                 stt_model=stt_model,
                 stt_language=stt_language,
+                stt_race=stt_race,
+                ack_audio=ack_audio,
+                output_pacing=output_pacing,
                 tts_model=tts_model,
                 system_instruction=system_instruction,
                 skip_stt=skip_stt,
+                session_id=session_id,
+                audio_codec=audio_codec,
+                recorder=recorder,
+                prepared=prepared,
+                registered=registered,
             )
     except Exception as e:
         print(f"Exception in run_bot: {e}")
+    finally:
+        await registered.end()
+        if recorder:
+            recorder.close()
 
 
 @app.post("/connect")
 async def bot_connect(request: Request) -> Dict[Any, Any]:
+    if get_drain_controller().draining:
+        # Shutting down: the client retries and lands on another instance
+        raise HTTPException(status_code=503, detail="Instance is draining", headers={"Retry-After": "1"})
+
     # Get the original query string from the incoming request (e.g., "model=...&voice=...")
     query_params = request.url.query
 
+    # Codec negotiation: only hand out Opus when this server can actually encode/decode it
+    audio_codec = request.query_params.get("audio_codec", "pcm")
+    if audio_codec == "opus" and not opus_available():
+        query_params = query_params.replace("audio_codec=opus", "audio_codec=pcm")
+        audio_codec = "pcm"
+
     # Try to get parameters from the JSON body
     try:
         body = await request.json()
@@ -174,6 +380,21 @@ async def bot_connect(request: Request) -> Dict[Any, Any]:
     except Exception:
         # Body is not JSON or is empty, so we just ignore it
         pass
+
+    if SESSION_CONFIG_STORE:
+        # Compile the config here and hand out a short token instead of the whole config
+        try:
+            params = SessionParams(**dict(parse_qsl(query_params, keep_blank_values=True)))
+            if params.record and not recording_allowed(request.headers):
+                logger.warning("Ignoring record=true from a client without the admin token")
+                params.record = False
+            prepared = await prepare_session(params, client=request.client.host if request.client else None)
+        except (ValidationError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query_params = urlencode({"token": prepared.token})
+        session_id, resume_secret = prepared.session_id, prepared.resume_secret
+    else:
+        session_id = resume_secret = None
     
     # Check if running in production (e.g., on Cloud Run)
     is_production = "K_SERVICE" in os.environ
@@ -187,25 +408,217 @@ async def bot_connect(request: Request) -> Dict[Any, Any]:
 
     print(f"Generated WS URL for client: {ws_url}") # Helpful for debugging
     
-    return {"ws_url": ws_url}
+    # The client can pass session_id back as resume_session, with resume_secret, to continue this session on any instance
+    return {"ws_url": ws_url, "audio_codec": audio_codec, "session_id": session_id, "resume_secret": resume_secret}
 
 
 @app.get("/connect/system-prompt")
 async def get_system_prompt():
     return {"system_prompt": SYSTEM_PROMPT}
 
-# Mount the static files directory
-if os.path.exists("client/dist"):
-    app.mount("/assets", StaticFiles(directory="client/dist/assets"), name="assets")
-    
+
+def admin_authorized(headers) -> bool:
+    # Admin access needs ADMIN_TOKEN; ADMIN_OPEN=true opens it for local development only
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        return os.getenv("ADMIN_OPEN", "false").lower() == "true"
+    return hmac.compare_digest(headers.get("x-admin-token", ""), admin_token)
+
+
+def require_admin(request: Request):
+    if not admin_authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+def recording_allowed(headers) -> bool:
+    """Whether a client's record=true is honored: for every client, or for callers with the admin token."""
+    return RECORDING_ALLOW_CLIENT or admin_authorized(headers)
+
+
+@app.get("/admin/sessions")
+async def admin_list_sessions(request: Request):
+    require_admin(request)
+    return {"sessions": list_session_traces()}
+
+
+@app.get("/admin/sessions/{session_id}/trace")
+async def admin_session_trace(session_id: str, request: Request):
+    require_admin(request)
+    tracer = get_session_trace(session_id)
+    if not tracer:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {**tracer.summary(), "events": tracer.events(), "turn_breakdowns": tracer.turn_breakdowns()}
+
+
+@app.get("/admin/latency")
+async def admin_latency_breakdown(request: Request, bot_type: Optional[str] = None):
+    require_admin(request)
+    return latency_breakdown_stats(bot_type)
+
+
+@app.get("/admin/startup")
+async def admin_startup_report(request: Request):
+    require_admin(request)
+    return startup_report()
+
+
+@app.get("/admin/drain")
+async def admin_drain_status(request: Request):
+    require_admin(request)
+    return get_drain_controller().stats()
+
+
+@app.get("/admin/session-store")
+async def admin_session_store(request: Request):
+    require_admin(request)
+    return get_session_store().stats()
+
+
+@app.get("/admin/session-registry")
+async def admin_session_registry(request: Request):
+    require_admin(request)
+    return session_registry_stats()
+
+
+@app.get("/admin/session-registry/{session_id}")
+async def admin_session_registry_record(session_id: str, request: Request):
+    require_admin(request)
+    record = await get_session_registry().get_session(session_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return record
+
+
+@app.get("/admin/routing")
+async def admin_llm_routing(request: Request):
+    require_admin(request)
+    return get_model_router().stats()
+
+
+@app.get("/admin/profile")
+async def admin_pipeline_profile(request: Request, reset: bool = False):
+    require_admin(request)
+    profile = get_pipeline_profile()
+    summary = profile.summary()
+    if reset:
+        profile.reset()
+    return summary
+
+
+@app.get("/admin/profile/collapsed", response_class=PlainTextResponse)
+async def admin_pipeline_profile_collapsed(request: Request):
+    require_admin(request)
+    # Feed to flamegraph.pl or speedscope
+    return get_pipeline_profile().collapsed()
+
+
+@app.get("/admin/stt-race")
+async def admin_stt_race(request: Request):
+    require_admin(request)
+    return get_stt_race_stats().stats()
+
+
+@app.get("/admin/tts-hedge")
+async def admin_tts_hedge(request: Request):
+    require_admin(request)
+    return get_tts_hedger().stats()
+
+
+@app.get("/admin/ack-audio")
+async def admin_ack_audio(request: Request):
+    require_admin(request)
+    return get_ack_bank().stats()
+
+
+@app.get("/admin/output-pacing")
+async def admin_output_pacing(request: Request):
+    require_admin(request)
+    return get_output_pacing_stats().stats()
+
+
+@app.get("/admin/resampling")
+async def admin_resampling(request: Request):
+    require_admin(request)
+    return get_resampling_stats().stats()
+
+
+@app.get("/admin/memory")
+async def admin_session_memory(request: Request, sample: bool = False):
+    require_admin(request)
+    memory = get_session_memory()
+    if sample:
+        # A fresh tracemalloc snapshot (only with SESSION_MEMORY_TRACEMALLOC=true)
+        memory.maybe_sample(force=True)
+    return memory.stats()
+
+
+@app.get("/admin/regions")
+async def admin_regions(request: Request):
+    require_admin(request)
+    return get_endpoint_manager().stats()
+
+
+@app.post("/admin/regions/simulate")
+async def admin_regions_simulate(request: Request, location: str, latency_ms: Optional[float] = None,
+                                 fail: bool = False, service: Optional[str] = None):
+    """Local probe mode only: sets the simulated probe of a location (for all services, or one)."""
+    require_admin(request)
+    manager = get_endpoint_manager()
+    try:
+        manager.simulate(service, location, latency_ms, fail)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await manager.probe_once()
+    return manager.stats()
+
+
+@app.get("/admin/inference")
+async def admin_inference_stats(request: Request):
+    require_admin(request)
+    return {"vad": vad_scheduler_stats()}
+
+# Serve the built client from memory (precompressed, ETag/immutable caching)
+if os.path.exists(static_assets.root):
+    @app.get("/assets/{asset_path:path}")
+    async def read_asset(asset_path: str, request: Request):
+        return static_assets.response(request, f"assets/{asset_path}")
+
     @app.get("/{catch_all:path}")
-    async def read_index(catch_all: str):
-        return FileResponse('client/dist/index.html')
+    async def read_index(catch_all: str, request: Request):
+        # Top-level files (favicon etc.) as themselves, every other path is the SPA
+        if catch_all and static_assets.get(catch_all):
+            return static_assets.response(request, catch_all)
+        return static_assets.response(request, "index.html")
+
+class DrainingServer(uvicorn.Server):
+    """Turns the first SIGTERM into a drain: no new sessions, live ones are handed off before exit."""
+
+    async def serve(self, sockets=None):
+        self._loop = asyncio.get_running_loop()
+        # Referenced here so the loop can't collect the drain while it runs
+        self._drain_task: Optional[asyncio.Task] = None
+        await super().serve(sockets)
+
+    def handle_exit(self, sig, frame):
+        if sig == signal.SIGTERM and DRAIN_ON_SIGTERM and not self.should_exit and not get_drain_controller().draining:
+            self._loop.call_soon_threadsafe(self._start_drain)
+            return
+        super().handle_exit(sig, frame)
+
+    def _start_drain(self):
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self._drain_then_exit())
+
+    async def _drain_then_exit(self):
+        await get_drain_controller().drain(DRAIN_DEADLINE_SECONDS)
+        self.should_exit = True
+
 
 async def main():
     port = int(os.environ.get("PORT", 7860))
-    config = uvicorn.Config(app, host="0.0.0.0", port=port)
-    server = uvicorn.Server(config)
+    # Whatever survives the drain deadline gets a short grace period, then is cancelled
+    config = uvicorn.Config(app, host="0.0.0.0", port=port, timeout_graceful_shutdown=1)
+    server = DrainingServer(config)
     await server.serve()
 
 
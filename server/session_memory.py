@@ -0,0 +1,435 @@
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import Frame
+
+# Per-session memory accounting (approximate byte counts of the structures a session grows)
+SESSION_MEMORY_ACCOUNTING = os.getenv("SESSION_MEMORY_ACCOUNTING", "true").lower() == "true"
+# How often each session is measured
+SESSION_MEMORY_INTERVAL_SECONDS = float(os.getenv("SESSION_MEMORY_INTERVAL_SECONDS", "5"))
+# Above this a session is compacted: old context trimmed, old audio turns and buffers dropped (0: off)
+SESSION_MEMORY_SOFT_MB = float(os.getenv("SESSION_MEMORY_SOFT_MB", "32"))
+# Above this, even after compaction, the session is told why and ended gracefully (0: off)
+SESSION_MEMORY_HARD_MB = float(os.getenv("SESSION_MEMORY_HARD_MB", "96"))
+# All sessions of this instance together; above it the largest session is compacted, then ended (0: off)
+SESSION_MEMORY_NODE_MB = float(os.getenv("SESSION_MEMORY_NODE_MB", "0"))
+# Compaction keeps the system prompt and at most this many of the latest context messages
+SESSION_MEMORY_KEEP_MESSAGES = int(os.getenv("SESSION_MEMORY_KEEP_MESSAGES", "12"))
+# Sampled tracemalloc snapshots of the whole process (adds allocation overhead; for debugging)
+SESSION_MEMORY_TRACEMALLOC = os.getenv("SESSION_MEMORY_TRACEMALLOC", "false").lower() == "true"
+# At most one snapshot this often; each is compared with the previous one
+SESSION_MEMORY_TRACEMALLOC_SECONDS = float(os.getenv("SESSION_MEMORY_TRACEMALLOC_SECONDS", "60"))
+SESSION_MEMORY_TRACEMALLOC_TOP = int(os.getenv("SESSION_MEMORY_TRACEMALLOC_TOP", "15"))
+
+SESSION_LIMIT_MESSAGE = "session_limit"
+
+_MB = 1024 * 1024
+# Text buffers are cut down to their tail on compaction
+_BUFFER_KEEP_CHARS = 1024
+# ...and an utterance still being accumulated to its last this many seconds
+_UTTERANCE_KEEP_SECONDS = 30
+# Stops the size walk on pathological object graphs
+_MAX_OBJECTS = 200_000
+_COMPACTED_AUDIO_TEXT = "(earlier audio omitted)"
+
+
+def session_limit_message(reason: str) -> Dict[str, Any]:
+    """RTVI server-message sent before a session is ended for using too much memory."""
+    return {"label": "rtvi-ai", "type": "server-message", "data": {"type": SESSION_LIMIT_MESSAGE, "reason": reason}}
+
+
+def approx_size(obj) -> Tuple[int, int]:
+    """Approximate bytes held by `obj` and everything it references: (objects, binary payloads).
+
+    Binary payloads (bytes, bytearrays, arrays) are counted apart since in a session they
+    are almost always audio. Shared objects are counted once.
+    """
+    objects = binary = 0
+    seen = set()
+    stack = [obj]
+    while stack and len(seen) < _MAX_OBJECTS:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            binary += len(item)
+        elif hasattr(item, "nbytes") and not isinstance(item, type):
+            binary += int(getattr(item, "nbytes", 0) or 0)
+        elif isinstance(item, (str, int, float, bool, type(None))):
+            objects += sys.getsizeof(item)
+        elif isinstance(item, dict):
+            objects += sys.getsizeof(item)
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            objects += sys.getsizeof(item)
+            stack.extend(item)
+        elif hasattr(item, "__dict__") and not callable(item):
+            # Pydantic models (google.genai Content/Part) and plain objects
+            objects += sys.getsizeof(item)
+            stack.extend(vars(item).values())
+        else:
+            objects += sys.getsizeof(item)
+    return objects, binary
+
+
+def _role(message) -> Optional[str]:
+    return message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+
+
+def _is_user_turn(message) -> bool:
+    """A message the user said. Gemini also sends function responses as role "user"; those aren't."""
+    if _role(message) != "user":
+        return False
+    parts = getattr(message, "parts", None) if not isinstance(message, dict) else None
+    return not parts or not all(getattr(part, "function_response", None) is not None for part in parts)
+
+
+def _has_binary(message) -> bool:
+    if isinstance(message, dict):
+        content = message.get("content")
+        return isinstance(content, list) and any(isinstance(part, dict) and part.get("type") != "text"
+                                                 for part in content)
+    return any(getattr(part, "inline_data", None) is not None for part in getattr(message, "parts", None) or [])
+
+
+def _strip_binary(message):
+    """Replaces the audio/image parts of a context message with a short text part."""
+    if isinstance(message, dict):
+        content = message.get("content")
+        if isinstance(content, list):
+            message["content"] = [part if not isinstance(part, dict) or part.get("type") == "text"
+                                  else {"type": "text", "text": _COMPACTED_AUDIO_TEXT} for part in content]
+        return
+    for part in getattr(message, "parts", None) or []:
+        if getattr(part, "inline_data", None) is not None:
+            part.inline_data = None
+            part.text = _COMPACTED_AUDIO_TEXT
+
+
+def compact_context(context, keep: int = SESSION_MEMORY_KEEP_MESSAGES):
+    """Trims an LLM context to the system prompt and its latest turns; only the latest spoken turn keeps its audio.
+
+    The context is only cut right before a user turn, so function calls stay with their
+    responses and every reply with what it answers. That can keep more than `keep`
+    messages when the last user turn is older.
+    """
+    messages = context.messages
+    head = 1 if messages and _role(messages[0]) == "system" else 0
+    tail = messages[head:]
+    if len(tail) > keep:
+        turns = [i for i, message in enumerate(tail) if _is_user_turn(message)]
+        start = next((i for i in turns if i >= len(tail) - keep), turns[-1] if turns else 0)
+        tail = tail[start:]
+    last_audio = max((i for i, message in enumerate(tail) if _is_user_turn(message) and _has_binary(message)),
+                     default=len(tail))
+    for message in tail[:last_audio]:
+        _strip_binary(message)
+    messages[head:] = tail
+
+
+def _frames_in(queue) -> Iterator[Frame]:
+    """Frames waiting in a processor, media sender or pacer queue (without taking them out)."""
+    for item in list(getattr(queue, "_queue", None) or ()):
+        # Processor input queues hold (priority, counter, (frame, direction, callback))
+        while isinstance(item, tuple) and item and not isinstance(item[0], Frame):
+            item = item[-1]
+        frame = item[0] if isinstance(item, tuple) and item else item
+        if isinstance(frame, Frame):
+            yield frame
+
+
+def _queued_bytes(queue) -> int:
+    return sum(len(getattr(frame, "audio", None) or b"") + len(getattr(frame, "text", None) or "")
+               for frame in _frames_in(queue))
+
+
+def _processors(pipeline) -> Iterator[Any]:
+    for processor in getattr(pipeline, "processors", None) or []:
+        if processor is pipeline:
+            continue
+        yield processor
+        if getattr(processor, "processors", None):
+            yield from _processors(processor)
+
+
+class SessionMemory:
+    """Approximate memory of one session, measured per structure, with soft and hard caps.
+
+    Sources are named measure functions, optionally with a compactor. Every
+    SESSION_MEMORY_INTERVAL_SECONDS the session is measured; above the soft cap every
+    compactor runs, and if it is still above the hard cap `on_limit` is called once to end
+    the session gracefully.
+    """
+
+    def __init__(self, session_id: Optional[str] = None, *, on_limit: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.session_id = session_id
+        self._sources: Dict[str, Tuple[Callable[[], int], Optional[Callable[[], None]]]] = {}
+        self._on_limit = on_limit
+        self._task: Optional[asyncio.Task] = None
+        self._started = time.monotonic()
+        self.bytes: Dict[str, int] = {}
+        self.total = 0
+        self.peak = 0
+        self.compactions = 0
+        self.limited = False
+        self._tracer = None
+        get_session_memory().register(self)
+
+    def track(self, name: str, measure: Callable[[], int], compact: Optional[Callable[[], None]] = None):
+        self._sources[name] = (measure, compact)
+
+    def track_context(self, context):
+        """The LLM context: message objects, and the audio turns stored in it (add_audio_frames_message).
+
+        Messages are only walked when they first show up; later checks reuse their sizes, so
+        a long session isn't walked whole every interval. Compaction changes messages in
+        place, so it starts over.
+        """
+        sizes = {}
+        # id(message) -> (message, objects, binary); the message is kept so its id can't be reused
+        known: Dict[int, Tuple[Any, int, int]] = {}
+
+        def measure_objects() -> int:
+            messages = list(context.messages)
+            current = {}
+            for message in messages:
+                entry = known.get(id(message))
+                if entry is None or entry[0] is not message:
+                    entry = (message, *approx_size(message))
+                current[id(message)] = entry
+            known.clear()
+            known.update(current)
+            sizes["objects"] = sys.getsizeof(messages) + sum(entry[1] for entry in current.values())
+            sizes["binary"] = sum(entry[2] for entry in current.values())
+            return sizes["objects"]
+
+        def compact():
+            compact_context(context)
+            known.clear()
+
+        self.track("context", measure_objects, compact)
+        # Measured together with "context", which comes first
+        self.track("context_audio", lambda: sizes.get("binary", 0))
+
+    def track_pipeline(self, pipeline):
+        """Buffers of the pipeline's processors: queued frames, pending utterances and text buffers."""
+        processors = list(_processors(pipeline))
+
+        def queued() -> int:
+            total = 0
+            for processor in processors:
+                for attr in ("_FrameProcessor__input_queue", "_FrameProcessor__process_queue", "_queue"):
+                    total += _queued_bytes(getattr(processor, attr, None))
+                for sender in (getattr(processor, "_media_senders", None) or {}).values():
+                    total += len(getattr(sender, "_audio_buffer", None) or b"")
+                    total += _queued_bytes(getattr(sender, "_audio_queue", None))
+            return total
+
+        self.track("queued_frames", queued)
+        for processor in processors:
+            # Named per processor, so several of them don't overwrite each other
+            if isinstance(getattr(processor, "_audio_frames", None), list):
+                self.track(f"pending_utterance:{processor.name}",
+                           lambda p=processor: sum(len(f.audio) for f in p._audio_frames),
+                           lambda p=processor: self._trim_utterance(p))
+            if isinstance(getattr(processor, "_current_response", None), str):
+                self._track_text(processor, "_current_response", f"current_response:{processor.name}")
+
+    def track_text(self, owner, attr: str, name: Optional[str] = None):
+        """A text buffer kept on `owner` (e.g. the Live service's _post_interruption_buffer)."""
+        self._track_text(owner, attr, name or attr.lstrip("_"))
+
+    def _track_text(self, owner, attr: str, name: str):
+        def compact():
+            text = getattr(owner, attr, "")
+            if len(text) > _BUFFER_KEEP_CHARS:
+                setattr(owner, attr, text[-_BUFFER_KEEP_CHARS:])
+
+        self.track(name, lambda: sys.getsizeof(getattr(owner, attr, "") or ""), compact)
+
+    @staticmethod
+    def _trim_utterance(processor):
+        frames = processor._audio_frames
+        kept, seconds = [], 0.0
+        for frame in reversed(frames):
+            seconds += len(frame.audio) / 2 / (frame.num_channels or 1) / frame.sample_rate
+            if seconds > _UTTERANCE_KEEP_SECONDS:
+                break
+            kept.append(frame)
+        frames[:] = kept[::-1]
+
+    def measure(self) -> int:
+        for name, (measure, _) in self._sources.items():
+            try:
+                self.bytes[name] = measure()
+            except Exception as e:
+                logger.debug(f"Memory of {name} not measured: {e}")
+        self.total = sum(self.bytes.values())
+        self.peak = max(self.peak, self.total)
+        return self.total
+
+    def compact(self) -> int:
+        """Runs every compactor; returns the bytes freed (approximately)."""
+        before = self.total
+        for name, (_, compact) in self._sources.items():
+            if compact:
+                try:
+                    compact()
+                except Exception as e:
+                    logger.warning(f"Compaction of {name} failed: {e}")
+        self.compactions += 1
+        get_session_memory().compactions += 1
+        freed = before - self.measure()
+        logger.info(f"Session {self.session_id}: compacted, {before / _MB:.1f}MB -> {self.total / _MB:.1f}MB")
+        if self._tracer:
+            self._tracer.record("memory_compaction", {"before": before, "after": self.total})
+        return freed
+
+    async def check(self):
+        self.measure()
+        node = get_session_memory()
+        over_node = node.over_budget() and node.largest() is self
+        if (SESSION_MEMORY_SOFT_MB and self.total > SESSION_MEMORY_SOFT_MB * _MB) or over_node:
+            self.compact()
+            over_node = node.over_budget() and node.largest() is self
+        if self.limited:
+            return
+        if (SESSION_MEMORY_HARD_MB and self.total > SESSION_MEMORY_HARD_MB * _MB) or over_node:
+            self.limited = True
+            node.limited += 1
+            reason = "node_memory" if over_node else "session_memory"
+            logger.warning(f"Session {self.session_id}: {self.total / _MB:.1f}MB after compaction, ending it ({reason})")
+            if self._tracer:
+                self._tracer.record("memory_limit", {"bytes": self.total, "reason": reason})
+            if self._on_limit:
+                await self._on_limit(reason)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(SESSION_MEMORY_INTERVAL_SECONDS)
+            try:
+                await self.check()
+                get_session_memory().maybe_sample()
+            except Exception as e:
+                logger.warning(f"Memory check of session {self.session_id} failed: {e}")
+
+    def start(self):
+        if SESSION_MEMORY_ACCOUNTING and self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        get_session_memory().unregister(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "age_seconds": round(time.monotonic() - self._started),
+            "total_mb": round(self.total / _MB, 2),
+            "peak_mb": round(self.peak / _MB, 2),
+            "bytes": dict(sorted(self.bytes.items(), key=lambda kv: -kv[1])),
+            "compactions": self.compactions,
+            "limited": self.limited,
+        }
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SessionMemoryStats:
+    """Memory of the running sessions, node totals, and sampled tracemalloc snapshots."""
+
+    def __init__(self):
+        self._sessions = weakref.WeakSet()
+        self.sessions = 0
+        self.compactions = 0
+        self.limited = 0
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._sampled_at = 0.0
+        self._top: List[Dict[str, Any]] = []
+        if SESSION_MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+
+    def register(self, memory: SessionMemory):
+        self._sessions.add(memory)
+        self.sessions += 1
+
+    def unregister(self, memory: SessionMemory):
+        self._sessions.discard(memory)
+
+    def total(self) -> int:
+        return sum(memory.total for memory in list(self._sessions))
+
+    def over_budget(self) -> bool:
+        return bool(SESSION_MEMORY_NODE_MB) and self.total() > SESSION_MEMORY_NODE_MB * _MB
+
+    def largest(self) -> Optional[SessionMemory]:
+        return max(list(self._sessions), key=lambda memory: memory.total, default=None)
+
+    def maybe_sample(self, force: bool = False):
+        """Takes a tracemalloc snapshot if the last one is old enough, keeping the top growth sites."""
+        if not tracemalloc.is_tracing():
+            return
+        now = time.monotonic()
+        if not force and now - self._sampled_at < SESSION_MEMORY_TRACEMALLOC_SECONDS:
+            return
+        self._sampled_at = now
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        if self._snapshot is None:
+            stats = snapshot.statistics("lineno")[:SESSION_MEMORY_TRACEMALLOC_TOP]
+            self._top = [{"site": str(stat.traceback), "kb": round(stat.size / 1024, 1), "count": stat.count}
+                         for stat in stats]
+        else:
+            stats = snapshot.compare_to(self._snapshot, "lineno")[:SESSION_MEMORY_TRACEMALLOC_TOP]
+            self._top = [{"site": str(stat.traceback), "kb": round(stat.size / 1024, 1),
+                          "growth_kb": round(stat.size_diff / 1024, 1), "count": stat.count} for stat in stats]
+        self._snapshot = snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        active = sorted((memory.snapshot() for memory in list(self._sessions)), key=lambda s: -s["total_mb"])
+        rss = _rss_bytes()
+        return {
+            "enabled": SESSION_MEMORY_ACCOUNTING,
+            "soft_mb": SESSION_MEMORY_SOFT_MB,
+            "hard_mb": SESSION_MEMORY_HARD_MB,
+            "node_mb": SESSION_MEMORY_NODE_MB,
+            "sessions": self.sessions,
+            "compactions": self.compactions,
+            "limited": self.limited,
+            "accounted_mb": round(self.total() / _MB, 2),
+            "rss_mb": round(rss / _MB, 1) if rss else None,
+            "tracemalloc": {
+                "tracing": tracemalloc.is_tracing(),
+                "sampled_seconds_ago": round(time.monotonic() - self._sampled_at) if self._sampled_at else None,
+                "top": self._top,
+            },
+            "active": active,
+        }
+
+
+_stats: Optional[SessionMemoryStats] = None
+
+
+def get_session_memory() -> SessionMemoryStats:
+    global _stats
+    if _stats is None:
+        _stats = SessionMemoryStats()
+    return _stats
@@ -0,0 +1,164 @@
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+RECORD_SESSIONS = os.getenv("RECORD_SESSIONS", "false").lower() == "true"
+# Honors record=true from any client; otherwise only requests carrying the admin token can ask
+RECORDING_ALLOW_CLIENT = os.getenv("RECORDING_ALLOW_CLIENT", "false").lower() == "true"
+RECORDING_DIR = os.getenv("RECORDING_DIR", "recordings")
+# The file is grown (and remapped) in steps of this size, then truncated on close
+RECORDING_GROW_BYTES = int(os.getenv("RECORDING_GROW_BYTES", str(4 * 1024 * 1024)))
+# A recording stops (and is kept) once it reaches this size
+RECORDING_MAX_BYTES = int(os.getenv("RECORDING_MAX_BYTES", str(64 * 1024 * 1024)))
+# Retention: the oldest recordings beyond this count, or older than this age, are deleted when one starts
+RECORDING_MAX_FILES = int(os.getenv("RECORDING_MAX_FILES", "100"))
+RECORDING_MAX_AGE_HOURS = float(os.getenv("RECORDING_MAX_AGE_HOURS", "72"))
+
+# Params never written to a recording's metadata
+_SECRET_PARAMS = ("token", "resume_handle", "resume_session", "resume_secret")
+# Keys of a tool's "backend" that may carry endpoints or credentials
+_SECRET_BACKEND_KEYS = ("url", "headers")
+
+# Record kinds
+REC_META = 0            # JSON session metadata, always the first record
+REC_INBOUND = 1         # serialized frame received from the client
+REC_OUTBOUND = 2        # serialized frame sent to the client
+REC_LIVE_MESSAGE = 3    # Gemini LiveServerMessage as JSON
+
+MAGIC = b"GLREC001"
+# kind (uint8), seconds since recording start (float64), payload length (uint32)
+_HEADER = struct.Struct("<BdI")
+
+
+class SessionRecorder:
+    """Append-only, memory-mapped recording of one session's wire traffic.
+
+    Each record is a fixed header followed by the raw payload, so recording costs one
+    memcpy into the mapping; nothing is decoded or formatted on the hot path.
+    """
+
+    def __init__(self, path: str, metadata: Dict[str, Any]):
+        self.path = path
+        self._start = time.monotonic()
+        self._file = open(path, "w+b")
+        self._size = RECORDING_GROW_BYTES
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._map[:len(MAGIC)] = MAGIC
+        self._offset = len(MAGIC)
+        self._closed = False
+        self.record(REC_META, json.dumps(metadata).encode("utf-8"))
+
+    def record(self, kind: int, payload: bytes):
+        if self._closed:
+            return
+        end = self._offset + _HEADER.size + len(payload)
+        if end > RECORDING_MAX_BYTES:
+            logger.warning(f"Session recording {self.path} reached RECORDING_MAX_BYTES, stopping it")
+            self.close()
+            return
+        if end > self._size:
+            self._grow(end)
+        _HEADER.pack_into(self._map, self._offset, kind, time.monotonic() - self._start, len(payload))
+        self._map[self._offset + _HEADER.size:end] = payload
+        self._offset = end
+
+    def _grow(self, needed: int):
+        while self._size < needed:
+            self._size += RECORDING_GROW_BYTES
+        self._size = min(self._size, RECORDING_MAX_BYTES)
+        self._map.close()
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        logger.info(f"Session recording written to {self.path} ({self._offset} bytes)")
+
+
+def redact_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Session params without tokens, resumption credentials, or tool backend endpoints and headers."""
+    redacted = {key: value for key, value in params.items() if key not in _SECRET_PARAMS}
+    tools = redacted.get("tools")
+    if tools:
+        try:
+            entries = json.loads(tools)
+        except (TypeError, ValueError):
+            del redacted["tools"]
+            return redacted
+        if isinstance(entries, list):
+            for tool in entries:
+                backend = tool.get("backend") if isinstance(tool, dict) else None
+                if isinstance(backend, dict):
+                    for key in _SECRET_BACKEND_KEYS:
+                        backend.pop(key, None)
+        redacted["tools"] = json.dumps(entries)
+    return redacted
+
+
+def _prune_recordings():
+    """Deletes recordings past RECORDING_MAX_AGE_HOURS, then the oldest beyond RECORDING_MAX_FILES - 1."""
+    try:
+        entries = [entry for entry in os.scandir(RECORDING_DIR) if entry.name.endswith(".rec") and entry.is_file()]
+    except OSError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    cutoff = time.time() - RECORDING_MAX_AGE_HOURS * 3600
+    excess = len(entries) - (RECORDING_MAX_FILES - 1)
+    for i, entry in enumerate(entries):
+        if i >= excess and entry.stat().st_mtime >= cutoff:
+            break
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Could not delete old recording {entry.path}: {e}")
+
+
+def start_session_recording(session_id: str, bot_type: str, params: Dict[str, Any], enabled: bool = False) -> Optional[SessionRecorder]:
+    """Creates a recorder when requested for the session (by an authorized caller) or enabled for the deployment."""
+    if not (enabled or RECORD_SESSIONS) or RECORDING_MAX_FILES <= 0:
+        return None
+    os.makedirs(RECORDING_DIR, exist_ok=True)
+    _prune_recordings()
+    path = os.path.join(RECORDING_DIR, f"{session_id}.rec")
+    metadata = {"session_id": session_id, "bot_type": bot_type, "started_at": time.time(),
+                "params": redact_params(params)}
+    try:
+        return SessionRecorder(path, metadata)
+    except OSError as e:
+        logger.error(f"Could not start session recording at {path}: {e}")
+        return None
+
+
+def iter_recording(path: str) -> Iterator[Tuple[int, float, bytes]]:
+    """Yields (kind, seconds since start, payload) for every record in a recording file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session recording")
+    offset = len(MAGIC)
+    while offset + _HEADER.size <= len(data):
+        kind, t, length = _HEADER.unpack_from(data, offset)
+        if kind == REC_META and t == 0.0 and length == 0:
+            break  # zeroed, never written tail of a recording that was not closed
+        offset += _HEADER.size
+        yield kind, t, data[offset:offset + length]
+        offset += length
+
+
+def load_recording(path: str) -> Tuple[Dict[str, Any], List[Tuple[int, float, bytes]]]:
+    records = list(iter_recording(path))
+    if not records or records[0][0] != REC_META:
+        raise ValueError(f"{path} has no metadata record")
+    return json.loads(records[0][2]), records[1:]
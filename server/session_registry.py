@@ -0,0 +1,474 @@
+"""Cluster-wide session registry: session metadata, Live resumption handles and /connect configs.
+
+Backends: "memory" (this process only) and "redis" (anything speaking the Redis protocol,
+through a small built-in client). For local multi-instance runs and tests, this module is
+also a stand-in Redis server for the handful of commands the registry uses.
+
+Usage:
+    python session_registry.py serve [--host 127.0.0.1] [--port 6379]
+"""
+import argparse
+import asyncio
+from abc import ABC, abstractmethod
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from session_recorder import redact_params
+
+# memory: this instance only (single-instance deployments) | redis: shared through SESSION_REGISTRY_URL
+SESSION_REGISTRY = os.getenv("SESSION_REGISTRY", "memory")
+SESSION_REGISTRY_URL = os.getenv("SESSION_REGISTRY_URL", "redis://127.0.0.1:6379/0")
+# Key prefix, so several deployments can share one Redis
+SESSION_REGISTRY_PREFIX = os.getenv("SESSION_REGISTRY_PREFIX", "voice:")
+# A session record lives this long after its last update, so a client can resume within it on any instance
+SESSION_REGISTRY_TTL_SECONDS = float(os.getenv("SESSION_REGISTRY_TTL_SECONDS", "600"))
+# Running sessions rewrite their record (usage counters, liveness) this often
+SESSION_REGISTRY_HEARTBEAT_SECONDS = float(os.getenv("SESSION_REGISTRY_HEARTBEAT_SECONDS", "15"))
+# Registry calls give up after this long; sessions never wait on the registry beyond it
+SESSION_REGISTRY_TIMEOUT_MS = float(os.getenv("SESSION_REGISTRY_TIMEOUT_MS", "250"))
+
+NODE_ID = f"{os.getenv('K_REVISION') or socket.gethostname()}:{os.getpid()}"
+
+
+def issue_resume_secret() -> str:
+    """The secret a client must show to resume a session; records only keep its hash."""
+    return secrets.token_urlsafe(24)
+
+
+def _secret_hash(secret: str) -> str:
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+
+class SessionRegistry(ABC):
+    """Key/value store of JSON records with per-key TTLs, plus the session-level operations on it.
+
+    Backends implement `_get`, `_set`, `_take` (get and delete in one step) and `_delete`;
+    a backend missing one of them fails when it is constructed.
+    Every public call is bounded by SESSION_REGISTRY_TIMEOUT_MS and never raises: the
+    registry is an accelerator for reconnects, and a session must not fail because of it.
+    """
+
+    backend = "none"
+
+    def __init__(self, prefix: str = SESSION_REGISTRY_PREFIX):
+        self._prefix = prefix
+        self.ops = 0
+        self.errors = 0
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def _set(self, key: str, value: str, ttl: float):
+        ...
+
+    @abstractmethod
+    async def _take(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def _delete(self, key: str):
+        ...
+
+    async def close(self):
+        pass
+
+    async def _call(self, op: str, coroutine, default=None):
+        self.ops += 1
+        try:
+            return await asyncio.wait_for(coroutine, timeout=SESSION_REGISTRY_TIMEOUT_MS / 1000)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Session registry {op} failed ({self.backend}): {e!r}")
+            return default
+
+    def _decode(self, raw: Optional[str]) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self._call("get", self._get(self._prefix + key)))
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: float):
+        await self._call("set", self._set(self._prefix + key, json.dumps(value), ttl))
+
+    async def take(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self._call("take", self._take(self._prefix + key)))
+
+    async def delete(self, key: str):
+        await self._call("delete", self._delete(self._prefix + key))
+
+    # ── Session-level operations ──────────────────────────────────────
+
+    async def put_config(self, token: str, session_id: str, bot_type: str, params: Dict[str, Any], ttl: float,
+                         resume_secret: Optional[str] = None):
+        """The validated /connect params behind a one-time token, for whichever instance gets the /ws."""
+        await self.set(f"config:{token}", {"session_id": session_id, "bot_type": bot_type, "params": params,
+                                           "resume_secret": resume_secret}, ttl)
+
+    async def take_config(self, token: str) -> Optional[Dict[str, Any]]:
+        return await self.take(f"config:{token}")
+
+    async def put_session(self, session_id: str, record: Dict[str, Any], ttl: float = SESSION_REGISTRY_TTL_SECONDS):
+        await self.set(f"session:{session_id}", record, ttl)
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.get(f"session:{session_id}")
+
+    async def resumable_session(self, session_id: str, resume_secret: Optional[str]) -> Optional[Dict[str, Any]]:
+        """A session's record, if `resume_secret` is the one issued with the session."""
+        record = await self.get_session(session_id)
+        if record is None:
+            return None
+        stored = record.get("resume_secret_hash")
+        if not resume_secret or not stored or not hmac.compare_digest(stored, _secret_hash(resume_secret)):
+            logger.warning(f"Not resuming session {session_id}: missing or wrong resume secret")
+            return None
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "node": NODE_ID, "ops": self.ops, "errors": self.errors,
+                "hits": self.hits, "misses": self.misses}
+
+
+class InMemorySessionRegistry(SessionRegistry):
+    """Registry in this process; records are stored serialized, as they would be in Redis."""
+
+    backend = "memory"
+
+    def __init__(self, prefix: str = SESSION_REGISTRY_PREFIX):
+        super().__init__(prefix)
+        self._data: Dict[str, Tuple[float, str]] = {}
+        self._swept = time.monotonic()
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def _sweep(self, now: float):
+        if now - self._swept < 30:
+            return
+        self._swept = now
+        for key in [key for key, (expires, _) in self._data.items() if expires <= now]:
+            del self._data[key]
+
+    async def _get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def _set(self, key: str, value: str, ttl: float):
+        now = time.monotonic()
+        self._sweep(now)
+        self._data[key] = (now + ttl, value)
+
+    async def _take(self, key: str) -> Optional[str]:
+        value = self._live(key)
+        self._data.pop(key, None)
+        return value
+
+    async def _delete(self, key: str):
+        self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "keys": len(self._data)}
+
+
+class _RespConnection:
+    """One connection speaking RESP2; commands are serialized, replies parsed in order."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            raise RuntimeError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [await self._reply() for _ in range(count)]
+        raise RuntimeError(f"unexpected reply {line!r}")
+
+    async def execute(self, *args):
+        async with self._lock:
+            self._writer.write(self.encode(*args))
+            await self._writer.drain()
+            return await self._reply()
+
+    @property
+    def closed(self) -> bool:
+        return self._writer.is_closing()
+
+    async def close(self):
+        self._writer.close()
+
+
+class RedisSessionRegistry(SessionRegistry):
+    """Registry in Redis (or any server speaking its protocol), e.g. Memorystore shared by every instance.
+
+    Uses GET, SET with PX, GETDEL and DEL; one connection per instance, reopened on error.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str = SESSION_REGISTRY_URL, prefix: str = SESSION_REGISTRY_PREFIX):
+        super().__init__(prefix)
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "127.0.0.1"
+        self._port = parsed.port or 6379
+        self._password = parsed.password
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._connection: Optional[_RespConnection] = None
+        self._connecting = asyncio.Lock()
+
+    async def _connect(self) -> _RespConnection:
+        async with self._connecting:
+            if self._connection and not self._connection.closed:
+                return self._connection
+            reader, writer = await asyncio.open_connection(self._host, self._port)
+            connection = _RespConnection(reader, writer)
+            if self._password:
+                await connection.execute("AUTH", self._password)
+            if self._db:
+                await connection.execute("SELECT", self._db)
+            self._connection = connection
+            logger.info(f"Session registry connected to {self._host}:{self._port}/{self._db}")
+            return connection
+
+    async def _execute(self, *args):
+        connection = await self._connect()
+        try:
+            return await connection.execute(*args)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # A timed-out or broken connection may have a reply in flight; never reuse it
+            self._connection = None
+            await connection.close()
+            raise
+
+    async def _get(self, key: str) -> Optional[str]:
+        return await self._execute("GET", key)
+
+    async def _set(self, key: str, value: str, ttl: float):
+        await self._execute("SET", key, value, "PX", max(int(ttl * 1000), 1))
+
+    async def _take(self, key: str) -> Optional[str]:
+        return await self._execute("GETDEL", key)
+
+    async def _delete(self, key: str):
+        await self._execute("DEL", key)
+
+    async def close(self):
+        if self._connection:
+            await self._connection.close()
+            self._connection = None
+
+
+class RegisteredSession:
+    """The registry record of one running session: metadata, resumption handle and usage counters.
+
+    Written when the session starts, on every new resumption handle (so a reconnect after
+    a crash resumes from the latest one), every SESSION_REGISTRY_HEARTBEAT_SECONDS while it
+    runs, and once more when it ends; the record outlives the session by the registry TTL.
+    All writes run in the background, so the session never waits on the registry.
+
+    Resuming needs `resume_secret`, issued with the session (from /connect or here) and
+    handed to its client; the record only stores its hash, and its params are redacted.
+    """
+
+    def __init__(self, session_id: str, bot_type: str, params: Dict[str, Any], resume_secret: Optional[str] = None):
+        self.session_id = session_id
+        self.resume_secret = resume_secret or issue_resume_secret()
+        self.record: Dict[str, Any] = {
+            "session_id": session_id,
+            "bot_type": bot_type,
+            "params": redact_params(params),
+            "resume_secret_hash": _secret_hash(self.resume_secret),
+            "node": NODE_ID,
+            "state": "active",
+            "started_at": time.time(),
+            "updated_at": time.time(),
+            "resume_handle": params.get("resume_handle"),
+            "usage": {},
+            "turns": 0,
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+        _sessions.add(self)
+
+    async def _flush(self):
+        self.record["updated_at"] = time.time()
+        await get_session_registry().put_session(self.session_id, self.record)
+
+    def set_resume_handle(self, handle: Optional[str]):
+        if handle and handle != self.record["resume_handle"]:
+            self.record["resume_handle"] = handle
+            task = asyncio.create_task(self._flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    def add_usage(self, usage: Dict[str, int]):
+        totals = self.record["usage"]
+        for name, count in usage.items():
+            totals[name] = totals.get(name, 0) + (count or 0)
+        self.record["turns"] += 1
+
+    async def _heartbeat(self):
+        while True:
+            await self._flush()
+            await asyncio.sleep(SESSION_REGISTRY_HEARTBEAT_SECONDS)
+
+    def start(self):
+        """Starts writing the record (the first write right away) without holding up the session."""
+        self._task = asyncio.create_task(self._heartbeat())
+
+    async def end(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        _sessions.discard(self)
+        self.record["state"] = "ended"
+        self.record["ended_at"] = time.time()
+        await self._flush()
+
+
+_sessions: "weakref.WeakSet[RegisteredSession]" = weakref.WeakSet()
+_registry: Optional[SessionRegistry] = None
+
+
+def create_session_registry(backend: str = SESSION_REGISTRY) -> SessionRegistry:
+    if backend == "redis":
+        return RedisSessionRegistry()
+    if backend != "memory":
+        logger.warning(f"Unknown SESSION_REGISTRY {backend!r}, using the in-memory registry")
+    return InMemorySessionRegistry()
+
+
+def get_session_registry() -> SessionRegistry:
+    global _registry
+    if _registry is None:
+        _registry = create_session_registry()
+    return _registry
+
+
+def session_registry_stats() -> Dict[str, Any]:
+    return {**get_session_registry().stats(), "active_sessions": len(_sessions)}
+
+
+# ── Stand-in server ───────────────────────────────────────────────────
+
+
+async def _serve_client(store: InMemorySessionRegistry, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    async def reply(value):
+        if value is None:
+            writer.write(b"$-1\r\n")
+        elif isinstance(value, int):
+            writer.write(b":%d\r\n" % value)
+        elif value == "OK" or value == "PONG":
+            writer.write(b"+%s\r\n" % value.encode())
+        else:
+            data = value.encode("utf-8")
+            writer.write(b"$%d\r\n%s\r\n" % (len(data), data))
+
+    try:
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            args: List[str] = []
+            for _ in range(int(header[1:-2])):
+                length = int((await reader.readline())[1:-2])
+                args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+            command = args[0].upper()
+            if command == "GET":
+                await reply(await store._get(args[1]))
+            elif command == "GETDEL":
+                await reply(await store._take(args[1]))
+            elif command == "SET":
+                ttl = 365 * 86400.0
+                options = [a.upper() for a in args[3:]]
+                if "PX" in options:
+                    ttl = int(args[3 + options.index("PX") + 1]) / 1000
+                elif "EX" in options:
+                    ttl = float(args[3 + options.index("EX") + 1])
+                await store._set(args[1], args[2], ttl)
+                await reply("OK")
+            elif command == "DEL":
+                existed = sum(1 for key in args[1:] if store._live(key) is not None)
+                for key in args[1:]:
+                    await store._delete(key)
+                await reply(existed)
+            elif command == "PING":
+                await reply("PONG")
+            elif command in ("AUTH", "SELECT"):
+                await reply("OK")
+            else:
+                writer.write(f"-ERR unknown command '{args[0]}'\r\n".encode())
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int):
+    store = InMemorySessionRegistry(prefix="")
+    server = await asyncio.start_server(lambda r, w: _serve_client(store, r, w), host, port)
+    logger.info(f"Stand-in session registry listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Redis-protocol server for the session registry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+# /connect compiles the session config and stores it under a one-time token for /ws?token=
+SESSION_CONFIG_STORE = os.getenv("SESSION_CONFIG_STORE", "true").lower() == "true"
+SESSION_TOKEN_TTL_SECONDS = float(os.getenv("SESSION_TOKEN_TTL_SECONDS", "30"))
+# Build services and open upstream sessions as soon as /connect returns. Off by default: an unclaimed
+# pre-warmed Live session is billed until its token expires
+SESSION_PREWARM = os.getenv("SESSION_PREWARM", "false").lower() == "true"
+# Unclaimed pre-warmed sessions one client address may hold; beyond it, /connect only compiles the config
+SESSION_PREWARM_PER_CLIENT = int(os.getenv("SESSION_PREWARM_PER_CLIENT", "2"))
+
+
+class PreparedSession:
+    """A validated, compiled session config waiting for its websocket.
+
+    `config` is the agent-specific compiled config. Resources (services, a pre-opened Live
+    session) are built by a warm task started at /connect; the websocket handler takes
+    them over, and unclaimed ones are released when the token expires.
+    """
+
+    def __init__(self, session_id: str, bot_type: str, params: Dict[str, Any], config: Any):
+        self.token = secrets.token_urlsafe(16)
+        self.session_id = session_id
+        self.bot_type = bot_type
+        self.params = params
+        self.config = config
+        # Address of the /connect caller, for the per-client pre-warm cap
+        self.client: Optional[str] = None
+        # Handed to the client with the session; resuming the session needs it
+        self.resume_secret: Optional[str] = None
+        self.created_at = time.monotonic()
+        self._warm_task: Optional[asyncio.Task] = None
+        self._release: Optional[Callable[[Any], Awaitable[None]]] = None
+
+    def start_warming(self, warm: Callable[[], Awaitable[Any]], release: Callable[[Any], Awaitable[None]]):
+        self._release = release
+        self._warm_task = asyncio.create_task(self._warm(warm))
+
+    async def _warm(self, warm: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        resources = await warm()
+        logger.info(f"Session {self.session_id} warmed in {(time.monotonic() - started) * 1000:.0f}ms")
+        return resources
+
+    async def take_resources(self) -> Optional[Any]:
+        """Waits for warming to finish and hands the resources over; None if there are none."""
+        task, self._warm_task = self._warm_task, None
+        if task is None:
+            return None
+        waited = time.monotonic()
+        try:
+            resources = await task
+        except Exception as e:
+            logger.warning(f"Warming session {self.session_id} failed, building on connect instead: {e}")
+            return None
+        logger.debug(f"Session {self.session_id} waited {(time.monotonic() - waited) * 1000:.0f}ms for warm resources")
+        return resources
+
+    async def discard(self):
+        task, self._warm_task = self._warm_task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+            return
+        if task.cancelled() or task.exception() or not self._release:
+            return
+        try:
+            await self._release(task.result())
+        except Exception as e:
+            logger.warning(f"Error releasing resources of unclaimed session {self.session_id}: {e}")
+
+
+class SessionConfigStore:
+    """In-memory token -> PreparedSession map with per-token expiry.
+
+    Tokens are single use. The prepared session (with its warm resources) only exists on
+    the instance that issued it; other instances compile the params from the session
+    registry instead (SESSION_REGISTRY=redis), so session affinity is an optimization.
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_TOKEN_TTL_SECONDS):
+        self._ttl = ttl_seconds
+        self._sessions: Dict[str, PreparedSession] = {}
+        self._claimed = 0
+        self._expired = 0
+
+    def put(self, prepared: PreparedSession) -> str:
+        self._sessions[prepared.token] = prepared
+        asyncio.get_running_loop().call_later(self._ttl, self._expire, prepared.token)
+        return prepared.token
+
+    def take(self, token: str) -> Optional[PreparedSession]:
+        prepared = self._sessions.pop(token, None)
+        if prepared:
+            self._claimed += 1
+        return prepared
+
+    def warming(self, client: Optional[str]) -> int:
+        """Unclaimed sessions of one client address that hold (or are building) warm resources."""
+        return sum(1 for prepared in self._sessions.values()
+                   if prepared.client == client and prepared._warm_task is not None)
+
+    def _expire(self, token: str):
+        prepared = self._sessions.pop(token, None)
+        if prepared:
+            self._expired += 1
+            logger.info(f"Session token for {prepared.session_id} expired unclaimed")
+            asyncio.create_task(prepared.discard())
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for prepared in sessions:
+            await prepared.discard()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._sessions), "claimed": self._claimed, "expired": self._expired}
+
+
+_store: Optional[SessionConfigStore] = None
+
+
+def get_session_store() -> SessionConfigStore:
+    global _store
+    if _store is None:
+        _store = SessionConfigStore()
+    return _store
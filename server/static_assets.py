@@ -0,0 +1,138 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from loguru import logger
+
+try:
+    import brotli
+except ImportError:  # gzip-only when the Brotli package is not installed
+    brotli = None
+
+STATIC_DIR = os.getenv("STATIC_DIR", "client/dist")
+# Files smaller than this are not worth compressing
+STATIC_MIN_COMPRESS_BYTES = int(os.getenv("STATIC_MIN_COMPRESS_BYTES", "1024"))
+
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/wasm")
+# The build manifest (vite build.manifest) lists every file the bundler emitted with a content hash
+_MANIFEST = ".vite/manifest.json"
+# Without a manifest: Vite's default assets/[name]-[hash].[ext], an 8-character base64url hash. Requiring a
+# digit or capital in it keeps plain names such as app-settings.js from being taken for hashed ones
+_HASHED_NAME = re.compile(r"^assets/.+-(?=[A-Za-z_-]*[0-9A-Z])[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+
+
+class _Asset:
+    """One file with its precomputed encodings, each keyed by content-coding ("identity", "br", "gzip")."""
+
+    def __init__(self, rel_path: str, data: bytes, hashed: bool):
+        self.media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        self.cache_control = _IMMUTABLE if hashed else _REVALIDATE
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (data, f'"{digest}"')}
+        if len(data) < STATIC_MIN_COMPRESS_BYTES or not self.media_type.startswith(_COMPRESSIBLE_TYPES):
+            return
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                self.variants["br"] = (compressed, f'"{digest}-br"')
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            self.variants["gzip"] = (compressed, f'"{digest}-gz"')
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class StaticAssetCache:
+    """The built client held in memory with brotli/gzip variants computed once at startup.
+
+    Serving is a dict lookup plus header negotiation, with no file I/O or compression on
+    the event loop that also carries the audio. Hashed assets are immutable; everything
+    else (index.html) is revalidated through its ETag.
+    """
+
+    def __init__(self, root: str = STATIC_DIR):
+        self.root = root
+        self._assets: Dict[str, _Asset] = {}
+
+    def _emitted(self) -> Optional[set]:
+        """Files the build manifest lists as emitted (content-hashed); None without a manifest."""
+        try:
+            with open(os.path.join(self.root, _MANIFEST), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        emitted = set()
+        for chunk in manifest.values():
+            emitted.add(chunk.get("file"))
+            emitted.update(chunk.get("css", []))
+            emitted.update(chunk.get("assets", []))
+        return emitted
+
+    def load(self):
+        """Reads and compresses every file under root; run it off the event loop."""
+        emitted = self._emitted()
+        assets = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if rel_path == _MANIFEST:
+                    continue
+                hashed = rel_path in emitted if emitted is not None else bool(_HASHED_NAME.match(rel_path))
+                with open(path, "rb") as f:
+                    assets[rel_path] = _Asset(rel_path, f.read(), hashed)
+        self._assets = assets
+        compressed = sum(1 for a in assets.values() if len(a.variants) > 1)
+        logger.info(f"Loaded {len(assets)} static files from {self.root} ({compressed} precompressed, brotli={'on' if brotli else 'off'})")
+
+    def get(self, rel_path: str) -> Optional[_Asset]:
+        return self._assets.get(rel_path)
+
+    def response(self, request: Request, rel_path: str) -> Response:
+        asset = self._assets.get(rel_path)
+        if asset is None:
+            return Response(status_code=404)
+
+        coding = "identity"
+        if len(asset.variants) > 1:
+            accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+            for candidate in ("br", "gzip"):
+                if candidate in asset.variants and accepted.get(candidate, 0) > 0:
+                    coding = candidate
+                    break
+        body, etag = asset.variants[coding]
+
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if etag in tags or "*" in tags:
+                return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=asset.media_type, headers=headers)
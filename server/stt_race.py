@@ -0,0 +1,217 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import (Frame, InterimTranscriptionFrame, TranscriptionFrame,
+                                   UserStartedSpeakingFrame)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+# Language sets raced against each other when a session doesn't pass stt_race: "hi-IN;en-IN;ta-IN,en-IN"
+STT_RACE_LANGUAGE_SETS = os.getenv("STT_RACE_LANGUAGE_SETS", "")
+# A final result at or above this confidence wins immediately
+STT_RACE_CONFIDENCE = float(os.getenv("STT_RACE_CONFIDENCE", "0.8"))
+# Otherwise the best result within this window after the first one wins
+STT_RACE_WINDOW_MS = float(os.getenv("STT_RACE_WINDOW_MS", "300"))
+
+# Frame metadata key carrying the language set a transcription came from
+RACE_LABEL = "stt_race_label"
+
+
+def parse_language_sets(spec: Optional[str]) -> List[List[str]]:
+    """"hi-IN;en-US,en-IN" -> [["hi-IN"], ["en-US", "en-IN"]]; fewer than two sets means no race."""
+    sets = []
+    for group in (spec or "").split(";"):
+        languages = [lang.strip() for lang in group.split(",") if lang.strip()]
+        if languages:
+            sets.append(languages)
+    return sets
+
+
+def language_set_label(languages: List[str]) -> str:
+    return "+".join(languages)
+
+
+def result_confidence(result: Any) -> float:
+    """Confidence of the top alternative of a Speech v2 result (0.0 when the model doesn't report one)."""
+    alternatives = getattr(result, "alternatives", None)
+    if not alternatives:
+        return 0.0
+    return float(getattr(alternatives[0], "confidence", 0.0) or 0.0)
+
+
+class STTRaceStats:
+    """Per language set: how often it took part in a race, how often it won and how."""
+
+    def __init__(self):
+        self._raced: Dict[str, int] = defaultdict(int)
+        self._wins: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._win_confidence: Dict[str, float] = defaultdict(float)
+        self._races = 0
+
+    def record(self, winner: str, reason: str, confidence: float, entrants: List[str]):
+        self._races += 1
+        for label in entrants:
+            self._raced[label] += 1
+        self._wins[winner][reason] += 1
+        self._win_confidence[winner] += confidence
+
+    def stats(self) -> Dict[str, Any]:
+        sets = {}
+        for label in sorted(set(self._raced) | set(self._wins)):
+            wins = sum(self._wins[label].values())
+            sets[label] = {
+                "raced": self._raced[label],
+                "wins": wins,
+                "win_rate": round(wins / self._races, 3) if self._races else None,
+                "wins_by_reason": dict(self._wins[label]),
+                "mean_win_confidence": round(self._win_confidence[label] / wins, 3) if wins else None,
+            }
+        return {
+            "races": self._races,
+            "confidence_threshold": STT_RACE_CONFIDENCE,
+            "window_ms": STT_RACE_WINDOW_MS,
+            "language_sets": sets,
+        }
+
+
+_stats: Optional[STTRaceStats] = None
+
+
+def get_stt_race_stats() -> STTRaceStats:
+    global _stats
+    if _stats is None:
+        _stats = STTRaceStats()
+    return _stats
+
+
+async def race_recognize(
+    attempts: Dict[str, Callable[[], Awaitable[Tuple[str, float]]]],
+    confidence: float = STT_RACE_CONFIDENCE,
+    window_ms: float = STT_RACE_WINDOW_MS,
+) -> Optional[Tuple[str, str, float]]:
+    """Runs one-shot recognitions concurrently; returns (label, text, confidence) of the winner.
+
+    The first non-empty result at or above `confidence` wins at once. Otherwise the best
+    result within `window_ms` of the first one wins. The rest are cancelled.
+    """
+    tasks = {asyncio.create_task(attempt()): label for label, attempt in attempts.items()}
+    results: List[Tuple[str, str, float]] = []
+    deadline = None
+    reason = "best_in_window"
+    try:
+        pending = set(tasks)
+        while pending:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception():
+                    logger.warning(f"STT race: {tasks[task]} failed: {task.exception()}")
+                    continue
+                text, conf = task.result()
+                if text.strip():
+                    results.append((tasks[task], text.strip(), conf))
+            confident = [r for r in results if r[2] >= confidence]
+            if confident:
+                results, reason = confident[:1], "confident"
+                break
+            if results and deadline is None:
+                deadline = time.monotonic() + window_ms / 1000
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if not results:
+        return None
+    winner = max(results, key=lambda r: r[2])
+    get_stt_race_stats().record(winner[0], reason, winner[2], list(attempts))
+    return winner
+
+
+class STTRaceArbiter(FrameProcessor):
+    """Picks one transcription per utterance out of several streaming recognizers.
+
+    Sits after a ParallelPipeline of recognizers whose transcriptions carry their language
+    set in `frame.metadata[RACE_LABEL]`. The first final at or above the confidence
+    threshold wins at once; otherwise the best final within the window after the first
+    one wins. The winner owns the rest of the utterance: its later finals and interims go
+    through, the others are dropped until the user starts speaking again.
+    """
+
+    def __init__(self, labels: List[str], *, confidence: float = STT_RACE_CONFIDENCE,
+                 window_ms: float = STT_RACE_WINDOW_MS, **kwargs):
+        super().__init__(**kwargs)
+        self._labels = labels
+        self._confidence = confidence
+        self._window = window_ms / 1000
+        self._owner: Optional[str] = None
+        # label -> (frame, confidence), in arrival order
+        self._candidates: Dict[str, Tuple[TranscriptionFrame, float]] = {}
+        self._window_task: Optional[asyncio.Task] = None
+        self._tracer = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TranscriptionFrame):
+            await self._handle_final(frame)
+        elif isinstance(frame, InterimTranscriptionFrame):
+            # Interims come from the owner, or the primary set until there is one
+            if frame.metadata.get(RACE_LABEL) == (self._owner or self._labels[0]):
+                await self.push_frame(frame, direction)
+        else:
+            if isinstance(frame, UserStartedSpeakingFrame):
+                if self._candidates:
+                    await self._decide("best_in_window")
+                self._owner = None
+            await self.push_frame(frame, direction)
+
+    async def _handle_final(self, frame: TranscriptionFrame):
+        label = frame.metadata.get(RACE_LABEL)
+        if self._owner:
+            if label == self._owner:
+                await self.push_frame(frame)
+            return
+
+        confidence = result_confidence(frame.result)
+        if label in self._candidates:
+            # Another segment from the same recognizer before the race was decided
+            previous, previous_confidence = self._candidates[label]
+            previous.text = f"{previous.text} {frame.text}"
+            self._candidates[label] = (previous, min(previous_confidence, confidence))
+        else:
+            self._candidates[label] = (frame, confidence)
+
+        if confidence >= self._confidence:
+            await self._decide("confident", label)
+        elif len(self._candidates) == len(self._labels):
+            await self._decide("all_in")
+        elif self._window_task is None:
+            self._window_task = self.create_task(self._decide_after_window())
+
+    async def _decide_after_window(self):
+        await asyncio.sleep(self._window)
+        self._window_task = None
+        await self._decide("best_in_window")
+
+    async def _decide(self, reason: str, winner: Optional[str] = None):
+        if self._window_task:
+            await self.cancel_task(self._window_task)
+            self._window_task = None
+        if not self._candidates:
+            return
+        if winner is None:
+            winner = max(self._candidates, key=lambda label: self._candidates[label][1])
+        frame, confidence = self._candidates[winner]
+        delivered = list(self._candidates)
+        self._candidates = {}
+        self._owner = winner
+        get_stt_race_stats().record(winner, reason, confidence, self._labels)
+        logger.debug(f"STT race won by {winner} ({reason}, confidence {confidence:.2f}, {len(delivered)}/{len(self._labels)} in)")
+        if self._tracer:
+            self._tracer.record("stt_race", {"winner": winner, "reason": reason, "confidence": confidence, "delivered": delivered})
+        await self.push_frame(frame)
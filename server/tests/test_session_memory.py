@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+from google.genai.types import Blob, Content, FunctionCall, FunctionResponse, Part
+
+from session_memory import SessionMemory, compact_context
+
+AUDIO = b"\x01\x00" * 8000
+
+
+def _spoken(text):
+    return Content(role="user", parts=[Part(text=text), Part(inline_data=Blob(mime_type="audio/wav", data=AUDIO))])
+
+
+def _reply(text):
+    return Content(role="model", parts=[Part(text=text)])
+
+
+def _call():
+    return Content(role="model", parts=[Part(function_call=FunctionCall(name="lookup", args={"q": "x"}))])
+
+
+def _result():
+    return Content(role="user", parts=[Part(function_response=FunctionResponse(name="lookup", response={"r": 1}))])
+
+
+def _has_audio(message):
+    return any(part.inline_data is not None for part in message.parts)
+
+
+def test_compaction_never_starts_at_a_function_response():
+    question, call, result, answer = _spoken("Q"), _call(), _result(), _reply("A")
+    context = SimpleNamespace(messages=[question, call, result, answer])
+
+    compact_context(context, keep=2)
+
+    # Cutting at the last two messages would leave the function response first
+    assert context.messages == [question, call, result, answer]
+    assert _has_audio(question)
+
+
+def test_compaction_keeps_the_audio_of_the_question_a_tool_call_answers():
+    first, question = _spoken("Q1"), _spoken("Q2")
+    context = SimpleNamespace(messages=[
+        Content(role="system", parts=[Part(text="prompt")]),
+        first, _reply("A1"), question, _call(), _result(), _reply("A2"),
+    ])
+
+    compact_context(context, keep=5)
+
+    assert context.messages[0].role == "system"
+    assert context.messages[1] is question
+    assert len(context.messages) == 5
+    assert _has_audio(question)
+
+
+def test_compaction_strips_audio_of_older_turns_only():
+    first, question = _spoken("Q1"), _spoken("Q2")
+    context = SimpleNamespace(messages=[first, _reply("A1"), question, _call(), _result(), _reply("A2")])
+
+    compact_context(context, keep=6)
+
+    assert len(context.messages) == 6
+    assert not _has_audio(first)
+    assert _has_audio(question)
+
+
+def test_context_audio_is_measured_and_compaction_is_seen():
+    context = SimpleNamespace(messages=[_spoken("Q1"), _reply("A1"), _spoken("Q2"), _reply("A2")])
+    memory = SessionMemory("test")
+    memory.track_context(context)
+    try:
+        memory.measure()
+        assert memory.bytes["context_audio"] == 2 * len(AUDIO)
+
+        context.messages.append(_spoken("Q3"))
+        memory.measure()
+        assert memory.bytes["context_audio"] == 3 * len(AUDIO)
+
+        memory.compact()
+        assert memory.bytes["context_audio"] == len(AUDIO)
+    finally:
+        memory.stop()
+
+
+def test_pending_utterances_are_tracked_per_processor():
+    frame = SimpleNamespace(audio=AUDIO)
+    pipeline = SimpleNamespace(processors=[
+        SimpleNamespace(name="AudioAccumulator#0", _audio_frames=[frame]),
+        SimpleNamespace(name="AudioAccumulator#1", _audio_frames=[frame, frame]),
+    ])
+    memory = SessionMemory("test")
+    memory.track_pipeline(pipeline)
+    try:
+        memory.measure()
+        assert memory.bytes["pending_utterance:AudioAccumulator#0"] == len(AUDIO)
+        assert memory.bytes["pending_utterance:AudioAccumulator#1"] == 2 * len(AUDIO)
+    finally:
+        memory.stop()
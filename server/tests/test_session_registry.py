@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+
+import session_registry
+from session_registry import (InMemorySessionRegistry, RedisSessionRegistry, RegisteredSession, SessionRegistry,
+                              _serve_client)
+
+
+async def _stand_in():
+    """A stand-in registry server on a free port; also returns its open client connections."""
+    store = InMemorySessionRegistry(prefix="")
+    connections = []
+
+    def accept(reader, writer):
+        connections.append(writer)
+        return _serve_client(store, reader, writer)
+
+    server = await asyncio.start_server(accept, "127.0.0.1", 0)
+    return server, f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0", connections
+
+
+def test_config_is_single_use_across_instances():
+    async def run():
+        server, url, _ = await _stand_in()
+        issuer, other = RedisSessionRegistry(url), RedisSessionRegistry(url)
+        try:
+            await issuer.put_config("t1", "s1", "gemini-live", {"voice": "Kore"}, 30, resume_secret="secret")
+            taken = await other.take_config("t1")
+            assert taken == {"session_id": "s1", "bot_type": "gemini-live", "params": {"voice": "Kore"},
+                             "resume_secret": "secret"}
+            assert await issuer.take_config("t1") is None
+            assert await other.take_config("t1") is None
+        finally:
+            await issuer.close()
+            await other.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_records_expire_after_their_ttl():
+    async def run():
+        server, url, _ = await _stand_in()
+        registry = RedisSessionRegistry(url)
+        try:
+            await registry.put_config("t1", "s1", "tts-llm-stt", {}, 0.05)
+            await registry.put_session("s2", {"state": "active"}, ttl=30)
+            await asyncio.sleep(0.1)
+            assert await registry.take_config("t1") is None
+            assert await registry.get_session("s2") == {"state": "active"}
+        finally:
+            await registry.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_reconnects_after_a_dropped_connection():
+    async def run():
+        server, url, connections = await _stand_in()
+        registry = RedisSessionRegistry(url)
+        try:
+            await registry.put_session("s1", {"state": "active"})
+            for writer in connections:
+                writer.close()
+            await asyncio.sleep(0.05)
+            # The call on the dropped connection fails without raising; the next one reconnects
+            await registry.get_session("s1")
+            assert await registry.get_session("s1") == {"state": "active"}
+            assert registry.errors <= 1
+            assert len(connections) == 2
+        finally:
+            await registry.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_resume_needs_the_secret_issued_with_the_session(monkeypatch):
+    async def run():
+        server, url, _ = await _stand_in()
+        registry = RedisSessionRegistry(url)
+        monkeypatch.setattr(session_registry, "_registry", registry)
+        tools = [{"name": "lookup", "backend": {"type": "http", "endpoint": "crm",
+                                                "headers": {"Authorization": "Bearer x"}}}]
+        params = {"voice": "Kore", "tools": json.dumps(tools), "resume_secret": "old", "token": "t1"}
+        registered = RegisteredSession("s1", "gemini-live", params)
+        try:
+            registered.start()
+            registered.set_resume_handle("h1")
+            await asyncio.sleep(0.1)
+
+            record = await registry.resumable_session("s1", registered.resume_secret)
+            assert record["resume_handle"] == "h1"
+            assert record["params"]["voice"] == "Kore"
+            assert "resume_secret" not in record["params"] and "token" not in record["params"]
+            assert "headers" not in json.loads(record["params"]["tools"])[0]["backend"]
+            assert registered.resume_secret not in json.dumps(record)
+
+            assert await registry.resumable_session("s1", None) is None
+            assert await registry.resumable_session("s1", "old") is None
+            assert await registry.resumable_session("s2", registered.resume_secret) is None
+
+            await registered.end()
+            assert (await registry.get_session("s1"))["state"] == "ended"
+        finally:
+            await registry.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_a_backend_missing_an_operation_fails_at_construction():
+    class NoDelete(SessionRegistry):
+        async def _get(self, key):
+            return None
+
+        async def _set(self, key, value, ttl):
+            pass
+
+        async def _take(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        NoDelete()
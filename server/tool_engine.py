@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp.resolver import DefaultResolver
+from cachetools import LRUCache, TTLCache
+from loguru import logger
+
+from pipecat.frames.frames import OutputTransportMessageFrame
+from pipecat.services.llm_service import FunctionCallParams
+
+from tracing import SessionTracer
+
+TOOL_HTTP_POOL_SIZE = int(os.getenv("TOOL_HTTP_POOL_SIZE", "100"))
+TOOL_DEFAULT_TIMEOUT = float(os.getenv("TOOL_DEFAULT_TIMEOUT", "8.0"))
+TOOL_DEFAULT_CONCURRENCY = int(os.getenv("TOOL_DEFAULT_CONCURRENCY", "4"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "256"))
+# Process-scope result caches kept at once (one per backend and cache settings), least recently used evicted
+TOOL_PROCESS_CACHES_MAX = int(os.getenv("TOOL_PROCESS_CACHES_MAX", "128"))
+# HTTP backends tools can call, as inline JSON or a path to a JSON file:
+# {"orders": {"url": "https://...", "method": "POST", "headers": {...}}}
+TOOL_HTTP_BACKENDS = os.getenv("TOOL_HTTP_BACKENDS", "")
+# Lets http backends reach private, loopback and link-local addresses (internal services)
+TOOL_HTTP_ALLOW_PRIVATE = os.getenv("TOOL_HTTP_ALLOW_PRIVATE", "false").lower() == "true"
+
+# Local Python callables that tool JSON entries can bind to with {"type": "python"}
+LOCAL_TOOLS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+
+# Server-side HTTP backends that tool JSON entries can bind to with {"type": "http", "endpoint": name}
+HTTP_BACKENDS: Dict[str, Dict[str, Any]] = {}
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# Result caches and in-flight calls shared by every session, for tools declaring "scope": "process"
+_process_caches: LRUCache = LRUCache(maxsize=TOOL_PROCESS_CACHES_MAX)
+_process_inflight: Dict[tuple, asyncio.Task] = {}
+
+
+def register_local_tool(name: str):
+    """Decorator registering an async callable taking the tool arguments dict."""
+    def decorator(func):
+        LOCAL_TOOLS[name] = func
+        return func
+    return decorator
+
+
+def register_http_backend(name: str, url: str, method: str = "POST", headers: Optional[Dict[str, str]] = None):
+    """Registers an HTTP endpoint that tools can call by name. The url and headers never come from clients."""
+    HTTP_BACKENDS[name] = {"url": url, "method": method.upper(), "headers": dict(headers or {})}
+
+
+def _load_http_backends():
+    if not TOOL_HTTP_BACKENDS:
+        return
+    try:
+        if TOOL_HTTP_BACKENDS.lstrip().startswith("{"):
+            backends = json.loads(TOOL_HTTP_BACKENDS)
+        else:
+            with open(TOOL_HTTP_BACKENDS, "r") as f:
+                backends = json.load(f)
+        for name, backend in backends.items():
+            register_http_backend(name, backend["url"], backend.get("method", "POST"), backend.get("headers"))
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        logger.error(f"Could not load TOOL_HTTP_BACKENDS: {e}")
+
+
+_load_http_backends()
+
+
+def _ip_address(host: str):
+    try:
+        return ipaddress.ip_address(host.split("%", 1)[0])
+    except ValueError:
+        return None
+
+
+def _is_public(host: str) -> bool:
+    address = _ip_address(host)
+    return address is not None and address.is_global and not address.is_multicast
+
+
+class _PublicResolver(DefaultResolver):
+    """Drops private, loopback and link-local answers, so a public name can't be pointed at internal hosts."""
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET):
+        hosts = [answer for answer in await super().resolve(host, port, family) if _is_public(answer["host"])]
+        if not hosts:
+            raise OSError(f"{host} does not resolve to a public address")
+        return hosts
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Process-wide HTTP session so tool calls reuse pooled keep-alive connections."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=TOOL_HTTP_POOL_SIZE,
+                ttl_dns_cache=300,
+                resolver=None if TOOL_HTTP_ALLOW_PRIVATE else _PublicResolver(),
+            ),
+        )
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+@dataclass
+class ToolSpec:
+    """Execution backend of a tool, parsed from the optional "backend" key of a tool JSON entry.
+
+    Types:
+      - "http": calls the server-side backend named by `endpoint` (see `register_http_backend`)
+        with the tool arguments (JSON body for POST, query params for GET)
+      - "python": calls a callable registered with `register_local_tool`
+      - "stub": answers with a canned success message (default when no backend is declared)
+
+    An optional "cache" key ({"ttl": seconds, "scope": "session" | "process", "max_entries": n})
+    marks the tool as cacheable: identical calls are answered from a bounded TTL cache and
+    concurrent identical calls share one execution.
+    """
+
+    name: str
+    type: str = "stub"
+    endpoint: Optional[str] = None
+    url: Optional[str] = None
+    method: str = "POST"
+    headers: Dict[str, str] = field(default_factory=dict)
+    callable_name: Optional[str] = None
+    timeout: float = TOOL_DEFAULT_TIMEOUT
+    max_concurrency: int = TOOL_DEFAULT_CONCURRENCY
+    cache_ttl: Optional[float] = None
+    cache_scope: str = "session"
+    cache_max_entries: int = TOOL_CACHE_MAX_ENTRIES
+
+    @property
+    def backend_key(self) -> tuple:
+        headers = hashlib.sha256(json.dumps(self.headers, sort_keys=True).encode()).hexdigest()[:16]
+        return (self.name, self.type, self.url, self.method, headers, self.callable_name)
+
+    @classmethod
+    def from_config(cls, tool: Dict[str, Any]) -> "ToolSpec":
+        backend = tool.get("backend") or {}
+        cache = tool.get("cache") or {}
+        if "url" in backend or "headers" in backend:
+            raise ValueError(f"Tool {tool['name']} sets a url or headers; http backends are referenced by endpoint name")
+        http = HTTP_BACKENDS.get(backend.get("endpoint"), {})
+        spec = cls(
+            name=tool["name"],
+            type=backend.get("type", "stub"),
+            endpoint=backend.get("endpoint"),
+            url=http.get("url"),
+            method=http.get("method", "POST"),
+            headers=http.get("headers", {}),
+            callable_name=backend.get("callable", tool["name"]),
+            timeout=float(backend.get("timeout", TOOL_DEFAULT_TIMEOUT)),
+            max_concurrency=int(backend.get("max_concurrency", TOOL_DEFAULT_CONCURRENCY)),
+            cache_ttl=float(cache["ttl"]) if cache.get("ttl") else None,
+            cache_scope=cache.get("scope", "session"),
+            cache_max_entries=int(cache.get("max_entries", TOOL_CACHE_MAX_ENTRIES)),
+        )
+        if spec.type == "http" and not spec.url:
+            raise ValueError(f"Tool {spec.name} binds to unknown http endpoint {spec.endpoint}")
+        if spec.type == "python" and spec.callable_name not in LOCAL_TOOLS:
+            raise ValueError(f"Tool {spec.name} binds to unknown local callable {spec.callable_name}")
+        if spec.type not in ("http", "python", "stub"):
+            raise ValueError(f"Tool {spec.name} has unknown backend type {spec.type}")
+        if spec.cache_scope not in ("session", "process"):
+            raise ValueError(f"Tool {spec.name} has unknown cache scope {spec.cache_scope}")
+        return spec
+
+
+class ToolEngine:
+    """Executes tool calls for one session against their declared backends.
+
+    Register `handle` with `llm.register_function` for every tool. The LLM service runs
+    each function call of a tool_call message as its own task, so all calls of one
+    message execute in parallel, bounded by each tool's concurrency limit and timeout.
+    """
+
+    def __init__(self, tracer: Optional[SessionTracer] = None):
+        self._tracer = tracer
+        self._specs: Dict[str, ToolSpec] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._caches: Dict[tuple, TTLCache] = {}
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+    def add_tool(self, spec: ToolSpec):
+        self._specs[spec.name] = spec
+        self._semaphores[spec.name] = asyncio.Semaphore(spec.max_concurrency)
+
+    async def handle(self, params: FunctionCallParams):
+        name = params.function_name
+        args = dict(params.arguments or {})
+        spec = self._specs.get(name) or ToolSpec(name=name)
+
+        start = time.monotonic()
+        if spec.cache_ttl:
+            status, result = await self._run_cached(spec, args)
+        else:
+            status, result = await self._run(spec, args)
+        latency = time.monotonic() - start
+
+        logger.debug(f"Tool {name} ({spec.type}) finished in {latency:.3f}s [{status}]")
+        if self._tracer:
+            self._tracer.record("tool_result", {"tool": name, "backend": spec.type, "status": status, "latency": latency})
+        await params.llm.push_frame(OutputTransportMessageFrame(message={
+            "label": "rtvi-ai",
+            "type": "server-message",
+            "data": {
+                'type': 'metrics',
+                'payload': {'type': 'tool_latency', 'tool': name, 'status': status, 'value': latency}
+            }
+        }))
+        await params.result_callback(result)
+
+    async def _limited(self, spec: ToolSpec, args: Dict[str, Any]) -> Any:
+        async with self._semaphores.setdefault(spec.name, asyncio.Semaphore(spec.max_concurrency)):
+            return await self._execute(spec, args)
+
+    async def _run(self, spec: ToolSpec, args: Dict[str, Any]) -> tuple:
+        try:
+            # The timeout covers the wait for a concurrency slot too, so it holds from the model's side
+            return "ok", await asyncio.wait_for(self._limited(spec, args), timeout=spec.timeout)
+        except asyncio.TimeoutError:
+            return "timeout", {"error": f"Tool {spec.name} timed out after {spec.timeout}s"}
+        except Exception as e:
+            logger.error(f"Tool {spec.name} failed: {e}")
+            return "error", {"error": f"Tool {spec.name} failed: {e}"}
+
+    async def _run_cached(self, spec: ToolSpec, args: Dict[str, Any]) -> tuple:
+        if spec.cache_scope == "process":
+            caches, inflight = _process_caches, _process_inflight
+        else:
+            caches, inflight = self._caches, self._inflight
+        # Tools sharing a backend but declaring other cache settings get their own cache
+        cache_key = (spec.backend_key, spec.cache_ttl, spec.cache_max_entries)
+        cache = caches.get(cache_key)
+        if cache is None:
+            cache = caches[cache_key] = TTLCache(maxsize=spec.cache_max_entries, ttl=spec.cache_ttl)
+
+        key = (spec.backend_key, json.dumps(args, sort_keys=True, separators=(",", ":"), default=str))
+        if key in cache:
+            return "cached", cache[key]
+
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(spec, args))
+            inflight[key] = task
+
+            def on_done(t: asyncio.Task):
+                inflight.pop(key, None)
+                if not t.cancelled() and t.result()[0] == "ok":
+                    cache[key] = t.result()[1]
+
+            task.add_done_callback(on_done)
+            shared = False
+        else:
+            shared = True
+
+        # Shield so an interrupted caller doesn't cancel the execution other callers share
+        status, result = await asyncio.shield(task)
+        return ("shared" if shared and status == "ok" else status), result
+
+    async def _execute(self, spec: ToolSpec, args: Dict[str, Any]) -> Any:
+        if spec.type == "http":
+            return await self._execute_http(spec, args)
+        if spec.type == "python":
+            return await LOCAL_TOOLS[spec.callable_name](args)
+        logger.info(f"Dynamic tool called: {spec.name} with args: {args}")
+        return {"status": "success", "message": f"Tool {spec.name} called successfully"}
+
+    async def _execute_http(self, spec: ToolSpec, args: Dict[str, Any]) -> Any:
+        # Names are checked by the resolver on connect; literal addresses never reach it
+        host = urlsplit(spec.url).hostname or ""
+        if not TOOL_HTTP_ALLOW_PRIVATE and _ip_address(host) and not _is_public(host):
+            raise ValueError(f"Tool {spec.name} targets non-public address {host}")
+        session = await get_http_session()
+        if spec.method == "GET":
+            # Query values are strings; anything else (bools, numbers, nested values) goes as JSON
+            query = {key: value if isinstance(value, str) else json.dumps(value, separators=(",", ":"))
+                     for key, value in args.items() if value is not None}
+            request_kwargs = {"params": query}
+        else:
+            request_kwargs = {"json": args}
+        async with session.request(spec.method, spec.url, headers=spec.headers, **request_kwargs) as response:
+            if response.status >= 400:
+                # Raised so the call reports an error and is never cached
+                raise RuntimeError(f"HTTP {response.status}: {(await response.text())[:500]}")
+            if response.content_type == "application/json":
+                return await response.json()
+            return {"result": await response.text()}
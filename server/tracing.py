@@ -0,0 +1,208 @@
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from percentiles import percentile
+
+# Ring buffer size per session and the TTFB above which a turn counts as slow
+TRACE_CAPACITY = int(os.getenv("TRACE_CAPACITY", "512"))
+TRACE_SLOW_TURN_SECONDS = float(os.getenv("TRACE_SLOW_TURN_SECONDS", "3.0"))
+# How many finished sessions to keep around for post-mortem dumps
+TRACE_RETAIN_FINISHED = int(os.getenv("TRACE_RETAIN_FINISHED", "32"))
+# Turn breakdowns kept per session and across all sessions for the percentile report
+TRACE_TURN_HISTORY = int(os.getenv("TRACE_TURN_HISTORY", "64"))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "2000"))
+
+# Stages of a turn, in pipeline order, from the user's VAD stop to the client playing audio.
+# Not every bot reaches every stage (e.g. Live in audio mode has no separate TTS).
+TURN_STAGES = (
+    "vad_stop",
+    "stt_final",
+    "llm_request",
+    "llm_first_output",
+    "tts_first_chunk",
+    "first_audio_out",
+    "playback_start",
+)
+
+
+class SessionTracer:
+    """Fixed-size ring buffer of structured events for one session.
+
+    Recording is a single deque append of (monotonic time, kind, payload), so it is
+    cheap enough for hot paths. Nothing is formatted until the buffer is dumped,
+    which happens on request (admin endpoint), on errors, or on slow turns.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        bot_type: str,
+        capacity: int = TRACE_CAPACITY,
+        slow_turn_seconds: float = TRACE_SLOW_TURN_SECONDS,
+    ):
+        self.session_id = session_id
+        self.bot_type = bot_type
+        self.started_at = time.time()
+        self.ended_at: Optional[float] = None
+        self._mono_start = time.monotonic()
+        self._events = deque(maxlen=capacity)
+        self._slow_turn_seconds = slow_turn_seconds
+        self._turn_start: Optional[float] = None
+        self._turn_count = 0
+        self._slow_turn_count = 0
+        # Monotonic timestamp of each stage reached in the open turn (first occurrence only)
+        self._turn_marks: Optional[Dict[str, float]] = None
+        self._turn_source: Optional[str] = None
+        self._turn_breakdowns = deque(maxlen=TRACE_TURN_HISTORY)
+
+    def record(self, kind: str, payload: Optional[Dict[str, Any]] = None):
+        self._events.append((time.monotonic(), kind, payload))
+
+    def begin_turn(self, source: str, at: Optional[float] = None):
+        """Marks the point the user stopped speaking (now, or at the monotonic time `at` if it's only known later)."""
+        self._finish_breakdown()
+        self._turn_start = at if at is not None else time.monotonic()
+        self._turn_count += 1
+        self._turn_marks = {"vad_stop": self._turn_start}
+        self._turn_source = source
+        self._events.append((self._turn_start, "turn_start", {"source": source, "turn": self._turn_count}))
+
+    def mark(self, stage: str, at: Optional[float] = None):
+        """Timestamps a stage of the open turn (now, or at the monotonic time `at`); repeats within the same turn are ignored."""
+        if self._turn_marks is None or stage in self._turn_marks:
+            return
+        now = at if at is not None else time.monotonic()
+        self._turn_marks[stage] = now
+        self._events.append((now, "stage", {"stage": stage, "turn": self._turn_count}))
+        if stage == "playback_start":
+            self._finish_breakdown()
+
+    def _finish_breakdown(self):
+        marks = self._turn_marks
+        self._turn_marks = None
+        if not marks or len(marks) < 2:
+            return
+        start = marks["vad_stop"]
+        stages_ms = {}
+        deltas_ms = {}
+        previous = start
+        for stage in TURN_STAGES:
+            if stage not in marks:
+                continue
+            stages_ms[stage] = round((marks[stage] - start) * 1000, 1)
+            if stage != "vad_stop":
+                # Stages can land out of order (e.g. a TTS chunk before the LLM reports TTFB)
+                deltas_ms[stage] = round(max(0.0, marks[stage] - previous) * 1000, 1)
+                previous = max(previous, marks[stage])
+        breakdown = {
+            "session_id": self.session_id,
+            "bot_type": self.bot_type,
+            "turn": self._turn_count,
+            "source": self._turn_source,
+            "stages_ms": stages_ms,
+            "deltas_ms": deltas_ms,
+        }
+        self._turn_breakdowns.append(breakdown)
+        _recent_breakdowns.append(breakdown)
+        logger.debug(f"Turn latency breakdown for session {self.session_id}: {breakdown}")
+
+    def turn_breakdowns(self) -> List[Dict[str, Any]]:
+        return list(self._turn_breakdowns)
+
+    def end_turn(self, source: str):
+        """Marks the first response output of the turn; dumps the trace if it was slow."""
+        if self._turn_start is None:
+            return
+        now = time.monotonic()
+        latency = now - self._turn_start
+        self._turn_start = None
+        self._events.append((now, "turn_end", {"source": source, "turn": self._turn_count, "latency": latency}))
+        if latency >= self._slow_turn_seconds:
+            self._slow_turn_count += 1
+            self.dump(reason=f"slow_turn ({latency:.2f}s >= {self._slow_turn_seconds}s)")
+
+    def events(self) -> List[Dict[str, Any]]:
+        result = []
+        for ts, kind, payload in list(self._events):
+            event = {"t_ms": round((ts - self._mono_start) * 1000, 1), "kind": kind}
+            if payload:
+                event.update(payload)
+            result.append(event)
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "bot_type": self.bot_type,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "turns": self._turn_count,
+            "slow_turns": self._slow_turn_count,
+            "buffered_events": len(self._events),
+        }
+
+    def dump(self, reason: str) -> List[Dict[str, Any]]:
+        events = self.events()
+        logger.warning(f"Trace dump for session {self.session_id} ({reason}): {events}")
+        return events
+
+
+_active_tracers: Dict[str, SessionTracer] = {}
+_finished_tracers: "deque[SessionTracer]" = deque(maxlen=TRACE_RETAIN_FINISHED)
+_recent_breakdowns: "deque[Dict[str, Any]]" = deque(maxlen=LATENCY_WINDOW)
+
+
+def start_session_trace(session_id: str, bot_type: str) -> SessionTracer:
+    tracer = SessionTracer(session_id, bot_type)
+    _active_tracers[session_id] = tracer
+    tracer.record("session_start", {"bot_type": bot_type})
+    return tracer
+
+
+def finish_session_trace(tracer: SessionTracer):
+    tracer._finish_breakdown()
+    tracer.record("session_end")
+    tracer.ended_at = time.time()
+    _active_tracers.pop(tracer.session_id, None)
+    _finished_tracers.append(tracer)
+
+
+def get_session_trace(session_id: str) -> Optional[SessionTracer]:
+    tracer = _active_tracers.get(session_id)
+    if tracer:
+        return tracer
+    for finished in _finished_tracers:
+        if finished.session_id == session_id:
+            return finished
+    return None
+
+
+def list_session_traces() -> List[Dict[str, Any]]:
+    return [t.summary() for t in _active_tracers.values()] + [t.summary() for t in _finished_tracers]
+
+
+def latency_breakdown_stats(bot_type: Optional[str] = None) -> Dict[str, Any]:
+    """Percentiles of every stage across recent turns of all sessions.
+
+    `since_vad_stop` is the offset of each stage from the user's VAD stop; `stage_delta` is
+    the time spent getting from the previous reached stage to this one, which is the
+    number to look at when deciding what to optimize.
+    """
+    turns = [b for b in _recent_breakdowns if bot_type is None or b["bot_type"] == bot_type]
+    result: Dict[str, Any] = {"turns": len(turns), "since_vad_stop": {}, "stage_delta": {}}
+    for key, out in (("stages_ms", "since_vad_stop"), ("deltas_ms", "stage_delta")):
+        for stage in TURN_STAGES:
+            values = [b[key][stage] for b in turns if stage in b[key]]
+            if not values or (stage == "vad_stop" and key == "stages_ms"):
+                continue
+            result[out][stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+    return result
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+from pipecat.frames.frames import ErrorFrame, Frame, TTSAudioRawFrame
+
+from percentiles import percentile
+
+# Hedged TTS is opt-in: every hedge is a second billed synthesis
+TTS_HEDGING = os.getenv("TTS_HEDGING", "false").lower() == "true"
+# Hedge when the first chunk is later than this percentile of the engine's recent TTFBs
+TTS_HEDGE_PERCENTILE = float(os.getenv("TTS_HEDGE_PERCENTILE", "90"))
+# Bounds of the adaptive threshold, and the threshold used until an engine has enough samples
+TTS_HEDGE_MIN_MS = float(os.getenv("TTS_HEDGE_MIN_MS", "300"))
+TTS_HEDGE_MAX_MS = float(os.getenv("TTS_HEDGE_MAX_MS", "3000"))
+TTS_HEDGE_DEFAULT_MS = float(os.getenv("TTS_HEDGE_DEFAULT_MS", "1200"))
+TTS_HEDGE_MIN_SAMPLES = int(os.getenv("TTS_HEDGE_MIN_SAMPLES", "20"))
+# TTFB samples kept per engine
+TTS_HEDGE_WINDOW = int(os.getenv("TTS_HEDGE_WINDOW", "200"))
+# Hedges are capped at this fraction of TTS requests, with bursts of up to TTS_HEDGE_BUDGET_BURST
+TTS_HEDGE_BUDGET_RATIO = float(os.getenv("TTS_HEDGE_BUDGET_RATIO", "0.1"))
+TTS_HEDGE_BUDGET_BURST = float(os.getenv("TTS_HEDGE_BUDGET_BURST", "5"))
+# Gemini TTS hedges to "chirp" (TTS_HEDGE_FALLBACK_VOICE) or "region" (same model and voice in TTS_HEDGE_ALT_LOCATION)
+TTS_HEDGE_GEMINI_FALLBACK = os.getenv("TTS_HEDGE_GEMINI_FALLBACK", "chirp")
+TTS_HEDGE_FALLBACK_VOICE = os.getenv("TTS_HEDGE_FALLBACK_VOICE", "en-US-Chirp3-HD-Aoede")
+# Empty: "global", or "us-central1" when the primary already is global
+TTS_HEDGE_ALT_LOCATION = os.getenv("TTS_HEDGE_ALT_LOCATION", "")
+# Cloud TTS voices (Chirp 3 HD and cloned) hedge to the same voice on this regional endpoint
+TTS_HEDGE_ALT_ENDPOINT = os.getenv("TTS_HEDGE_ALT_ENDPOINT", "us-texttospeech.googleapis.com")
+
+_DECISION_HISTORY = 200
+
+
+def hedge_alt_location(location: str) -> str:
+    if TTS_HEDGE_ALT_LOCATION:
+        return TTS_HEDGE_ALT_LOCATION
+    return "us-central1" if location == "global" else "global"
+
+
+class _EngineStats:
+    def __init__(self, window: int):
+        # Time to first audio of primary requests; for requests a hedge beat, the time at which the
+        # primary was cancelled (a lower bound, so a slow engine keeps a high threshold)
+        self.ttfb: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.budget_denied = 0
+
+
+class _Leg:
+    """One synthesis request of a hedged call, read one frame at a time."""
+
+    def __init__(self, name: str, frames: AsyncIterator[Frame]):
+        self.name = name
+        self.frames = frames
+        self.held: List[Frame] = []
+        self.task: Optional[asyncio.Future] = None
+        self.failed = False
+
+    def read(self):
+        self.task = asyncio.ensure_future(self.frames.__anext__())
+
+    async def close(self):
+        task, self.task = self.task, None
+        if task and not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+        if task and task.done() and not task.cancelled():
+            task.exception()
+        try:
+            await self.frames.aclose()
+        except Exception as e:
+            logger.debug(f"TTS hedge: closing {self.name} request failed: {e}")
+
+
+class TTSHedger:
+    """Sends a second TTS request when the first one is slow to produce audio.
+
+    The first request starts alone. If no audio has arrived once the engine's adaptive
+    threshold (its TTFB percentile, clamped) has passed, or the request failed before
+    that, a second request goes to the fallback and whichever produces audio first is
+    streamed; the other is cancelled. Hedges spend from a token bucket that every request
+    refills by the budget ratio, so extra requests stay capped at that fraction of traffic.
+    """
+
+    def __init__(
+        self,
+        percentile: float = TTS_HEDGE_PERCENTILE,
+        min_ms: float = TTS_HEDGE_MIN_MS,
+        max_ms: float = TTS_HEDGE_MAX_MS,
+        default_ms: float = TTS_HEDGE_DEFAULT_MS,
+        min_samples: int = TTS_HEDGE_MIN_SAMPLES,
+        window: int = TTS_HEDGE_WINDOW,
+        budget_ratio: float = TTS_HEDGE_BUDGET_RATIO,
+        budget_burst: float = TTS_HEDGE_BUDGET_BURST,
+    ):
+        self._percentile = percentile
+        self._min = min_ms / 1000
+        self._max = max_ms / 1000
+        self._default = default_ms / 1000
+        self._min_samples = min_samples
+        self._window = window
+        self._budget_ratio = budget_ratio
+        self._budget_burst = budget_burst
+        self._tokens = budget_burst
+        self._engines: Dict[str, _EngineStats] = {}
+        self._decisions: Deque[Dict[str, Any]] = deque(maxlen=_DECISION_HISTORY)
+
+    def _engine(self, engine: str) -> _EngineStats:
+        stats = self._engines.get(engine)
+        if stats is None:
+            stats = self._engines[engine] = _EngineStats(self._window)
+        return stats
+
+    def threshold(self, engine: str) -> float:
+        """Seconds without audio after which a request to `engine` is hedged."""
+        values = list(self._engine(engine).ttfb)
+        if len(values) < self._min_samples:
+            return self._default
+        return min(max(percentile(values, self._percentile), self._min), self._max)
+
+    def _spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def stream(
+        self,
+        engine: str,
+        primary: AsyncIterator[Frame],
+        start_hedge: Callable[[], AsyncIterator[Frame]],
+        on_hedge_won: Optional[Callable[[], Awaitable[None]]] = None,
+        tracer=None,
+    ) -> AsyncGenerator[Frame, None]:
+        """Frames of `primary`, or of the hedge started by `start_hedge` if that one speaks first."""
+        stats = self._engine(engine)
+        stats.requests += 1
+        self._tokens = min(self._budget_burst, self._tokens + self._budget_ratio)
+        started = time.monotonic()
+        threshold = self.threshold(engine)
+        legs = [_Leg("primary", primary)]
+        legs[0].read()
+        hedge_at: Optional[float] = started + threshold
+        winner: Optional[_Leg] = None
+        try:
+            while winner is None:
+                reading = {leg.task: leg for leg in legs if leg.task}
+                if not reading:
+                    if hedge_at is None:
+                        break
+                    # The primary failed before the threshold: fail over right away
+                    hedge_at = time.monotonic()
+                done = set()
+                if reading:
+                    timeout = None if hedge_at is None else max(hedge_at - time.monotonic(), 0.0)
+                    done, _ = await asyncio.wait(reading, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    reason = "failover" if legs[0].failed else "slow"
+                    if not self._spend():
+                        stats.budget_denied += 1
+                        logger.debug(f"TTS hedge for {engine} skipped ({reason}): over budget")
+                        continue
+                    stats.hedged += 1
+                    if reason == "failover":
+                        stats.failovers += 1
+                    waited = time.monotonic() - started
+                    logger.info(f"TTS hedge for {engine}: no audio after {waited * 1000:.0f}ms ({reason}), "
+                                f"threshold {threshold * 1000:.0f}ms")
+                    if tracer:
+                        tracer.record("tts_hedge", {"engine": engine, "reason": reason, "after": waited})
+                    hedge = _Leg("hedge", start_hedge())
+                    hedge.read()
+                    legs.append(hedge)
+                    continue
+                for task in done:
+                    leg = reading[task]
+                    leg.task = None
+                    try:
+                        frame = task.result()
+                    except StopAsyncIteration:
+                        # Finished without audio and without an error (nothing to say)
+                        if not leg.failed:
+                            winner = leg
+                        continue
+                    except Exception as e:
+                        logger.warning(f"TTS hedge: {leg.name} request for {engine} raised {e}")
+                        leg.held.append(ErrorFrame(error=f"TTS generation error: {e}"))
+                        leg.failed = True
+                        continue
+                    leg.held.append(frame)
+                    if isinstance(frame, TTSAudioRawFrame):
+                        winner = leg
+                        break
+                    if isinstance(frame, ErrorFrame):
+                        leg.failed = True
+                    else:
+                        leg.read()
+
+            if winner is None:
+                # Every request failed; surface the primary's error
+                for frame in legs[0].held:
+                    yield frame
+                return
+
+            elapsed = time.monotonic() - started
+            if winner is legs[0]:
+                if winner.held and isinstance(winner.held[-1], TTSAudioRawFrame):
+                    stats.ttfb.append(elapsed)
+            else:
+                stats.hedge_wins += 1
+                if not legs[0].failed:
+                    stats.ttfb.append(elapsed)
+            if len(legs) > 1:
+                self._decisions.append({
+                    "at": time.time(),
+                    "engine": engine,
+                    "threshold_ms": round(threshold * 1000),
+                    "winner": winner.name,
+                    "first_audio_ms": round(elapsed * 1000),
+                })
+                if tracer:
+                    tracer.record("tts_hedge_winner", {"engine": engine, "winner": winner.name, "after": elapsed})
+            for leg in legs:
+                if leg is not winner:
+                    await leg.close()
+            if winner is not legs[0] and on_hedge_won:
+                await on_hedge_won()
+            for frame in winner.held:
+                yield frame
+            async for frame in winner.frames:
+                yield frame
+        finally:
+            for leg in legs:
+                await leg.close()
+
+    def stats(self) -> Dict[str, Any]:
+        engines = {}
+        for engine, stats in self._engines.items():
+            values = list(stats.ttfb)
+            engines[engine] = {
+                "requests": stats.requests,
+                "hedged": stats.hedged,
+                "hedge_rate": round(stats.hedged / stats.requests, 3) if stats.requests else None,
+                "hedge_wins": stats.hedge_wins,
+                "failovers": stats.failovers,
+                "budget_denied": stats.budget_denied,
+                "samples": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 1) if values else None,
+                "p90_ms": round(percentile(values, 90) * 1000, 1) if values else None,
+                "threshold_ms": round(self.threshold(engine) * 1000, 1),
+            }
+        return {
+            "enabled": TTS_HEDGING,
+            "percentile": self._percentile,
+            "budget_ratio": self._budget_ratio,
+            "budget_tokens": round(self._tokens, 2),
+            "gemini_fallback": TTS_HEDGE_GEMINI_FALLBACK,
+            "engines": engines,
+            "decisions": list(self._decisions),
+        }
+
+
+_hedger: Optional[TTSHedger] = None
+
+
+def get_tts_hedger() -> TTSHedger:
+    global _hedger
+    if _hedger is None:
+        _hedger = TTSHedger()
+    return _hedger
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from importlib import resources
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams, VADState
+
+from percentiles import percentile
+
+# Chunks from all sessions are collected until the batch is full or the oldest chunk has
+# waited VAD_BATCH_MAX_WAIT_MS, then run as one ONNX call on the worker pool.
+VAD_BATCHING = os.getenv("VAD_BATCHING", "true").lower() == "true"
+VAD_BATCH_MAX_SIZE = int(os.getenv("VAD_BATCH_MAX_SIZE", "32"))
+VAD_BATCH_MAX_WAIT_MS = float(os.getenv("VAD_BATCH_MAX_WAIT_MS", "4"))
+VAD_INFERENCE_WORKERS = int(os.getenv("VAD_INFERENCE_WORKERS", "2"))
+
+# Same as pipecat's Silero analyzer: state is reset periodically to bound drift
+_MODEL_RESET_STATES_TIME = 5.0
+_STATS_WINDOW = 2000
+
+
+class _VADStream:
+    """Recurrent Silero state of one session; only one chunk per stream is ever in flight."""
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.context_size = 64 if sample_rate == 16000 else 32
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros((2, 1, 128), dtype="float32")
+        self.context = np.zeros(self.context_size, dtype="float32")
+        self.last_reset = time.time()
+
+
+class _VADJob:
+    __slots__ = ("stream", "audio", "enqueued", "future")
+
+    def __init__(self, stream: _VADStream, audio: np.ndarray, future: asyncio.Future):
+        self.stream = stream
+        self.audio = audio
+        self.enqueued = time.monotonic()
+        self.future = future
+
+
+class VADBatchScheduler:
+    """Process-wide Silero VAD inference shared by every session.
+
+    Sessions submit 32 ms chunks and await their confidence. A collector task groups
+    pending chunks into micro-batches (bounded by size and wait deadline) and runs each
+    batch as one ONNX call on a small thread pool, keeping model inference off the
+    event loop and amortizing per-call overhead across sessions.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = VAD_BATCH_MAX_SIZE,
+        max_wait_ms: float = VAD_BATCH_MAX_WAIT_MS,
+        workers: int = VAD_INFERENCE_WORKERS,
+    ):
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vad-batch")
+        self._session = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._batch_sizes = deque(maxlen=_STATS_WINDOW)
+        self._queue_waits = deque(maxlen=_STATS_WINDOW)
+        self._chunk_latencies = deque(maxlen=_STATS_WINDOW)
+        self._batches = 0
+        self._chunks = 0
+
+    def _load_model(self):
+        import onnxruntime
+
+        model_path = str(resources.files("pipecat.audio.vad.data").joinpath("silero_vad.onnx"))
+        opts = onnxruntime.SessionOptions()
+        opts.inter_op_num_threads = 1
+        opts.intra_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            model_path, providers=["CPUExecutionProvider"], sess_options=opts
+        )
+        logger.debug("Loaded shared Silero VAD model for batched inference")
+
+    def preload(self):
+        """Loads the model ahead of the first session (startup warm-up)."""
+        if self._session is None:
+            self._load_model()
+
+    async def infer(self, stream: _VADStream, audio: np.ndarray) -> float:
+        if self._collector is None or self._collector.done():
+            if self._session is None:
+                self._load_model()
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_VADJob(stream, audio, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0].enqueued + self._max_wait
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Silero needs one sample rate per call
+            by_rate: Dict[int, List[_VADJob]] = {}
+            for job in batch:
+                by_rate.setdefault(job.stream.sample_rate, []).append(job)
+            for sample_rate, jobs in by_rate.items():
+                asyncio.create_task(self._dispatch(loop, sample_rate, jobs))
+
+    async def _dispatch(self, loop: asyncio.AbstractEventLoop, sample_rate: int, jobs: List[_VADJob]):
+        dispatched = time.monotonic()
+        try:
+            confidences = await loop.run_in_executor(self._executor, self._run_batch, sample_rate, jobs)
+        except Exception as e:
+            logger.error(f"Batched VAD inference failed: {e}")
+            confidences = [0.0] * len(jobs)
+
+        done = time.monotonic()
+        self._batches += 1
+        self._chunks += len(jobs)
+        self._batch_sizes.append(len(jobs))
+        for job, confidence in zip(jobs, confidences):
+            self._queue_waits.append(dispatched - job.enqueued)
+            self._chunk_latencies.append(done - job.enqueued)
+            if not job.future.done():
+                job.future.set_result(confidence)
+
+    def _run_batch(self, sample_rate: int, jobs: List[_VADJob]) -> List[float]:
+        x = np.stack([np.concatenate((job.stream.context, job.audio)) for job in jobs])
+        state = np.concatenate([job.stream.state for job in jobs], axis=1)
+        out, new_state = self._session.run(
+            None, {"input": x, "state": state, "sr": np.array(sample_rate, dtype="int64")}
+        )
+        for i, job in enumerate(jobs):
+            job.stream.state = new_state[:, i:i + 1, :]
+            job.stream.context = x[i, -job.stream.context_size:]
+        return [float(out[i][0]) for i in range(len(jobs))]
+
+    def stats(self) -> Dict[str, Any]:
+        waits = list(self._queue_waits)
+        latencies = list(self._chunk_latencies)
+        sizes = list(self._batch_sizes)
+        return {
+            "batches": self._batches,
+            "chunks": self._chunks,
+            "batch_size_mean": sum(sizes) / len(sizes) if sizes else None,
+            "batch_size_max": max(sizes) if sizes else None,
+            "queue_wait_p50_ms": _ms(percentile(waits, 50)),
+            "queue_wait_p95_ms": _ms(percentile(waits, 95)),
+            "chunk_latency_p50_ms": _ms(percentile(latencies, 50)),
+            "chunk_latency_p95_ms": _ms(percentile(latencies, 95)),
+            "chunk_latency_p99_ms": _ms(percentile(latencies, 99)),
+        }
+
+    def shutdown(self):
+        if self._collector:
+            self._collector.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+_scheduler: Optional[VADBatchScheduler] = None
+
+
+def get_vad_scheduler() -> VADBatchScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = VADBatchScheduler()
+    return _scheduler
+
+
+def vad_scheduler_stats() -> Dict[str, Any]:
+    return _scheduler.stats() if _scheduler else {"batches": 0, "chunks": 0}
+
+
+def shutdown_vad_scheduler():
+    global _scheduler
+    if _scheduler:
+        _scheduler.shutdown()
+        _scheduler = None
+
+
+class BatchedSileroVADAnalyzer(VADAnalyzer):
+    """Silero VAD analyzer whose model inference runs in the shared batch scheduler.
+
+    Confidences for the complete chunks in a buffer are fetched from the scheduler
+    first; the base class state machine then consumes them through `voice_confidence`.
+    """
+
+    def __init__(self, *, sample_rate: Optional[int] = None, params: Optional[VADParams] = None):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self._stream: Optional[_VADStream] = None
+        self._confidences: deque = deque()
+
+    def set_sample_rate(self, sample_rate: int):
+        if sample_rate != 16000 and sample_rate != 8000:
+            raise ValueError(
+                f"Silero VAD sample rate needs to be 16000 or 8000 (sample rate: {sample_rate})"
+            )
+        super().set_sample_rate(sample_rate)
+        self._stream = _VADStream(self.sample_rate)
+
+    def num_frames_required(self) -> int:
+        return 512 if self.sample_rate == 16000 else 256
+
+    def voice_confidence(self, buffer) -> float:
+        return self._confidences.popleft() if self._confidences else 0.0
+
+    async def analyze_audio(self, buffer: bytes) -> VADState:
+        pending = self._vad_buffer + buffer
+        num_required_bytes = self._vad_frames_num_bytes
+        scheduler = get_vad_scheduler()
+        for offset in range(0, len(pending) - num_required_bytes + 1, num_required_bytes):
+            chunk = np.frombuffer(pending[offset:offset + num_required_bytes], np.int16)
+            self._confidences.append(await scheduler.infer(self._stream, chunk.astype(np.float32) / 32768.0))
+
+        if time.time() - self._stream.last_reset >= _MODEL_RESET_STATES_TIME:
+            self._stream.reset()
+        # The state machine computes loudness per chunk, so it stays off the loop as well
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_analyzer, buffer)
+
+
+def create_vad_analyzer() -> VADAnalyzer:
+    """Batched analyzer when VAD_BATCHING is on (default), otherwise pipecat's per-session one."""
+    if VAD_BATCHING:
+        return BatchedSileroVADAnalyzer()
+    from pipecat.audio.vad.silero import SileroVADAnalyzer
+
+    return SileroVADAnalyzer()